@@ -1,12 +1,14 @@
 import sys
 import os
+import time
 import matplotlib.pyplot as plt
 import numpy as np
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QLabel, QLineEdit,
     QPushButton, QGridLayout, QMessageBox, QFileDialog,
-    QComboBox
+    QComboBox, QPlainTextEdit
 )
+from PyQt5.QtCore import QProcess, QThread, QTimer
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.figure import Figure
 
@@ -14,7 +16,9 @@ from matplotlib.figure import Figure
 root_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '../..'))  # two levels up
 sys.path.append(root_dir)
 from Justin_Work.ray import Write_RAY, Read_RAY
+from Justin_Work.raytrace import Trace_RAY, bellhop_available
 from Justin_Work.tl import Write_TL, Read_TL
+from Justin_Work.run_cache import Run_Cache
 from pyat.pyat.readwrite import *
 from Justin_Work.bathymetry import *
 
@@ -26,9 +30,45 @@ class Bathy_Canvas(FigureCanvas):
     
 
     def update_plot(self, x, y):
-        self.plot_canvas.ax.clear()
-        self.plot_canvas.ax.plot(x, y)
-        self.plot_canvas.draw()
+        self.fig.clear()
+        self.ax = self.fig.add_subplot(111)
+        self.ax.plot(x, y)
+        self.draw()
+
+
+    # Draws a finished TL run (Read_TL) into the canvas
+    def show_tl(self, reader, pressure, freq):
+        self.fig.clear()
+        self.ax = self.fig.add_subplot(111)
+        im = reader.plot_frame(self.ax, pressure, freq)
+        self.fig.colorbar(im, ax=self.ax, label="Relative TL (dB)")
+        self.draw()
+
+
+    # Draws a finished ray/eigenray run (Read_RAY) into the canvas
+    def show_rays(self, reader):
+        self.fig.clear()
+        axs = self.fig.subplots(1, 2, sharey=True, gridspec_kw={'width_ratios': [3, 1]})
+        self.ax = axs[0]
+        reader.plot_ray_profile(axs=axs)
+        self.draw()
+
+
+# In-process ray trace (Trace_RAY) on a worker thread, so the GUI keeps running while it traces.
+# The result (or the exception) is left on the thread and picked up when it emits finished.
+class Trace_Worker(QThread):
+    def __init__(self, config, parent=None):
+        super().__init__(parent)
+        self.config = config
+        self.rays = None
+        self.error = None
+
+
+    def run(self):
+        try:
+            self.rays = Trace_RAY(self.config).run()
+        except Exception as e:
+            self.error = e
 
 
 # UI Class
@@ -37,6 +77,16 @@ class TLViewerApp(QWidget):
         super().__init__()
         self.setWindowTitle("Transmission Loss App")
         self.setGeometry(100, 100, 1600, 800)
+        # Identical configurations are served from here instead of re-running BELLHOP
+        self.run_cache = Run_Cache(os.path.join(os.path.dirname(os.path.abspath(__file__)), "run_cache"))
+        # Background BELLHOP runs: one QProcess (or in-process trace) at a time, further runs wait in the queue
+        self.run_queue = []
+        self.process = None
+        self.tracer = None
+        self.current_job = None
+        self.cancelled = False
+        self.prt_timer = QTimer(self)
+        self.prt_timer.timeout.connect(self.poll_prt)
         self.setup_ui()
 
 
@@ -423,6 +473,21 @@ class TLViewerApp(QWidget):
         run_button = QPushButton("Run")
         run_button.clicked.connect(self.run)
         self.layout.addWidget(run_button, len(self.fields), 4, 1, 2)
+
+        # Cancel Button (stops the running trace, queued runs continue)
+        cancel_button = QPushButton("Cancel")
+        cancel_button.clicked.connect(self.cancel_run)
+        self.layout.addWidget(cancel_button, len(self.fields), 6, 1, 2)
+        self.status_label = QLabel("Idle")
+        self.layout.addWidget(self.status_label, len(self.fields), 8, 1, 8)
+
+        # Results canvas and BELLHOP progress log
+        self.plot_canvas = Bathy_Canvas(self, width=8, height=6, dpi=100)
+        self.layout.addWidget(self.plot_canvas, 0, 6, 14, 10)
+        self.progress_log = QPlainTextEdit()
+        self.progress_log.setReadOnly(True)
+        self.progress_log.setMaximumBlockCount(2000)
+        self.layout.addWidget(self.progress_log, 14, 6, 10, 10)
         self.setLayout(self.layout)
 
 
@@ -746,14 +811,7 @@ class TLViewerApp(QWidget):
                                     opt4=None,
                                     pair='L')
                 
-                self.close()
-                # Write the .env, .bty, and .ati files
-                ray_shot.write_files()
-                
-                # Run Bellhop
-                os.system(bellhop_executable + " -2D " + data_dir + filename)
-
-                # Plot the results
+                # Results reader, used once the run finishes
                 ray_shot_plot = Read_RAY(directory=data_dir, 
                                         output_directory = save_dir,
                                         ray_file=filename, 
@@ -775,10 +833,16 @@ class TLViewerApp(QWidget):
                                                     float(surface_compressional_speed),
                                                     float(surface_shear_speed),
                                                     float(surface_density),
-                                                    float(surface_attenuation)])
-                    
-                ray_shot_plot.plot_ray_profile()
-                plt.show()
+                                                    float(surface_attenuation)],
+                                        surface_type=sspopt2,
+                                        bottom_type=bottom_type)
+
+                self.queue_run({"kind": "ray",
+                                "config": ray_shot,
+                                "executable": bellhop_executable,
+                                "base_path": data_dir + filename,
+                                "reader": ray_shot_plot,
+                                "save_path": save_dir + filename + ".png"})
             
             elif ray_compute_type[0] == 'C':
                 tl_shot = Write_TL(dir=data_dir, 
@@ -823,27 +887,186 @@ class TLViewerApp(QWidget):
                                 opt4=None,
                                 pair='L')
                 
-                self.close()
-                # Write the .env, .bty, and .ati files
-                tl_shot.write_files()
-                
-                # Run Bellhop
-                os.system(bellhop_executable + " -2D " + data_dir + filename)
-
-                # Plot the results
+                # Results reader, used once the run finishes
                 tl_shot_plot = Read_TL(directory=data_dir, 
                                        output_directory = save_dir,
                                        tl_file=filename, 
                                        freqs=[int(float(freq))],
                                        bath_ranges=bath_ranges)
-                    
-                pressure = tl_shot_plot.read_shd(freq=int(float(freq)))
-                tl_shot_plot.plot_tl(pressure)
-                plt.show()
+
+                self.queue_run({"kind": "tl",
+                                "config": tl_shot,
+                                "executable": bellhop_executable,
+                                "base_path": data_dir + filename,
+                                "reader": tl_shot_plot,
+                                "freq": int(float(freq)),
+                                "save_path": save_dir + filename + ".png"})
         except:
             QMessageBox.critical(self, "Error", "An error occurred while running the simulation. Please check your inputs and try again.")
 
 
+    # Queues a configuration. Its input files are written when it reaches the front of the queue, so queued
+    # jobs that share a filename never overwrite each other's inputs.
+    # Ray runs are traced in-process (on a Trace_Worker thread) when the BELLHOP executable cannot run on this machine.
+    def queue_run(self, job):
+        job["in_process"] = job["kind"] == "ray" and not bellhop_available(job["executable"])
+        self.run_queue.append(job)
+        self.progress_log.appendPlainText(f"{job['config'].filename}: queued ({len(self.run_queue)} waiting)")
+        self.start_next_run()
+
+
+    # Starts the next queued job: writes its input files, then serves it from the run cache or starts BELLHOP
+    def start_next_run(self):
+        while self.process is None and self.tracer is None and self.run_queue:
+            job = self.run_queue.pop(0)
+            if job["in_process"]:
+                self.start_trace(job)
+                continue
+            try:
+                job["config"].write_files()
+                job["key"] = self.run_cache.key(job["config"], job["executable"])
+            except Exception as e:
+                self.progress_log.appendPlainText(f"{job['config'].filename}: could not write inputs ({e})")
+                continue
+            if self.run_cache.fetch(job["key"], job["base_path"]) is not None:
+                self.progress_log.appendPlainText(f"{job['config'].filename}: loaded from run cache")
+                try:
+                    self.show_result(job)
+                except Exception as e:
+                    QMessageBox.critical(self, "Error", f"Failed to plot results: {e}")
+                continue
+
+            self.current_job = job
+            self.cancelled = False
+            self.prt_pos = 0
+            job["run_start"] = time.time()
+
+            self.process = QProcess(self)
+            self.process.setProcessChannelMode(QProcess.MergedChannels)
+            self.process.setWorkingDirectory(os.path.dirname(job["base_path"]) or ".")
+            self.process.readyReadStandardOutput.connect(self.read_progress)
+            self.process.finished.connect(self.run_finished)
+            self.process.errorOccurred.connect(self.run_error)
+            self.process.start(job["executable"], ["-2D", job["base_path"]])
+            self.prt_timer.start(500)
+            self.status_label.setText(f"Running {job['config'].filename} ({len(self.run_queue)} queued)")
+
+        if self.process is None and self.tracer is None:
+            self.status_label.setText("Idle")
+
+
+    def start_trace(self, job):
+        self.current_job = job
+        self.cancelled = False
+        self.progress_log.appendPlainText(f"{job['config'].filename}: BELLHOP unavailable, tracing in-process")
+        self.tracer = Trace_Worker(job["config"], self)
+        self.tracer.finished.connect(self.trace_finished)
+        self.tracer.start()
+        self.status_label.setText(f"Tracing {job['config'].filename} ({len(self.run_queue)} queued)")
+
+
+    def trace_finished(self):
+        tracer = self.tracer
+        job = self.current_job
+        tracer.deleteLater()
+        self.tracer = None
+        self.current_job = None
+
+        if self.cancelled:
+            self.progress_log.appendPlainText(f"{job['config'].filename}: cancelled")
+        elif tracer.error is not None:
+            self.progress_log.appendPlainText(f"{job['config'].filename}: in-process trace failed ({tracer.error})")
+        else:
+            self.progress_log.appendPlainText(f"{job['config'].filename}: finished")
+            try:
+                job["reader"].use_traced_rays(*tracer.rays)
+                self.show_result(job)
+            except Exception as e:
+                QMessageBox.critical(self, "Error", f"Failed to plot results: {e}")
+        self.start_next_run()
+
+
+    # A process that fails to start never emits finished, so it is cleared here and the queue moves on
+    # (crashes and kills also report here, but are handled by run_finished)
+    def run_error(self, error):
+        if error != QProcess.FailedToStart or self.process is None:
+            return
+        self.prt_timer.stop()
+        job = self.current_job
+        self.progress_log.appendPlainText(f"{job['config'].filename}: BELLHOP failed to start "
+                                          f"({self.process.errorString()})")
+        self.process.deleteLater()
+        self.process = None
+        self.current_job = None
+        self.start_next_run()
+
+
+    # BELLHOP stdout
+    def read_progress(self):
+        text = bytes(self.process.readAllStandardOutput()).decode(errors='ignore').rstrip()
+        if text:
+            self.progress_log.appendPlainText(text)
+
+
+    # New lines of the .prt file written by the running trace
+    def poll_prt(self):
+        if self.current_job is None:
+            return
+        prt_path = self.current_job["base_path"] + ".prt"
+        if not os.path.exists(prt_path) or os.path.getsize(prt_path) <= self.prt_pos:
+            return
+        with open(prt_path, 'r', errors='ignore') as f:
+            f.seek(self.prt_pos)
+            text = f.read()
+            self.prt_pos = f.tell()
+        if text.strip():
+            self.progress_log.appendPlainText(text.rstrip())
+
+
+    def run_finished(self, exit_code, exit_status):
+        self.prt_timer.stop()
+        self.poll_prt()
+        job = self.current_job
+        self.process.deleteLater()
+        self.process = None
+        self.current_job = None
+
+        if self.cancelled:
+            self.progress_log.appendPlainText(f"{job['config'].filename}: cancelled")
+        elif exit_status == QProcess.NormalExit and exit_code == 0:
+            self.run_cache.store(job["key"], job["base_path"], since=job["run_start"])
+            self.progress_log.appendPlainText(f"{job['config'].filename}: finished")
+            try:
+                self.show_result(job)
+            except Exception as e:
+                QMessageBox.critical(self, "Error", f"Failed to plot results: {e}")
+        else:
+            self.progress_log.appendPlainText(f"{job['config'].filename}: BELLHOP exited with code {exit_code}")
+        self.start_next_run()
+
+
+    # A running in-process trace cannot be interrupted; it is left to finish and its result is dropped
+    def cancel_run(self):
+        if self.process is not None:
+            self.cancelled = True
+            self.process.kill()
+        elif self.tracer is not None:
+            self.cancelled = True
+            self.progress_log.appendPlainText(f"{self.current_job['config'].filename}: cancelling, the trace result will be discarded")
+
+
+    def show_result(self, job):
+        reader = job["reader"]
+        if job["kind"] == "tl":
+            # Copy out of the memory map so a later run can overwrite the .shd file
+            pressure = np.array(reader.read_shd(freq=job["freq"]))
+            self.plot_canvas.show_tl(reader, pressure, job["freq"])
+            reader.shd_files.clear()
+        else:
+            self.plot_canvas.show_rays(reader)
+        self.plot_canvas.fig.savefig(job["save_path"], bbox_inches='tight')
+
+
 if __name__ == "__main__":
     app = QApplication(sys.argv)
     window = TLViewerApp()
@@ -0,0 +1,112 @@
+import os
+import sys
+import numpy as np
+import matplotlib.pyplot as plt
+import scipy.io as io
+
+# Add the root directory to sys.path
+root_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))  # one level up
+sys.path.append(root_dir)
+from Justin_Work.tl import Write_TL, Read_TL
+from Justin_Work.caas import read_caas_log, Array_RUN
+
+# Main Data Directory and Save File Name
+track_dir = "/Users/justindiamond/Documents/Documents/UW-APL/Research/ARMS/Justin_Work/Data/"
+directory = "/Users/justindiamond/Documents/Documents/UW-APL/Research/ARMS/Justin_Work/Data/arms_caas/"
+output_directory = "/Users/justindiamond/Documents/Documents/UW-APL/Research/ARMS/Justin_Work/Output/"
+arms_save_file = "arms_1_tl"
+
+# Trackline Information
+track_info = io.loadmat(os.path.join(track_dir, "track_info.mat"))
+
+# Bathymetry (.bty file info)
+bath_ranges = np.squeeze(np.array(track_info["distances"]), axis=0) # Meters
+bath_depths = np.squeeze(np.array(track_info["profile"]), axis=0)
+
+# Sound Speed Profile (.ssp file info)
+ssp_data = io.loadmat(os.path.join(track_dir, "ARMS_firstDay_CTD_info.mat"))
+ssp_ = np.squeeze(np.array(ssp_data["Sound_velocity"]), axis=1) # Meters per second
+ssp_depths_ = np.squeeze(np.array(ssp_data["Depth"]), axis=1) # Meters per second
+
+# Fix SSP and Depths for Max Bathymetry Depth
+ssp = np.append(ssp_, 1500.0)
+ssp_depths = np.append(ssp_depths_, 200.0)
+
+# Environmental Information (.env file info)
+freq = 10500.0   # Hz
+nmedia = 1   # Number of media layers (water column SSP)
+sspopt = ["C",  # S: Cubic Spline Interpolation, C: C-linear interpolation, N: N2-line Interpolation, A: Analytic Interpolation, Q: Quadratic Approximation
+          "V",  # V: Vacuum above surface (SURFACE-LINE not required), R: Perfectly rigid media above surface, A: Acoustic half-space, F: Read a list of reflection coefficients from *.irc file
+          "W",  # F: attenuation corresponds to (dB/m)kHz, L: attenuation corresponds to parameter loss, M: attenuation corresponds to dB/m, N: attenuation corresponds to Nepers/m, Q: attenuation corresponds to a Q-factor, W: attenuation corresponds to dB/wavelength
+          " ",  # T: Opptional parameter for Thorpe volume attenuation
+          " "]  # *: Use if including an *.ati file for surface shape
+bottom_type = ["A",  # V: Vacuum below water column, R: rigid below water column, A: acoustic half-space below water column (need BOTTOM-LINE), F: read list of reflection coefficients from *.brc file
+               "*"]  # *: include if wanting to use a *.bty file
+roughness = 0.0   # Roughness
+bottom_opt = [max(bath_depths),  # Bottom depth (m)
+              1600.0,            # Compressional Speed (m/s)
+              0.0,               # Shear Speed (m/s)
+              1.8,               # Density (g/cm^3)
+              0.0]               # Bottom Attenuation (units specified by sspopt(3))
+nsd = 1   # NSD (Number of source depths)
+sd = [20.0]   # Source depth(s) (Meters)
+nrd = 201   # NRD (number of receiver depths)
+rd = [0.0, 200.0]   # Receiver depths (Meters)
+nrr = 501   # NR (number of receiver ranges)
+rr = [0.0, max(bath_ranges)]   # Receiver ranges (km)
+ray_compute = ["C",  # A: Write amplitude and travel times, E: Write Eigenray coordinates, R: Write ray coordinates, C: Write coherent acoustic pressure, I: Write incoherent acoustic pressure, S: Write semi-coherent acoustic pressure
+               "",  # G: Use geometric beams (default), C: Use cartesian beams, R: Use ray-centered beams, B: Use Gaussian beam bundles
+               "",  # ' ': Do not use beam shift effects (defualt), S: Include beam shift effects, *: Use source beam pattern file
+               "",  # R: Point source in cylindrical coordinates (default), X: line source in Cartesian coordinates
+               ""]  # R: Rectiliniear receiver grid, I: Irregular grid
+num_beams = 0   # Number of beams (0: chosen by BELLHOP)
+launch_angles = [-89.0, 89.0]   # Beam launch angles
+step_size = 0.0   # Step size (meters, 0: chosen by BELLHOP)
+max_depth = bottom_opt[0]+5   # Max depth (Meters)
+max_range = max(bath_ranges)+1  # Max range (Kilometers)
+
+arms_1_tl = Write_TL(dir=directory, 
+                      filename=arms_save_file, 
+                      ssp_depths=ssp_depths,
+                      ssp=ssp,
+                      bath_ranges=bath_ranges,
+                      bath_depths=bath_depths,
+                      freq=freq,
+                      nmedia=nmedia,
+                      sspopt=sspopt,
+                      bottom_type=bottom_type,
+                      roughness=roughness,
+                      bottom_opt=bottom_opt,
+                      nsd=nsd,
+                      sd=sd,
+                      nrd=nrd,
+                      rd=rd,
+                      nrr=nrr, 
+                      rr=rr,
+                      ray_compute=ray_compute,
+                      num_beams=num_beams,
+                      launch_angles=launch_angles,
+                      step_size=step_size,
+                      max_depth=max_depth,
+                      max_range=max_range)
+
+# CAAS array geometry (channel depths in meters)
+caas_log = read_caas_log(os.path.join(track_dir, "CAAS_log_file_01_24_2020.txt"))
+
+# Every channel in one BELLHOP run, split back out per channel
+array_run = Array_RUN(base=arms_1_tl,
+                      channels=caas_log["channels"],
+                      bellhop_executable="/Users/justindiamond/Documents/Documents/UW-APL/Research/ARMS/bellhopcuda/bin/bellhopcxx")
+array_run.run()
+channel_pressure = array_run.split()
+
+fig, ax = plt.subplots(figsize=(10, 5))
+ranges = np.linspace(rr[0], rr[1], nrr)
+for name, p in channel_pressure.items():
+    with np.errstate(divide='ignore'):
+        ax.plot(ranges, -20 * np.log10(np.abs(p)), label=name)
+ax.set_xlabel("Range (km)")
+ax.set_ylabel("TL (dB)")
+ax.invert_yaxis()
+ax.legend(ncol=2)
+plt.show()
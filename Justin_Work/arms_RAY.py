@@ -8,6 +8,7 @@ import scipy.io as io
 root_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))  # one level up
 sys.path.append(root_dir)
 from Justin_Work.ray import Write_RAY, Read_RAY
+from Justin_Work.raytrace import Trace_RAY, bellhop_available
 
 # Main Data Directory and Save File Name
 track_dir = "/Users/justindiamond/Documents/Documents/UW-APL/Research/ARMS/Justin_Work/Data/"
@@ -115,8 +116,12 @@ shot_1_ray = Write_RAY(dir=directory,
 
 shot_1_ray.write_files()
 
-# Run BELLHOP
-os.system("/Users/justindiamond/Documents/Documents/UW-APL/Research/ARMS/bellhopcuda/bin/bellhopcxx -2D /Users/justindiamond/Documents/Documents/UW-APL/Research/ARMS/Justin_Work/Data/arms_ray/arms_1_ray")
+# Run BELLHOP (in-process NumPy tracer when the executable is missing or built for another platform)
+bellhop_executable = "/Users/justindiamond/Documents/Documents/UW-APL/Research/ARMS/bellhopcuda/bin/bellhopcxx"
+if bellhop_available(bellhop_executable):
+    os.system(f"{bellhop_executable} -2D {directory}{arms_save_file}")
+else:
+    Trace_RAY(shot_1_ray).write_ray_file()
 
 shot_1_ray_plot = Read_RAY(directory=directory, 
                            output_directory = output_directory,
@@ -131,7 +136,9 @@ shot_1_ray_plot = Read_RAY(directory=directory,
                            r_range=rr[0],
                            precision=precision,
                            bottom_opt=bottom_opt,
-                           surface_opt=surface_opt)
+                           surface_opt=surface_opt,
+                           surface_type=sspopt[1],
+                           bottom_type=bottom_type[0])
 
 shot_1_ray_plot.plot_ray_profile()
 plt.show()
\ No newline at end of file
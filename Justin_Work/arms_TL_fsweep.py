@@ -3,13 +3,13 @@ import sys
 import numpy as np
 import matplotlib.pyplot as plt
 import scipy.io as io
-import struct
 
 # Add the root directory to sys.path
 root_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))  # one level up
 sys.path.append(root_dir)
 from Justin_Work.tl import Write_TL, Read_TL
-from pyat.pyat.readwrite import *
+from Justin_Work.sweep import Sweep_TL, Adaptive_Sweep_TL
+from Justin_Work.shd import write_sweep_store
 
 # Main Data Directory and Save File Name
 track_dir = "/Users/justindiamond/Documents/Documents/UW-APL/Research/ARMS/Justin_Work/Data/"
@@ -35,72 +35,97 @@ ssp_depths = np.append(ssp_depths_, 200.0)
 
 # Environmental Information (.env file info)
 freq = np.arange(2000, 11100, 100)  # Hz
+adaptive = False   # Sample the band adaptively (refining where neighbouring fields differ) instead of every freq
 nmedia = 1   # Number of media layers (water column SSP)
-sspopt = "CVW"   # C = linear, V = Variable
-bottom_type = "A*"   # A = fluid, A~ = fluid with no .bot file
+sspopt = ["C",  # S: Cubic Spline Interpolation, C: C-linear interpolation, N: N2-line Interpolation, A: Analytic Interpolation, Q: Quadratic Approximation
+          "V",  # V: Vacuum above surface (SURFACE-LINE not required), R: Perfectly rigid media above surface, A: Acoustic half-space, F: Read a list of reflection coefficients from *.irc file
+          "W",  # F: attenuation corresponds to (dB/m)kHz, L: attenuation corresponds to parameter loss, M: attenuation corresponds to dB/m, N: attenuation corresponds to Nepers/m, Q: attenuation corresponds to a Q-factor, W: attenuation corresponds to dB/wavelength
+          " ",  # T: Opptional parameter for Thorpe volume attenuation
+          " "]  # *: Use if including an *.ati file for surface shape
+bottom_type = ["A",  # V: Vacuum below water column, R: rigid below water column, A: acoustic half-space below water column (need BOTTOM-LINE), F: read list of reflection coefficients from *.brc file
+               "*"]  # *: include if wanting to use a *.bty file
 roughness = 0.0   # Roughness
-bottom_depth = max(bath_depths)   # Bottom Depth (m)
-bottom_ss = 1600.0   # Meters per Second
-bottom_alpha = 0.0   # dB per wavelength
-bottom_rho = 1.8   # Grams per Centimeter^3
-bottom_shear = 0.0   # Meters per Second
+bottom_opt = [max(bath_depths),  # Bottom depth (m)
+              1600.0,            # Compressional Speed (m/s)
+              0.0,               # Shear Speed (m/s)
+              1.8,               # Density (g/cm^3)
+              0.0]               # Bottom Attenuation (units specified by sspopt(3))
 nsd = 1   # NSD (Number of source depths)
 sd = [20.0]   # Source depth(s) (Meters)
 nrd = 501   # NRD (number of receiver depths)
 rd = [0.0, 200.0]   # Receiver depths (Meters)
 nrr = 1001   # NR (number of receiver ranges)
 rr = [0.0, max(bath_ranges)]   # Receiver ranges (km)
-ray_compute = "C"   # Compute rays (E = eigenrays)
-num_beams = 0   # Number of beams
+ray_compute = ["C",  # A: Write amplitude and travel times, E: Write Eigenray coordinates, R: Write ray coordinates, C: Write coherent acoustic pressure, I: Write incoherent acoustic pressure, S: Write semi-coherent acoustic pressure
+               "",  # G: Use geometric beams (default), C: Use cartesian beams, R: Use ray-centered beams, B: Use Gaussian beam bundles
+               "",  # ' ': Do not use beam shift effects (defualt), S: Include beam shift effects, *: Use source beam pattern file
+               "",  # R: Point source in cylindrical coordinates (default), X: line source in Cartesian coordinates
+               ""]  # R: Rectiliniear receiver grid, I: Irregular grid
+num_beams = 0   # Number of beams (0: chosen by BELLHOP)
 launch_angles = [-89.0, 89.0]   # Beam launch angles
-step_size = 0.0   # Step size (meters)
-max_depth = bottom_depth+5   # Max depth (Meters)
+step_size = 0.0   # Step size (meters, 0: chosen by BELLHOP)
+max_depth = bottom_opt[0]+5   # Max depth (Meters)
 max_range = max(bath_ranges)+1  # Max range (Kilometers)
-precision = 1
-surface_Z = 446.0
-surface_c = 343.0
-bottom_Z = bottom_ss * bottom_rho * 1000
-water_top_Z = ssp[0] * 1029
-water_bottom_Z = ssp[-1] * 1029
 
-for f in range(len(freq)):
-    print(f)
-    arms_1_tl = Write_TL(dir=directory, 
-                        filename=arms_save_file + "_" + str(freq[f]), 
-                        ssp_depths=ssp_depths,
-                        ssp=ssp,
-                        bath_ranges=bath_ranges,
-                        bath_depths=bath_depths,
-                        freq=freq[f],
-                        nmedia=nmedia,
-                        sspopt=sspopt,
-                        bottom_type=bottom_type,
-                        roughness=roughness,
-                        bottom_depth = bottom_depth,
-                        bottom_ss=bottom_ss,
-                        bottom_alpha=bottom_alpha,
-                        bottom_rho=bottom_rho,
-                        bottom_shear=bottom_shear,
-                        nsd=nsd,
-                        sd=sd,
-                        nrd=nrd,
-                        rd=rd,
-                        nrr=nrr, 
-                        rr=rr,
-                        ray_compute=ray_compute,
-                        num_beams=num_beams,
-                        launch_angles=launch_angles,
-                        step_size=step_size,
-                        max_depth=max_depth,
-                        max_range=max_range)
+arms_1_tl = Write_TL(dir=directory, 
+                    filename=arms_save_file, 
+                    ssp_depths=ssp_depths,
+                    ssp=ssp,
+                    bath_ranges=bath_ranges,
+                    bath_depths=bath_depths,
+                    freq=freq[0],
+                    nmedia=nmedia,
+                    sspopt=sspopt,
+                    bottom_type=bottom_type,
+                    roughness=roughness,
+                    bottom_opt=bottom_opt,
+                    nsd=nsd,
+                    sd=sd,
+                    nrd=nrd,
+                    rd=rd,
+                    nrr=nrr, 
+                    rr=rr,
+                    ray_compute=ray_compute,
+                    num_beams=num_beams,
+                    launch_angles=launch_angles,
+                    step_size=step_size,
+                    max_depth=max_depth,
+                    max_range=max_range)
 
-    arms_1_tl.write_files()
-    os.system("/Users/justindiamond/Documents/Documents/UW-APL/Research/ARMS/bellhopcuda/bin/bellhopcxx -2D /Users/justindiamond/Documents/Documents/UW-APL/Research/ARMS/Justin_Work/Data/arms_tl_fsweep/arms_1_tl_" + str(freq[f]))
+# Run BELLHOP for every frequency in parallel (one working directory per frequency)
+if __name__ == "__main__":
+    bellhop_executable = "/Users/justindiamond/Documents/Documents/UW-APL/Research/ARMS/bellhopcuda/bin/bellhopcxx"
+    if adaptive:
+        sweep = Adaptive_Sweep_TL(base=arms_1_tl,
+                                  f_min=freq[0],
+                                  f_max=freq[-1],
+                                  bellhop_executable=bellhop_executable,
+                                  tolerance=1.0,   # dB RMS between neighbouring band-smoothed fields
+                                  resolution=freq[1] - freq[0],
+                                  work_dir=directory,
+                                  processes=os.cpu_count())
+    else:
+        sweep = Sweep_TL(base=arms_1_tl,
+                         freqs=freq,
+                         bellhop_executable=bellhop_executable,
+                         work_dir=directory,
+                         processes=os.cpu_count())
+    manifest = sweep.run()
+    freq = sweep.freqs
+    if adaptive:
+        # The estimate compares the band-smoothed fields (TL of |p|^2 averaged over 32 x 32 cell blocks, see
+        # sweep.block_tl) that drive the refinement, not the single-cell TL, whose interference fine structure
+        # changes much faster with frequency. Intervals next to a failed frequency are left out (NaN).
+        error = sweep.interpolation_error()
+        print(f"Interpolation error estimate (band-smoothed fields): max {np.nanmax(error['error']):.2f} dB RMS")
 
-arms_1_tl_plot = Read_TL(directory=directory, 
-                         output_directory = output_directory,
-                         tl_file=arms_save_file,
-                         freqs=freq, 
-                         bath_ranges=bath_ranges)
+    # Pack every frequency into one store that Read_TL opens directly
+    write_sweep_store(directory + arms_save_file + ".sweep", manifest)
 
-arms_1_tl_plot.tl_animate()
\ No newline at end of file
+    arms_1_tl_plot = Read_TL(directory=directory, 
+                             output_directory = output_directory,
+                             tl_file=arms_save_file,
+                             freqs=freq, 
+                             bath_ranges=bath_ranges)
+
+    arms_1_tl_plot.tl_animate()
\ No newline at end of file
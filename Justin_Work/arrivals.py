@@ -0,0 +1,136 @@
+import numpy as np
+
+# One row per arrival
+ARRIVAL_DTYPE = np.dtype([('amplitude', np.float64),
+                          ('phase', np.float64),        # degrees
+                          ('delay', np.float64),        # seconds (real part of the complex delay)
+                          ('delay_imag', np.float64),
+                          ('src_angle', np.float64),    # degrees
+                          ('rcv_angle', np.float64),    # degrees
+                          ('n_top', np.int32),          # surface bounces
+                          ('n_bot', np.int32),          # bottom bounces
+                          ('isz', np.int32),
+                          ('irz', np.int32),
+                          ('irr', np.int32)])
+ARRIVAL_COLUMNS = 8
+
+
+class Read_ARR:
+    def __init__(self,
+                 directory=None,
+                 arr_file=None):
+
+        self.dir = directory
+        self.arr_file = arr_file
+        self.arr_file_path = self.dir + self.arr_file + ".arr"
+
+
+    # Parses an ASCII BELLHOP arrivals file with one bulk numeric read and one vectorized pass over its line layout.
+    # Returns (arrivals, offsets): a structured ARRIVAL_DTYPE array and a CSR offset table with shape
+    # (Nsz, Nrz, Nrr, 2), so the arrivals at receiver (isz, irz, irr) are arrivals[start:stop].
+    # Header values (freq, sz, rz, rr) are stored on the object.
+    def read_arr_file(self, filepath=None):
+        filepath = filepath or self.arr_file_path
+        with open(filepath, 'r') as f:
+            text = f.read()
+
+        # Newer files start with a quoted '2D'/'3D' tag
+        first_line, _, rest = text.partition("\n")
+        if first_line.strip().startswith("'"):
+            text = rest
+        values = np.fromstring(text, dtype=np.float64, sep=' ')
+
+        i = 0
+        self.freq = values[i]
+        i += 1
+        axes = []
+        for _ in range(3):
+            n = int(values[i])
+            axes.append(values[i+1:i+1+n])
+            i += 1 + n
+        self.sz, self.rz, self.rr = axes
+        nsz, nrz, nrr = len(self.sz), len(self.rz), len(self.rr)
+
+        # Token count of every non-blank line, from the raw bytes. After the header, one-token lines are the
+        # MaxNArr line of each source depth and the arrival count of each receiver; every other line is one
+        # arrival row, written receiver by receiver in (isz, irz, irr) order.
+        raw = np.frombuffer(text.encode(), dtype=np.uint8)
+        blank = raw <= ord(" ")
+        token_start = np.flatnonzero(blank[:-1] & ~blank[1:]) + 1
+        if len(raw) and not blank[0]:
+            token_start = np.concatenate(([0], token_start))
+        tokens = np.bincount(np.searchsorted(np.flatnonzero(raw == ord("\n")), token_start))
+        tokens = tokens[tokens > 0]
+        first_line = np.searchsorted(np.cumsum(tokens), i, side='right')
+        if first_line == 0 or np.sum(tokens[:first_line]) != i:
+            raise ValueError(f"{filepath}: the header does not end on a line boundary.")
+        body_tokens = tokens[first_line:]
+        is_count = np.repeat(body_tokens == 1, body_tokens)
+        body = values[i:]
+
+        counts = body[is_count]
+        if counts.size != nsz * (1 + nrz * nrr):
+            raise ValueError(f"{filepath}: expected {nsz * (1 + nrz * nrr)} count lines, found {counts.size}.")
+        counts = counts.reshape(nsz, 1 + nrz * nrr)[:, 1:].astype(np.int64).reshape(nsz, nrz, nrr)
+        rows = body[~is_count]
+        total = int(counts.sum())
+        if rows.size != ARRIVAL_COLUMNS * total:
+            raise ValueError(f"{filepath}: expected {total} arrival rows of {ARRIVAL_COLUMNS} values.")
+        rows = rows.reshape(total, ARRIVAL_COLUMNS)
+
+        flat_counts = counts.ravel()
+        receiver = np.repeat(np.arange(flat_counts.size), flat_counts)
+        first_row = np.zeros(flat_counts.size + 1, dtype=np.int64)
+        first_row[1:] = np.cumsum(flat_counts)
+
+        arrivals = np.zeros(total, dtype=ARRIVAL_DTYPE)
+        for col, name in enumerate(ARRIVAL_DTYPE.names[:ARRIVAL_COLUMNS]):
+            arrivals[name] = rows[:, col]
+        arrivals['isz'], arrivals['irz'], arrivals['irr'] = np.unravel_index(receiver, counts.shape)
+
+        offsets = np.stack((first_row[:-1], first_row[1:]), axis=-1).reshape(nsz, nrz, nrr, 2)
+        self.arrivals = arrivals
+        self.offsets = offsets
+        return arrivals, offsets
+
+
+    # Per-receiver multipath statistics, computed for every receiver at once. Arrays have shape (Nsz, Nrz, Nrr):
+    # number of arrivals, arrivals within dynamic_range dB of the strongest, total power, first/strongest delay,
+    # power-weighted mean delay and RMS delay spread (s). Receivers with no arrivals get NaN delays.
+    def arrival_statistics(self, arrivals=None, offsets=None, dynamic_range=20.0):
+        arrivals = self.arrivals if arrivals is None else arrivals
+        offsets = self.offsets if offsets is None else offsets
+        shape = offsets.shape[:-1]
+        n_receivers = int(np.prod(shape))
+        receiver = np.ravel_multi_index((arrivals['isz'], arrivals['irz'], arrivals['irr']), shape)
+
+        power = arrivals['amplitude']**2
+        delay = arrivals['delay']
+        count = np.bincount(receiver, minlength=n_receivers)
+        total_power = np.bincount(receiver, weights=power, minlength=n_receivers)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean_delay = np.bincount(receiver, weights=power * delay, minlength=n_receivers) / total_power
+            second_moment = np.bincount(receiver, weights=power * delay**2, minlength=n_receivers) / total_power
+            spread = np.sqrt(np.maximum(second_moment - mean_delay**2, 0.0))
+
+        first_delay = np.full(n_receivers, np.inf)
+        np.minimum.at(first_delay, receiver, delay)
+        first_delay[count == 0] = np.nan
+
+        peak_power = np.zeros(n_receivers)
+        np.maximum.at(peak_power, receiver, power)
+        is_peak = power == peak_power[receiver]
+        strongest_delay = np.full(n_receivers, np.nan)
+        strongest_delay[receiver[is_peak]] = delay[is_peak]
+
+        significant = power >= peak_power[receiver] * 10 ** (-dynamic_range / 10)
+        n_significant = np.bincount(receiver[significant], minlength=n_receivers)
+
+        return {"n_arrivals": count.reshape(shape),
+                "n_significant": n_significant.reshape(shape),
+                "total_power": total_power.reshape(shape),
+                "first_delay": first_delay.reshape(shape),
+                "strongest_delay": strongest_delay.reshape(shape),
+                "mean_delay": mean_delay.reshape(shape),
+                "delay_spread": spread.reshape(shape)}
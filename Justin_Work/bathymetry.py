@@ -1,3 +1,5 @@
+import os
+import hashlib
 import numpy as np
 import matplotlib.pyplot as plt
 import pandas as pd
@@ -5,27 +7,79 @@ from scipy.interpolate import RegularGridInterpolator
 from matplotlib import gridspec
 import scipy.io as io
 
+# Cache of the gridded bathymetry for a spreadsheet: <spreadsheet>.cache/{bath_map,lon_range,lat_range}.npy plus
+# the SHA-256 of the spreadsheet they were built from
+def bathy_cache_dir(directory):
+    return directory + ".cache"
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def load_bathy_cache(directory, digest, mmap_mode='r'):
+    cache_dir = bathy_cache_dir(directory)
+    hash_path = os.path.join(cache_dir, "source.sha256")
+    if not os.path.exists(hash_path):
+        return None
+    with open(hash_path, 'r') as f:
+        if f.read().strip() != digest:
+            return None
+    try:
+        bath_map = np.load(os.path.join(cache_dir, "bath_map.npy"), mmap_mode=mmap_mode)
+        lon_range = np.load(os.path.join(cache_dir, "lon_range.npy"))
+        lat_range = np.load(os.path.join(cache_dir, "lat_range.npy"))
+    except (OSError, ValueError):
+        return None
+    return bath_map, lon_range, lat_range
+
+
+def save_bathy_cache(directory, digest, bath_map, lon_range, lat_range):
+    cache_dir = bathy_cache_dir(directory)
+    os.makedirs(cache_dir, exist_ok=True)
+    np.save(os.path.join(cache_dir, "bath_map.npy"), bath_map)
+    np.save(os.path.join(cache_dir, "lon_range.npy"), lon_range)
+    np.save(os.path.join(cache_dir, "lat_range.npy"), lat_range)
+    # Hash is written last, so an interrupted save is never treated as valid
+    with open(os.path.join(cache_dir, "source.sha256"), 'w') as f:
+        f.write(digest)
+
+
 # This function creates a 2D Map of Dabob Bathymetry (returns the 2D map as np.array, lon_range, and lat_range)
-def map_2D(directory="/Users/justindiamond/Documents/Documents/UW-APL/Research/ARMS/Justin_Work/Data/Collected_Dabob_Bathymetry_combined.xlsx"):
+# The grid is cached next to the spreadsheet and memory-mapped on later calls, skipping the Excel read entirely
+def map_2D(directory="/Users/justindiamond/Documents/Documents/UW-APL/Research/ARMS/Justin_Work/Data/Collected_Dabob_Bathymetry_combined.xlsx",
+           use_cache=True):
+    if use_cache:
+        digest = file_sha256(directory)
+        cached = load_bathy_cache(directory, digest)
+        if cached is not None:
+            return cached
+
     # Get Bathymetry Data
     data = pd.read_excel(directory, engine='openpyxl')
     data = data.to_numpy()
 
     # Extract lat, long, and depth
-    latitude = np.array(data[:, 0])
-    longitude = np.array(data[:, 1])
-    depth = np.array(data[:, 2])
+    latitude = np.array(data[:, 0], dtype=np.float64)
+    longitude = np.array(data[:, 1], dtype=np.float64)
+    depth = np.array(data[:, 2], dtype=np.float64)
 
     # Range of latitude and longitude values
     lat_range = np.unique(latitude)
     lon_range = np.unique(longitude)
 
+    # Grid every sample in one pass (sorted-index lookup of each sample's row and column)
     bath_map = np.zeros((len(lat_range), len(lon_range)))
+    lat_index = np.searchsorted(lat_range, latitude)
+    lon_index = np.searchsorted(lon_range, longitude)
+    bath_map[lat_index, lon_index] = depth
 
-    for l in range(len(latitude)):
-        lat_index = np.where(lat_range == latitude[l])[0]
-        lon_index = np.where(lon_range == longitude[l])[0]
-        bath_map[lat_index, lon_index] = depth[l]
+    if use_cache:
+        save_bathy_cache(directory, digest, bath_map, lon_range, lat_range)
 
     return bath_map, lon_range, lat_range
 
@@ -56,23 +110,85 @@ def plot_2D_bathy(bath_map, lon_range, lat_range, save_dir=None):
     plt.show()
 
 
+# WGS84 ellipsoid
+WGS84_A = 6378137.0
+WGS84_F = 1 / 298.257223563
+WGS84_E2 = WGS84_F * (2 - WGS84_F)
+
+# Interpolator for the most recent bathymetry grid (rebuilt only when a different grid is passed in)
+_interp_cache = {}
+
+
+def bathy_interpolator(bath_map, lon_range, lat_range):
+    cached = _interp_cache.get("grid")
+    if cached is not None and cached[0] is bath_map and cached[1] is lon_range and cached[2] is lat_range:
+        return cached[3]
+    interp = RegularGridInterpolator((lat_range, lon_range), bath_map, bounds_error=False, fill_value=np.nan)
+    # Holding references to the arrays keeps the identity check valid
+    _interp_cache["grid"] = (bath_map, lon_range, lat_range, interp)
+    return interp
+
+
+# Cumulative along-track distance (km) of lat/lon points along the last axis, on the WGS84 ellipsoid.
+# Each segment uses the meridional and prime-vertical radii of curvature at its mid-latitude, which is
+# accurate to well under a meter per segment at trackline spacings.
+def along_track_km(lats, lons):
+    lats = np.radians(lats)
+    lons = np.radians(lons)
+    mid_lat = 0.5 * (lats[..., 1:] + lats[..., :-1])
+    w = np.sqrt(1 - WGS84_E2 * np.sin(mid_lat)**2)
+    m_radius = WGS84_A * (1 - WGS84_E2) / w**3
+    n_radius = WGS84_A / w
+    dy = m_radius * np.diff(lats, axis=-1)
+    dx = n_radius * np.cos(mid_lat) * np.diff(lons, axis=-1)
+    segments = np.sqrt(dx**2 + dy**2)
+    distances = np.zeros(lats.shape)
+    distances[..., 1:] = np.cumsum(segments, axis=-1)
+    return distances / 1000
+
+
+# This function extracts many 1D bathymetry profiles at once (returns profiles and distances as (ntracks, num_points) np.arrays)
+def map_1D_batch(bath_map, lon_range, lat_range, lon_starts, lon_ends, lat_starts, lat_ends, num_points=1000):
+    interp = bathy_interpolator(bath_map, lon_range, lat_range)
+
+    # Evenly spaced points along every trackline
+    t = np.linspace(0, 1, num_points)
+    lon_starts, lon_ends = np.atleast_1d(lon_starts)[:, None], np.atleast_1d(lon_ends)[:, None]
+    lat_starts, lat_ends = np.atleast_1d(lat_starts)[:, None], np.atleast_1d(lat_ends)[:, None]
+    lons = lon_starts + (lon_ends - lon_starts) * t
+    lats = lat_starts + (lat_ends - lat_starts) * t
+
+    # One interpolation call for all tracks
+    profiles = interp(np.column_stack((lats.ravel(), lons.ravel()))).reshape(lats.shape)
+    distances = along_track_km(lats, lons)
+
+    return profiles, distances
+
+
 # This function extracts a 1D bathymetry profile from a 2D bathymetry map (returns 1D profile as np.array)
 def map_1D(bath_map, lon_range, lat_range, lon_start, lon_end, lat_start, lat_end, num_points=1000):
-    interp = RegularGridInterpolator((lat_range, lon_range), bath_map, bounds_error=False, fill_value=np.nan)
+    profiles, distances = map_1D_batch(bath_map, lon_range, lat_range,
+                                       lon_start, lon_end, lat_start, lat_end, num_points=num_points)
+    return profiles[0], distances[0]
 
-    # Generate evenly spaced points along the trackline
-    lons = np.linspace(lon_start, lon_end, num_points)
-    lats = np.linspace(lat_start, lat_end, num_points)
-    track_points = np.column_stack((lats, lons))
 
-    # Interpolate bathymetry values
-    profile = interp(track_points)
+# Lat/lon of points offset x_km east and y_km north of (lat0, lon0), using the WGS84 radii of curvature at lat0
+def offset_latlon(lat0, lon0, x_km, y_km):
+    phi = np.radians(lat0)
+    w = np.sqrt(1 - WGS84_E2 * np.sin(phi)**2)
+    m_radius = WGS84_A * (1 - WGS84_E2) / w**3
+    n_radius = WGS84_A / w
+    lats = lat0 + np.degrees(np.asarray(y_km) * 1000 / m_radius)
+    lons = lon0 + np.degrees(np.asarray(x_km) * 1000 / (n_radius * np.cos(phi)))
+    return lats, lons
 
-    # Compute cumulative distance (approximate, assuming small region)
-    distances = np.sqrt((lons - lons[0])**2 + (lats - lats[0])**2)
-    distances *= 111  # Rough conversion from degrees to km
 
-    return profile, distances
+# This function resamples the 2D map onto a local x/y grid (km) centered on (lon0, lat0) (returns depths as (ny, nx) np.array)
+def map_grid_xy(bath_map, lon_range, lat_range, lon0, lat0, x_km, y_km):
+    interp = bathy_interpolator(bath_map, lon_range, lat_range)
+    x_grid, y_grid = np.meshgrid(x_km, y_km)
+    lats, lons = offset_latlon(lat0, lon0, x_grid, y_grid)
+    return interp(np.column_stack((lats.ravel(), lons.ravel()))).reshape(x_grid.shape)
 
 
 def plot_1D_bathy(profile, distances, save_dir=None):
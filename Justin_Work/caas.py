@@ -0,0 +1,140 @@
+import os
+import sys
+import copy
+import re
+import numpy as np
+
+root_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(root_dir)
+from Justin_Work.sweep import run_bellhop
+from Justin_Work.shd import Read_SHD, depth_indices
+from Justin_Work.arrivals import Read_ARR
+
+FEET_TO_METERS = 0.3048
+# Largest distance (m) between a channel depth and the receiver depth it is read from. Receiver depths are
+# written to the .env to 0.1 m, so a channel is within 0.05 m (plus float32 rounding) of its own.
+CHANNEL_DEPTH_TOLERANCE = 0.05 + 1e-4
+ARRAY_DEPTH = re.compile(r"^(?P<time>[^,]+),\s*Actual Array Depth(?:\(feet\))?\s*,\s*(?P<depth>[-+0-9.eE]+)")
+
+
+# Parses a CAAS prologue/array log (e.g. CAAS_log_file_01_24_2020.txt).
+# Returns a dict with the recording start ("start"), the prologue fields ("System", "Planned Latitude", ...),
+# "n_channels" (as declared), "sample_rate" (Hz), "channels" and "log". Each channel is a dict with its name, sample factor, gain and
+# "depth" (m, positive down) from its "Actual Array Depth(feet)" line; "log" holds the (time, depth (m))
+# entries of the [BEGIN_LOG] section. Channels are kept in file order.
+def read_caas_log(path):
+    with open(path, 'r') as f:
+        lines = [line.strip() for line in f]
+
+    log = {"start": None, "prologue": {}, "n_channels": None, "sample_rate": None, "channels": [], "log": []}
+    section = None
+    channel = None
+    for i, line in enumerate(lines):
+        if not line:
+            continue
+        if line.startswith("["):
+            section = line.strip("[]")
+            if section == "Number of Array Channels":
+                log["n_channels"] = int(lines[i + 1])
+            continue
+
+        match = ARRAY_DEPTH.match(line)
+        if match:
+            depth = -float(match.group("depth")) * FEET_TO_METERS
+            if section == "BEGIN_LOG":
+                log["log"].append((match.group("time").strip(), depth))
+            elif channel is not None:
+                channel["time"] = match.group("time").strip()
+                channel["depth"] = depth
+            continue
+
+        if line.startswith("Channel"):
+            channel = {"channel": line[len("Channel"):].strip()}
+            log["channels"].append(channel)
+            continue
+        key, sep, value = line.partition(":")
+        if not sep:
+            continue
+        key, value = key.strip(), value.strip()
+        if section == "BEGIN_PROLOGUE" and "," in key:
+            log["start"] = line
+        elif section == "Arrays" and channel is not None and key in ("Sample Factor", "Gain Control", "Gain"):
+            channel[key.lower().replace(" ", "_")] = float(value) if key == "Gain" else value
+        elif key == "Sample Rate":
+            number, _, unit = value.partition(" ")
+            log["sample_rate"] = float(number) * {"kHz": 1e3, "MHz": 1e6}.get(unit, 1.0)
+        else:
+            log["prologue"][key] = value
+
+    if log["n_channels"] is not None and len(log["channels"]) != log["n_channels"]:
+        print(f"{path}: {log['n_channels']} channels declared, {len(log['channels'])} listed")
+    return log
+
+
+# Models every channel of the CAAS array in a single BELLHOP run.
+# The channel depths are written as an explicit receiver depth list (NRD = number of distinct depths), so
+# one run covers the whole array at every range of the base configuration; split() maps the output back
+# onto the channels. mode "C" gives pressure (.shd), "A" gives arrivals (.arr).
+class Array_RUN:
+    def __init__(self,
+                 base,                       # Write_TL configuration (bathymetry, SSP, source, ranges, freq)
+                 channels,                   # Channel dicts from read_caas_log, or {name: depth (m)}
+                 bellhop_executable,         # Path to bellhopcxx
+                 mode="C",                   # "C" coherent pressure, "A" arrivals
+                 dimension="-2D",
+                 timeout=None,
+                 cache=None):                # Optional Run_Cache
+
+        if isinstance(channels, dict):
+            channels = [{"channel": name, "depth": depth} for name, depth in channels.items()]
+        self.base = base
+        self.channels = channels
+        self.names = [channel["channel"] for channel in channels]
+        self.depths = np.array([channel["depth"] for channel in channels], dtype=np.float64)
+        self.bellhop_executable = bellhop_executable
+        self.mode = mode
+        self.dimension = dimension
+        self.timeout = timeout
+        self.cache = cache
+        self.status = None
+
+        # Distinct receiver depths as written to the .env (0.1 m)
+        self.receiver_depths = np.unique(np.round(self.depths, 1))
+
+
+    def job_config(self):
+        config = copy.copy(self.base)
+        config.nrd = len(self.receiver_depths)
+        config.rd = list(self.receiver_depths)
+        # Run type characters as written by write_env (a 5-character string or list)
+        run_type = list(self.base.ray_compute) if self.base.ray_compute is not None else [" "] * 5
+        config.ray_compute = [self.mode] + run_type[1:]
+        config.filename = self.base.filename + "_array"
+        return config
+
+
+    def run(self):
+        self.config = self.job_config()
+        self.status = run_bellhop(self.config, self.bellhop_executable, self.dimension, self.timeout, self.cache)
+        print(f"{self.config.filename}: {self.status['status']} ({len(self.names)} channels, "
+              f"{self.status['wall_time']:.1f} s)")
+        return self.status
+
+
+    # Per-channel results of the run, keyed on channel name, in the order the channels were given.
+    # "C": pressure across the receiver ranges (complex, Nrr). "A": the channel's arrivals
+    # (ARRIVAL_DTYPE array, all ranges; filter on 'irr' for one range). Raises ValueError if a channel depth is
+    # not among the output's receiver depths (to CHANNEL_DEPTH_TOLERANCE), e.g. for an output of another run.
+    def split(self, output=None, freq=None, isz=0):
+        output = output if output is not None else self.status["output"]
+        if output.endswith(".arr"):
+            reader = Read_ARR(os.path.dirname(output) + os.sep, os.path.splitext(os.path.basename(output))[0])
+            arrivals, offsets = reader.read_arr_file()
+            rows = depth_indices(reader.rz, self.depths, CHANNEL_DEPTH_TOLERANCE)
+            return {name: arrivals[offsets[isz, irz, 0, 0]:offsets[isz, irz, -1, 1]]
+                    for name, irz in zip(self.names, rows)}
+
+        shd = Read_SHD(output)
+        rows = depth_indices(shd.rz, self.depths, CHANNEL_DEPTH_TOLERANCE)
+        field = np.array(shd.pressure[shd.freq_index(freq), 0, isz][rows])
+        return dict(zip(self.names, field))
@@ -0,0 +1,135 @@
+import os
+import sys
+import copy
+import time
+import numpy as np
+
+root_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(root_dir)
+from Justin_Work.sweep import run_jobs
+from Justin_Work.shd import Read_SHD
+
+
+# Greedy near-duplicate grouping of sound speed profiles (ntimes x ndepths, one shared depth grid).
+# Profiles are visited in time order; each is compared (RMS sound speed difference, m/s) with every
+# representative kept so far and reuses the closest one if it is within tolerance, else becomes a new
+# representative. Returns (representatives: time indices of the distinct profiles,
+# assignment: representative number for every time, distance: RMS difference to that representative).
+def deduplicate_profiles(ssp, tolerance=0.1):
+    ssp = np.asarray(ssp, dtype=np.float64)
+    ntimes = ssp.shape[0]
+    kept = np.zeros_like(ssp)
+    representatives = []
+    assignment = np.zeros(ntimes, dtype=np.int64)
+    distance = np.zeros(ntimes)
+
+    for t in range(ntimes):
+        k = len(representatives)
+        if k > 0:
+            rms = np.sqrt(np.mean((kept[:k] - ssp[t])**2, axis=1))
+            nearest = int(np.argmin(rms))
+            if rms[nearest] <= tolerance:
+                assignment[t] = nearest
+                distance[t] = rms[nearest]
+                continue
+        kept[k] = ssp[t]
+        representatives.append(t)
+        assignment[t] = k
+
+    return np.array(representatives, dtype=np.int64), assignment, distance
+
+
+# TL versus time for a series of sound speed profiles (e.g. Build_SSP over a T-chain deployment).
+# Near-duplicate profiles are grouped with deduplicate_profiles, so BELLHOP only runs once per distinct
+# profile (over the process pool, like Sweep_TL); every epoch then points at the run of its representative.
+class Campaign_TL:
+    def __init__(self,
+                 base,                       # Write_TL configuration shared by every epoch (bathymetry, grid, freq)
+                 times,                      # Epoch times (datetime64), one per profile
+                 ssp_depths,                 # Numpy array of profile depths (Meters), shared by all profiles
+                 ssps,                       # Numpy array of profiles (ntimes x ndepths), (Meters/second)
+                 bellhop_executable,         # Path to bellhopcxx
+                 work_dir=None,              # Root directory for the per-profile job directories
+                 tolerance=0.1,              # RMS sound speed difference (m/s) under which a run is reused
+                 processes=None,             # Number of worker processes (defaults to all cores)
+                 dimension="-2D",
+                 timeout=None,               # Per-job timeout (seconds)
+                 cache=None):                # Optional Run_Cache shared by the workers
+
+        self.base = base
+        self.times = np.asarray(times)
+        self.ssp_depths = np.asarray(ssp_depths, dtype=np.float64)
+        self.ssps = np.atleast_2d(np.asarray(ssps, dtype=np.float64))
+        self.bellhop_executable = bellhop_executable
+        self.work_dir = work_dir if work_dir is not None else base.dir
+        self.tolerance = tolerance
+        self.processes = processes if processes is not None else os.cpu_count()
+        self.dimension = dimension
+        self.timeout = timeout
+        self.cache = cache
+        self.jobs = []
+        self.manifest = {}
+        self.deduplicate()
+
+
+    def deduplicate(self):
+        self.representatives, self.assignment, self.distance = deduplicate_profiles(self.ssps, self.tolerance)
+        print(f"{len(self.times)} profiles -> {len(self.representatives)} distinct "
+              f"(RMS tolerance {self.tolerance} m/s)")
+        return self.representatives, self.assignment
+
+
+    # Configuration for distinct profile k, written to <work_dir>/<filename>_p<k>/<filename>_p<k>.*
+    # Profiles that stop above the base profile's deepest point keep the base profile below them.
+    def job_config(self, k):
+        profile = self.ssps[self.representatives[k]]
+        base_depths = np.asarray(self.base.ssp_depth, dtype=np.float64)
+        below = base_depths > self.ssp_depths[-1]
+
+        config = copy.copy(self.base)
+        config.ssp_depth = np.concatenate((self.ssp_depths, base_depths[below]))
+        config.ssp = np.concatenate((profile, np.asarray(self.base.ssp, dtype=np.float64)[below]))
+        config.filename = f"{self.base.filename}_p{k:04d}"
+        config.dir = os.path.join(self.work_dir, config.filename)
+        return config
+
+
+    # Runs every distinct profile over the process pool and returns {profile number: .shd path}
+    def run(self):
+        configs = [self.job_config(k) for k in range(len(self.representatives))]
+        campaign_start = time.time()
+        self.jobs = run_jobs(configs, self.bellhop_executable, self.processes, self.dimension, self.timeout, self.cache)
+        for k, status in enumerate(self.jobs):
+            status["profile"] = k
+            status["time"] = self.times[self.representatives[k]]
+        self.manifest = {k: status["output"] for k, status in enumerate(self.jobs) if status["status"] in ("ok", "cached")}
+        n_cached = sum(job["status"] == "cached" for job in self.jobs)
+        print(f"Campaign finished: {len(self.manifest)}/{len(configs)} distinct profiles ok ({n_cached} from cache) "
+              f"covering {len(self.times)} epochs in {time.time() - campaign_start:.1f} s")
+        return self.manifest
+
+
+    # TL (dB, -20 log10 |p|) cube with shape (ntimes, Nrz, Nrr), float32.
+    # Each distinct run is read once; epochs are filled by indexing the distinct fields with the assignment.
+    # Epochs whose run failed are NaN. With path, the cube is written to a .npy memmap instead of held in memory.
+    def tl_cube(self, freq=None, isz=0, path=None):
+        distinct = None
+        for k, shd_path in self.manifest.items():
+            shd = Read_SHD(shd_path)
+            p = np.abs(shd.pressure[shd.freq_index(freq), 0, isz]).astype(np.float32)
+            if distinct is None:
+                distinct = np.full((len(self.representatives),) + p.shape, np.nan, dtype=np.float32)
+                self.rz, self.rr = shd.rz, shd.rr
+            with np.errstate(divide='ignore'):
+                distinct[k] = -20 * np.log10(p)
+        if distinct is None:
+            raise ValueError("No successful runs to build the TL cube from; call run() first.")
+
+        shape = (len(self.times),) + distinct.shape[1:]
+        if path is None:
+            return distinct[self.assignment]
+        cube = np.lib.format.open_memmap(path, mode='w+', dtype=np.float32, shape=shape)
+        for t0 in range(0, shape[0], 256):
+            cube[t0:t0 + 256] = distinct[self.assignment[t0:t0 + 256]]
+        cube.flush()
+        return cube
@@ -0,0 +1,150 @@
+import numpy as np
+import os
+import sys
+root_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(root_dir)
+from Justin_Work.tl import Write_TL
+from Justin_Work.shd import Read_SHD
+from scipy.ndimage import distance_transform_edt
+from Justin_Work.bathymetry import map_grid_xy
+
+
+# Radial fan of tracks from one source for the bellhopcxxnx2d / bellhopcxx3d engines.
+# Takes the same environment options as Write_TL, but bathymetry comes from the 2D map instead of one map_1D
+# profile: the 3D .bty is a rectilinear x/y grid (km) centered on the source, which the Nx2D engine samples
+# along each bearing itself. Run with the "-Nx2D" (nx2d=True) or "-3D" flag.
+class Write_FAN(Write_TL):
+    def __init__(self,
+                 bath_map=None,              # 2D bathymetry map from map_2D
+                 lon_range=None,
+                 lat_range=None,
+                 source_lon=None,
+                 source_lat=None,
+                 bearings=None,              # Numpy array of bearings (degrees counter-clockwise from east)
+                 grid_points=201,            # Points per side of the 3D bathymetry grid
+                 nx2d=True,                  # True: Nx2D run, False: full 3D run
+                 **kwargs):                  # Write_TL options (ssp, sspopt, bottom_opt, sd, rd, rr, ...)
+        super().__init__(**kwargs)
+        self.bath_map = bath_map
+        self.lon_range = lon_range
+        self.lat_range = lat_range
+        self.source_lon = source_lon
+        self.source_lat = source_lat
+        self.bearings = np.atleast_1d(np.asarray(bearings, dtype=np.float64))
+        self.grid_points = grid_points
+        self.nx2d = nx2d
+        self.extract_grid()
+
+
+    def extract_grid(self):
+        max_range = float(np.max(self.rr))
+        # Grid slightly larger than the fan so every radial stays inside the bathymetry
+        half_width = 1.05 * max_range
+        self.grid_x = np.linspace(-half_width, half_width, self.grid_points)
+        self.grid_y = np.linspace(-half_width, half_width, self.grid_points)
+        grid = map_grid_xy(self.bath_map, self.lon_range, self.lat_range,
+                           self.source_lon, self.source_lat, self.grid_x, self.grid_y)
+        # Cells outside the survey take the depth of the nearest surveyed cell (a zero depth would be land)
+        missing = np.isnan(grid)
+        if missing.all():
+            raise ValueError("The fan grid does not overlap the bathymetry map.")
+        if missing.any():
+            nearest = distance_transform_edt(missing, return_distances=False, return_indices=True)
+            grid = grid[tuple(nearest)]
+        self.grid_depths = grid
+        self.bath_depths = self.grid_depths
+        self.bath_ranges = np.linspace(0, max_range, self.grid_points)
+
+
+    def write_env(self):
+        env_path = os.path.join(self.dir, self.filename + ".env")
+        if len(self.ssp_depth) != len(self.ssp):
+            raise ValueError("Depths and speeds must have the same length.")
+
+        with open(env_path, 'w') as f:
+            f.write(f"'{self.filename}'\t\t\t! TITLE\n")
+            f.write(f"{self.freq}\t\t\t! FREQ (Hz)\n")
+            f.write(f"{self.nmedia}\t\t\t! NMEDIA\n")
+            if self.sspopt[3] == "' '":
+                f.write(f"'{self.sspopt[0]}{self.sspopt[1]}{self.sspopt[2]} {self.sspopt[4]}'\t\t\t! SSPOPT\n")
+            else:
+                f.write(f"'{self.sspopt[0]}{self.sspopt[1]}{self.sspopt[2]}{self.sspopt[3]}{self.sspopt[4]}'\t\t\t! SSPOPT\n")
+            if self.sspopt[1] == "A":
+                f.write(f"{self.surface_opt[0]:.1f}  {self.surface_opt[1]:.2f}  {self.surface_opt[2]:.1f}  {self.surface_opt[3]:.1f}  {self.surface_opt[4]:.1f} /\t\t\t! Surface depth, compressional speed, shear speed, density, and attenuation\n")
+            f.write(f"{len(self.ssp_depth)}  {min(self.ssp_depth):.1f}  {max(self.ssp_depth):.1f}\t\t\t! DEPTH of bottom (m)\n")
+            for d, s in zip(self.ssp_depth, self.ssp):
+                f.write(f"{d:.1f}  {s:.2f}  /\n")
+            f.write("\n")
+            if self.bottom_type[1] == "' '":
+                f.write(f"'{self.bottom_type[0]}' {self.roughness}\t\t\t! BOTTOM TYPE, roughness\n")
+            else:
+                f.write(f"'{self.bottom_type[0]}{self.bottom_type[1]}' {self.roughness}\t\t\t! BOTTOM TYPE, roughness\n")
+            f.write(f"{self.bottom_opt[0]:.1f}  {self.bottom_opt[1]:.2f}  {self.bottom_opt[2]:.1f}  {self.bottom_opt[3]:.1f}  {self.bottom_opt[4]:.1f} /\t\t\t! Bottom depth, compressional speed, shear speed, density, and attenuation\n")
+            f.write("\n")
+            f.write("1\t\t\t! NSX: Number of source x coordinates\n")
+            f.write("0.0 /\t\t\t! Source x (km)\n")
+            f.write("1\t\t\t! NSY: Number of source y coordinates\n")
+            f.write("0.0 /\t\t\t! Source y (km)\n")
+            f.write(f"{self.nsd}\t\t\t! NSD: Number of source depths\n")
+            f.write(" ".join(f"{d:.1f}" for d in self.sd) + " /\t\t\t! Source depth (m)\n")
+            f.write(f"{self.nrd}\t\t\t! NRD: Number of receiver depths\n")
+            f.write(" ".join(f"{d:.1f}" for d in self.rd) + " /\t\t\t! Receiver depths (m)\n")
+            f.write(f"{self.nrr}\t\t\t! NR: Number of ranges\n")
+            f.write(" ".join(f"{r:.1f}" for r in self.rr) + " /\t\t\t! Range values (km)\n")
+            f.write(f"{len(self.bearings)}\t\t\t! NTHETA: Number of bearings\n")
+            f.write(" ".join(f"{b:.2f}" for b in self.bearings) + " /\t\t\t! Bearings (degrees)\n")
+            # Sixth run-type character selects Nx2D ('2') or 3D ('3')
+            run_type = "".join(c if c else " " for c in self.ray_compute[:5]).ljust(5)
+            run_type += "2" if self.nx2d else "3"
+            f.write(f"'{run_type}'\t\t\t! Option: 'R' for ray tracing, 'C' = coherent TL, 'I' = incoherent TL, 'S' = arrivals\n")
+            f.write(f"{self.num_beams} \t\t\t! Number of beams (elevation)\n")
+            f.write(f"{self.launch_angles[0]} {self.launch_angles[1]} /\t\t\t! Launch angles (degrees)\n")
+            f.write(f"{len(self.bearings)} \t\t\t! Number of beams (bearing)\n")
+            f.write(f"{self.bearings[0]:.2f} {self.bearings[-1]:.2f} /\t\t\t! Beam bearings (degrees)\n")
+            f.write("\n")
+            f.write(f"{self.step_size:.1f} {self.grid_x[-1]:.2f} {self.grid_y[-1]:.2f} {self.max_depth:.1f}\t\t\t! Step size (m), Box x (km), Box y (km), Box depth (m)\n")
+
+        print(f".env file written: {env_path}")
+
+
+    # Rectilinear 3D bathymetry: x and y axes (km) followed by one row of depths per y
+    def write_bty(self):
+        bty_path = os.path.join(self.dir, self.filename + ".bty")
+        self.write_grid(bty_path, self.grid_depths)
+        print(f".bty file written: {bty_path}")
+
+
+    # Flat 3D altimetry on the same grid
+    def write_ati(self):
+        ati_path = os.path.join(self.dir, self.filename + ".ati")
+        self.write_grid(ati_path, np.zeros_like(self.grid_depths))
+        print(f".ati file written: {ati_path}")
+
+
+    def write_grid(self, path, depths):
+        with open(path, 'w') as f:
+            f.write("'R'\n")
+            f.write(f"{len(self.grid_x)}\n")
+            f.write(" ".join(f"{x:.4f}" for x in self.grid_x) + " /\n")
+            f.write(f"{len(self.grid_y)}\n")
+            f.write(" ".join(f"{y:.4f}" for y in self.grid_y) + " /\n")
+            np.savetxt(f, depths, fmt="%.1f")
+
+
+class Read_FAN:
+    def __init__(self,
+                 directory,
+                 fan_file):
+
+        self.dir = directory
+        self.fan_file = fan_file
+        self.shd = Read_SHD(f"{self.dir}{self.fan_file}.shd")
+        self.bearings = self.shd.theta
+        self.ranges = self.shd.rr / 1000   # km
+        self.depths = self.shd.rz
+
+
+    # Pressure for every bearing of one source depth as a (range x bearing x depth) memory-mapped view
+    def read_fan(self, freq=None, isz=0):
+        pressure = self.shd.pressure[self.shd.freq_index(freq), :, isz]   # (Ntheta, Nrz, Nrr)
+        return np.transpose(pressure, (2, 0, 1))
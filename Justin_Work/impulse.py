@@ -0,0 +1,69 @@
+import numpy as np
+import os
+import sys
+root_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(root_dir)
+
+
+# Complex transfer function (nreceivers x nfreqs) at chosen receivers across a frequency sweep.
+# reader is a Read_TL for the sweep (per-frequency .shd files, a manifest or a .sweep store). Receivers are
+# snapped to the nearest grid depth (m) and range (km); only those cells are read from each memory-mapped file.
+def sweep_transfer_function(reader, freqs, receiver_depths, receiver_ranges, isz=0):
+    freqs = np.asarray(freqs, dtype=np.float64)
+    receiver_depths = np.atleast_1d(np.asarray(receiver_depths, dtype=np.float64))
+    receiver_ranges = np.atleast_1d(np.asarray(receiver_ranges, dtype=np.float64))
+    receiver_depths, receiver_ranges = np.broadcast_arrays(receiver_depths, receiver_ranges)
+
+    first = reader.open_shd(reader.shd_path(freqs[0]))
+    irz = np.abs(first.rz[None, :] - receiver_depths[:, None]).argmin(axis=1)
+    irr = np.abs(first.rr[None, :] - 1000 * receiver_ranges[:, None]).argmin(axis=1)
+
+    # A sweep store with a receiver-major section gives every frequency of a receiver in one read
+    receiver_major = getattr(first, "receiver_major", None)
+    if receiver_major is not None:
+        ifreq = np.array([first.freq_index(f) for f in freqs])
+        return np.asarray(receiver_major[isz, irz, irr][:, ifreq]).astype(np.complex128)
+
+    H = np.zeros((len(irz), len(freqs)), dtype=np.complex128)
+    for k, freq in enumerate(freqs):
+        shd = reader.open_shd(reader.shd_path(freq))
+        field = shd.pressure[shd.freq_index(freq), 0, isz]
+        H[:, k] = field[irz, irr]
+    return H
+
+
+# Impulse responses for many receivers at once from a uniformly spaced sweep (one batched irfft).
+# The band is tapered with the window, placed at its true frequency bins and zero-padded to nfft, so the
+# sample rate is nfft * df and the responses are periodic in 1/df (10 ms for the 100 Hz sweep), so arrivals
+# appear modulo that window. BELLHOP uses exp(-i w t) time dependence, hence the conjugate before the inverse FFT.
+# source: optional source waveform sampled at the output rate; it is convolved in the frequency domain.
+# Returns (time (s), responses (nreceivers x nfft)).
+def impulse_response(H, freqs, window="hann", nfft=None, source=None, conjugate=True):
+    H = np.atleast_2d(H)
+    freqs = np.asarray(freqs, dtype=np.float64)
+    df = np.median(np.diff(freqs))
+    bins = np.rint(freqs / df).astype(int)
+    if not np.allclose(bins * df, freqs, atol=1e-6 * df):
+        raise ValueError("Sweep frequencies must lie on a uniform grid that includes 0 Hz (multiples of df).")
+
+    if nfft is None:
+        nfft = int(2 ** np.ceil(np.log2(8 * (bins[-1] + 1))))
+    if nfft // 2 + 1 <= bins[-1]:
+        raise ValueError("nfft is too small for the highest sweep frequency.")
+
+    if window == "hann":
+        taper = np.hanning(len(freqs) + 2)[1:-1]
+    elif window is None or window == "boxcar":
+        taper = np.ones(len(freqs))
+    else:
+        taper = np.asarray(window, dtype=np.float64)
+
+    spectrum = np.zeros((H.shape[0], nfft // 2 + 1), dtype=np.complex128)
+    spectrum[:, bins] = (np.conj(H) if conjugate else H) * taper
+
+    if source is not None:
+        spectrum *= np.fft.rfft(source, nfft)[None, :]
+
+    responses = np.fft.irfft(spectrum, nfft, axis=-1)
+    time = np.arange(nfft) / (nfft * df)
+    return time, responses
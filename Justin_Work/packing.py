@@ -0,0 +1,141 @@
+import os
+import sys
+import copy
+import time
+import hashlib
+import numpy as np
+
+root_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(root_dir)
+from Justin_Work.sweep import run_jobs
+from Justin_Work.shd import Read_SHD, depth_indices
+
+# Configuration attributes that a packed run is allowed to differ in (everything else must match)
+PACKED_FIELDS = ("dir", "filename", "nsd", "sd", "nrd", "rd")
+
+
+# Explicit depth list of an NSD/SD or NRD/RD pair. BELLHOP fills NRD > len(RD) entries evenly
+# between the first and last value, so the shorthand [0, 200] with 201 depths expands to 0, 1, ..., 200.
+# Depths are rounded to 0.1 m, the precision the .env is written with.
+def expand_depths(n, depths):
+    depths = np.atleast_1d(np.asarray(depths, dtype=np.float64))
+    if n is not None and n > len(depths):
+        depths = np.linspace(depths[0], depths[-1], n)
+    return np.round(depths, 1)
+
+
+# Hash of everything in a configuration except its source/receiver depths and output location
+def environment_key(config):
+    h = hashlib.sha256()
+    for name, value in sorted(vars(config).items()):
+        if name in PACKED_FIELDS:
+            continue
+        h.update(name.encode())
+        if isinstance(value, (np.ndarray, list, tuple)):
+            array = np.asarray(value)
+            h.update(str((array.dtype.kind, array.shape)).encode())
+            if array.dtype.kind in "iuf":
+                h.update(np.ascontiguousarray(array, dtype=np.float64).tobytes())
+            else:
+                h.update(repr(array.tolist()).encode())
+        else:
+            h.update(repr(value).encode())
+    return h.hexdigest()
+
+
+# (n, depths) for writing a depth list to the .env: the first/last shorthand when the depths are evenly spaced
+def depth_entry(depths):
+    if len(depths) > 2 and np.allclose(np.diff(depths), depths[1] - depths[0], atol=1e-6):
+        return len(depths), [depths[0], depths[-1]]
+    return len(depths), list(depths)
+
+
+# Packs TL jobs that share an environment and frequency into single multi-source/multi-receiver runs.
+# Each job is a Write_TL configuration; jobs whose configurations only differ in sd/nsd and rd/nrd are
+# grouped, and each group is written once with the union of their source and receiver depths and run once
+# over the process pool (like Sweep_TL). results() slices the combined .shd back into one result per job.
+class Run_Planner:
+    def __init__(self,
+                 jobs,                       # List of Write_TL configurations
+                 bellhop_executable,         # Path to bellhopcxx
+                 work_dir,                   # Root directory for the packed run directories
+                 name="packed",              # Filename prefix of the packed runs
+                 processes=None,             # Number of worker processes (defaults to all cores)
+                 dimension="-2D",
+                 timeout=None,               # Per-run timeout (seconds)
+                 cache=None):                # Optional Run_Cache shared by the workers
+
+        self.jobs = list(jobs)
+        self.bellhop_executable = bellhop_executable
+        self.work_dir = work_dir
+        self.name = name
+        self.processes = processes if processes is not None else os.cpu_count()
+        self.dimension = dimension
+        self.timeout = timeout
+        self.cache = cache
+        self.runs = []
+        self.manifest = {}
+        self.plan()
+
+
+    # Groups the jobs; self.groups[k] holds the packed configuration, its depth unions and the member jobs
+    def plan(self):
+        groups = {}
+        for j, job in enumerate(self.jobs):
+            groups.setdefault(environment_key(job), []).append(j)
+
+        self.groups = []
+        self.job_group = np.zeros(len(self.jobs), dtype=np.int64)
+        for k, members in enumerate(groups.values()):
+            source_depths = np.unique(np.concatenate([expand_depths(self.jobs[j].nsd, self.jobs[j].sd)
+                                                      for j in members]))
+            receiver_depths = np.unique(np.concatenate([expand_depths(self.jobs[j].nrd, self.jobs[j].rd)
+                                                        for j in members]))
+            config = copy.copy(self.jobs[members[0]])
+            config.nsd, config.sd = depth_entry(source_depths)
+            config.nrd, config.rd = depth_entry(receiver_depths)
+            config.filename = f"{self.name}_g{k:03d}"
+            config.dir = os.path.join(self.work_dir, config.filename)
+            self.groups.append({"config": config,
+                                "jobs": members,
+                                "sz": source_depths,
+                                "rz": receiver_depths})
+            self.job_group[members] = k
+
+        print(f"{len(self.jobs)} jobs packed into {len(self.groups)} runs")
+        return self.groups
+
+
+    # Runs every packed configuration over the process pool and returns {group: .shd path}
+    def run(self):
+        plan_start = time.time()
+        configs = [group["config"] for group in self.groups]
+        notes = [f"{len(group['jobs'])} jobs" for group in self.groups]
+        self.runs = run_jobs(configs, self.bellhop_executable, self.processes, self.dimension, self.timeout,
+                             self.cache, notes)
+        for k, status in enumerate(self.runs):
+            status["group"] = k
+        self.manifest = {k: status["output"] for k, status in enumerate(self.runs) if status["status"] in ("ok", "cached")}
+        print(f"Packed runs finished: {len(self.manifest)}/{len(self.groups)} ok in {time.time() - plan_start:.1f} s")
+        return self.manifest
+
+
+    # One result per job, in job order: {"sz", "rz", "rr", "pressure"} with pressure of shape
+    # (job sources, job receivers, Nrr) sliced out of its group's .shd, or None if that run failed.
+    # Every job depth must be in the .shd exactly (to float32 precision), else ValueError.
+    def results(self, itheta=0):
+        results = [None] * len(self.jobs)
+        for k, shd_path in self.manifest.items():
+            shd = Read_SHD(shd_path)
+            pressure = shd.pressure[0, itheta]
+            for j in self.groups[k]["jobs"]:
+                job = self.jobs[j]
+                sz = expand_depths(job.nsd, job.sd)
+                rz = expand_depths(job.nrd, job.rd)
+                isz = depth_indices(shd.sz, sz)
+                irz = depth_indices(shd.rz, rz)
+                results[j] = {"sz": sz,
+                              "rz": rz,
+                              "rr": shd.rr,
+                              "pressure": np.array(pressure[isz][:, irz])}
+        return results
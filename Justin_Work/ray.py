@@ -1,6 +1,103 @@
 import numpy as np
 import matplotlib.pyplot as plt
 import os
+import itertools
+from scipy.spatial import cKDTree
+from matplotlib.collections import LineCollection
+from matplotlib.colors import LogNorm
+
+# Binary ray cache (sidecar next to the .ray file):
+#   header: magic, source file size, source mtime (ns), number of rays, number of points
+#   offsets int64 (nrays+1), alphas float64 (nrays), bbox float32 (nrays x [rmin, rmax, zmin, zmax]),
+#   r float32 (npts), z float32 (npts)
+RAY_CACHE_MAGIC = b'ARMSRAY1'
+RAY_CACHE_HEADER = np.dtype([('magic', 'S8'), ('src_size', '<i8'), ('src_mtime', '<i8'),
+                             ('nrays', '<i8'), ('npts', '<i8')])
+
+# Most ray points plot_ray_profile draws as lines by default; larger fans are drawn as a density image
+RAY_LINES_MAX_POINTS = 1000000
+
+
+# Sub-selects rays from flat CSR arrays in one gather; returns (r, z, offsets) for just the given beams
+def gather_rays(r, z, offsets, beams):
+    beams = np.asarray(beams, dtype=np.int64)
+    counts = offsets[beams + 1] - offsets[beams]
+    new_offsets = np.zeros(len(beams) + 1, dtype=np.int64)
+    new_offsets[1:] = np.cumsum(counts)
+    src = np.repeat(offsets[beams] - new_offsets[:-1], counts) + np.arange(new_offsets[-1])
+    return r[src], z[src], new_offsets
+
+
+# Per-ray bounding boxes (nrays x [rmin, rmax, zmin, zmax]), NaN for empty rays
+def ray_bboxes(r, z, offsets):
+    bbox = np.full((len(offsets) - 1, 4), np.nan, dtype=np.float32)
+    filled = np.diff(offsets) > 0
+    if np.any(filled):
+        starts = offsets[:-1][filled]
+        bbox[filled, 0] = np.minimum.reduceat(r, starts)
+        bbox[filled, 1] = np.maximum.reduceat(r, starts)
+        bbox[filled, 2] = np.minimum.reduceat(z, starts)
+        bbox[filled, 3] = np.maximum.reduceat(z, starts)
+    return bbox
+
+
+# Plane-wave (Rayleigh) reflection coefficient of a fluid half-space for grazing angles (radians).
+# c1/rho1: water side, c2/rho2: half-space, atten in dB/wavelength. Complex, so post-critical angles give |R| = 1.
+def rayleigh_coefficient(grazing, c1, rho1, c2, rho2, atten=0.0):
+    delta = atten / (40 * np.pi * np.log10(np.e))
+    c2 = c2 / (1 + 1j * delta)
+    kz1 = np.sin(grazing) / c1
+    kz2 = np.sqrt(1 / c2**2 - (np.cos(grazing) / c1)**2 + 0j)
+    kz2 = np.where(kz2.imag < 0, -kz2, kz2)
+    return (rho2 * kz1 - rho1 * kz2) / (rho2 * kz1 + rho1 * kz2)
+
+
+# Hit-count raster of all ray segments on a (depth x range) grid of shape pixels.
+# Segments are split only where they cross range columns; each piece then adds its whole depth span within its
+# column through a difference image (+1 at the top pixel, -1 below the bottom one, cumulative sum over depth),
+# so steep segments leave no gaps and the cost stays proportional to the number of segments.
+# Returns (hits, r_edges (m), z_edges (m)).
+def ray_density(r, z, offsets, shape=(400, 800), max_subdivisions=64):
+    r = np.asarray(r, dtype=np.float32)
+    z = np.asarray(z, dtype=np.float32)
+    nz, nr = shape
+    r_edges = np.linspace(r.min(), r.max(), nr + 1) if len(r) else np.linspace(0, 1, nr + 1)
+    z_edges = np.linspace(z.min(), z.max(), nz + 1) if len(z) else np.linspace(0, 1, nz + 1)
+    pixel_r = max(r_edges[1] - r_edges[0], 1e-6)
+    pixel_z = max(z_edges[1] - z_edges[0], 1e-6)
+
+    valid = np.ones(max(len(r) - 1, 0), dtype=bool)
+    seams = offsets[1:-1] - 1
+    valid[seams[(seams >= 0) & (seams < len(valid))]] = False
+    start = np.nonzero(valid)[0]
+    r0, z0 = r[start], z[start]
+    dr = r[start + 1] - r0
+    dz = z[start + 1] - z0
+    nsub = np.clip(np.ceil(np.abs(dr) / pixel_r), 1, max_subdivisions).astype(np.int64)
+
+    if np.all(nsub == 1):
+        t0 = np.zeros(len(start), dtype=np.float32)
+        t1 = np.ones(len(start), dtype=np.float32)
+    else:
+        seg = np.repeat(np.arange(len(start)), nsub)
+        first = np.zeros(len(nsub) + 1, dtype=np.int64)
+        first[1:] = np.cumsum(nsub)
+        k = (np.arange(first[-1]) - first[seg]).astype(np.float32)
+        t0 = k / nsub[seg]
+        t1 = (k + 1) / nsub[seg]
+        r0, z0, dr, dz = r0[seg], z0[seg], dr[seg], dz[seg]
+
+    ir = np.clip(((r0 + (t0 + t1) / 2 * dr - r_edges[0]) / pixel_r).astype(np.int64), 0, nr - 1)
+    za = z0 + t0 * dz
+    zb = z0 + t1 * dz
+    lo = np.clip(((np.minimum(za, zb) - z_edges[0]) / pixel_z).astype(np.int64), 0, nz - 1)
+    hi = np.clip(((np.maximum(za, zb) - z_edges[0]) / pixel_z).astype(np.int64), 0, nz - 1)
+
+    diff = (np.bincount(lo * nr + ir, minlength=(nz + 1) * nr)
+            - np.bincount((hi + 1) * nr + ir, minlength=(nz + 1) * nr))
+    hits = np.cumsum(diff.reshape(nz + 1, nr), axis=0)[:nz]
+    return hits, r_edges, z_edges
+
 
 class Write_RAY:
     def __init__(self, 
@@ -94,21 +191,21 @@ class Write_RAY:
             f.write("\n")
             f.write(f"{self.nsd}\t\t\t! NSD: Number of source depths\n")
             for i in range(len(self.sd)):
-                if i is len(self.sd)-1:
+                if i == len(self.sd)-1:
                     f.write(f"{self.sd[i]:.1f} /\t\t\t! Source depth (m)\n")
                 else:
-                    f.write(f"{self.sd[i]:.1f} /")
+                    f.write(f"{self.sd[i]:.1f} ")
             f.write("\n")
             f.write(f"{self.nrd}\t\t\t! NRD: Number of receiver depths\n")
             for i in range(len(self.rd)):
-                if i is len(self.rd)-1:
+                if i == len(self.rd)-1:
                     f.write(f"{self.rd[i]:.1f} /\t\t\t! Receiver depths (m)\n")
                 else:
                     f.write(f"{self.rd[i]:.1f} ")
             f.write("\n")
             f.write(f"{self.nrr}\t\t\t! NR: Number of ranges\n")
             for i in range(len(self.rr)):
-                if i is len(self.rr)-1:
+                if i == len(self.rr)-1:
                     f.write(f"{self.rr[i]:.1f} /\t\t\t! Range values (km)\n")
                 else:
                     f.write(f"{self.rr[i]:.1f} ")
@@ -184,7 +281,9 @@ class Read_RAY:
                  r_range=None,
                  precision=None,
                  bottom_opt=None,
-                 surface_opt=None):
+                 surface_opt=None,
+                 surface_type=None,          # sspopt[1] of the run: V vacuum, R rigid, A acoustic half-space
+                 bottom_type=None):          # bottom_type[0] of the run: V, R or A
         
         self.dir = directory
         self.output_directory = output_directory
@@ -195,108 +294,406 @@ class Read_RAY:
         self.bath_depths = bath_depths
         self.ati_depths = ati_depths
         self.ray_file_path = self.dir + self.ray_file + ".ray"
+        self.ray_cache_path = self.ray_file_path + ".cache"
         self.s_depth = s_depth
         self.r_depth = r_depth
         self.r_range = r_range
         self.precision = precision
         self.bottom_opt = bottom_opt
         self.surface_opt = surface_opt
+        self.surface_type = surface_type
+        self.bottom_type = bottom_type
+        self.traced = False
+
+    def read_ray_header(self, f):
+        # Basic metadata
+        title = f.readline().strip()
+        frequency = float(f.readline().strip())
+        nsrc, nrd, nr = map(int, f.readline().strip().split())
+        nbeams, ncoords = map(int, f.readline().strip().split())
+        src_depth = float(f.readline().strip())
+        r_end = float(f.readline().strip())
+        coord_type = f.readline().strip()  # should be 'rz'
+        return title, frequency, nbeams
+
+
+    # Returns flat (r, z) float64 arrays for every ray, CSR style: ray i is r[offsets[i]:offsets[i+1]].
+    # With generator=True, yields (alpha, r, z) one ray at a time instead so memory stays bounded.
+    def read_ray_file(self, filepath, generator=False):
+        if generator:
+            return self.iter_ray_file(filepath)
 
-    def read_ray_file(self, filepath):
-    
         with open(filepath, 'r') as f:
-            lines = f.readlines()
+            self.read_ray_header(f)
+            body = f.read()
 
-        # Basic metadata
-        title = lines[0].strip()
-        frequency = float(lines[1].strip())
-        nsrc, nrd, nr = map(int, lines[2].strip().split())
-        nbeams, ncoords = map(int, lines[3].strip().split())
-        src_depth = float(lines[4].strip())
-        r_end = float(lines[5].strip())
-        coord_type = lines[6].strip()  # should be 'rz'
-
-        # Read ray points
-        line = 7
-        ray_data = []
+        # One bulk numeric read of everything after the header; each ray block is
+        # [alpha, npts, n_top_bounces, n_bot_bounces, r0, z0, r1, z1, ...]
+        values = np.fromstring(body, dtype=np.float64, sep=' ')
+
+        # Walk the ray blocks (one step per ray, not per point) to find where each ray's coordinates start
+        starts = []
+        counts = []
         alpha_data = []
-        while line <= len(lines)-1:
-            alpha_data.append(float(lines[line].strip()))
-            npts, ndim, _ = map(int, lines[line+1].strip().split())
-            line = line+2
-            start_line = line
-            ray = []
-            for l in lines[start_line:start_line+npts]:
-                r, z = map(float, l.strip().split())
-                ray.append((r, z))
-                line = line + 1
-            ray_data.append(ray) 
-
-        return ray_data, alpha_data
-
-
-    def plot_ray_profile(self):
-        rays, alphas = self.read_ray_file(self.ray_file_path)
-        fig, axs = plt.subplots(1, 2, figsize=(12, 6), sharey=True, gridspec_kw={'width_ratios': [3, 1]})
-        
-        for i in range(len(rays)):
-            ray = rays[i]
-            r = []
-            z = []
-            for j in range(len(ray)):
-                index = ray[j]
-                r.append(index[0] / 1000)
-                z.append(index[1])
-
-            # Plot ray
-            axs[0].plot(r,z)
-
-            # if np.abs(z[-1] - self.r_depth) <= self.precision and np.abs(r[-1] - self.r_range) <= self.precision:
-            #     if alphas[i] < 0:
-            #         up_down = -1
-            #     elif alphas[i] > 0:
-            #         up_down = 1
-                
-            #     # Get the indices where the ray bounces off the surface or bottom
-            #     sign_change = np.diff(np.sign(np.diff(z)))
-            #     p_and_t = np.where(sign_change != 0)[0]
-            #     bounce_indices = p_and_t[np.where(np.diff(p_and_t) > 1)]
-            #     bounce_indices = np.append(bounce_indices, p_and_t[-1])
-
-                # # Get the reflection coefficient
-                # R_string = ""
-                # R = 1
-                # for b in range(len(bounce_indices)):
-                #     R_string = self.R_type(R_string, up_down)
-                #     if up_down == -1:
-                #         dr = np.abs(r[bounce_indices[b]] - r[bounce_indices[b]-10])
-                #         dz = np.abs(z[bounce_indices[b]] - z[bounce_indices[b]-10])
-                #         angle = np.degrees(np.arctan(dz/dr))
-                #         sin_angle = np.sin(np.radians(angle))
-                #         surface_Z = np.array(self.surface_Z, dtype=float)
-                #         water_top_Z = np.array(self.water_top_Z, dtype=float)
-                #         R = (surface_Z * sin_angle - water_top_Z * sin_angle) / (surface_Z * sin_angle + water_top_Z * sin_angle) * R
-                #         up_down = 1
-                #     else:
-                #         dr = np.abs(r[bounce_indices[b]] - r[bounce_indices[b]-10])
-                #         dz = np.abs(z[bounce_indices[b]] - z[bounce_indices[b]-10])
-                #         angle = np.degrees(np.arctan(dz/dr))
-                #         sin_angle = np.sin(np.radians(angle))
-                #         bottom_Z = np.array(self.bottom_Z, dtype=float)
-                #         water_bottom_Z = np.array(self.water_bottom_Z, dtype=float)
-                #         R = (bottom_Z * sin_angle - water_bottom_Z * sin_angle) / (bottom_Z * sin_angle + water_bottom_Z * sin_angle) * R
-                #         up_down = -1
-                
-                # if R_string not in self.bounce:
-                #     self.bounce.append(R_string)
-                #     self.alpha.append(alphas[i])
-                #     self.R = np.append(self.R, R) 
-                #     axs[0].plot(r,z, label=R_string)
+        i = 0
+        while i < len(values):
+            npts = int(values[i+1])
+            alpha_data.append(values[i])
+            starts.append(i + 4)
+            counts.append(npts)
+            i = i + 4 + 2 * npts
+
+        counts = np.array(counts, dtype=np.int64)
+        offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(counts)
+
+        # Gather all coordinate pairs at once
+        point_ray = np.repeat(np.arange(len(counts)), counts)
+        point_idx = np.repeat(np.array(starts, dtype=np.int64), counts) + 2 * (np.arange(offsets[-1]) - offsets[point_ray])
+        r = values[point_idx]
+        z = values[point_idx + 1]
+
+        return r, z, offsets, np.array(alpha_data, dtype=np.float64)
+
+
+    def iter_ray_file(self, filepath):
+        with open(filepath, 'r') as f:
+            self.read_ray_header(f)
+            while True:
+                line = f.readline()
+                if not line.strip():
+                    if not line:
+                        return
+                    continue
+                alpha = float(line.strip())
+                npts = int(f.readline().split()[0])
+                if npts == 0:
+                    coords = np.zeros((0, 2))
+                else:
+                    coords = np.loadtxt(itertools.islice(f, npts), dtype=np.float64, ndmin=2)
+                yield alpha, coords[:, 0], coords[:, 1]
+
+
+    # Converts the .ray file into the binary sidecar (float32 coordinates, offsets, angles, bounding boxes)
+    def write_ray_cache(self, filepath=None, cache_path=None):
+        filepath = filepath or self.ray_file_path
+        cache_path = cache_path or self.ray_cache_path
+        stat = os.stat(filepath)
+        r, z, offsets, alphas = self.read_ray_file(filepath)
+
+        nrays = len(alphas)
+        bbox = ray_bboxes(r, z, offsets)
+
+        header = np.zeros(1, dtype=RAY_CACHE_HEADER)
+        header['magic'] = RAY_CACHE_MAGIC
+        header['src_size'] = stat.st_size
+        header['src_mtime'] = stat.st_mtime_ns
+        header['nrays'] = nrays
+        header['npts'] = offsets[-1]
+
+        tmp_path = cache_path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(header.tobytes())
+            f.write(offsets.astype('<i8').tobytes())
+            f.write(alphas.astype('<f8').tobytes())
+            f.write(bbox.astype('<f4').tobytes())
+            f.write(r.astype('<f4').tobytes())
+            f.write(z.astype('<f4').tobytes())
+        os.replace(tmp_path, cache_path)
+        print(f".ray cache written: {cache_path}")
+
+
+    # Memory-maps the sidecar, rebuilding it first if it is missing or the .ray file's size/mtime changed.
+    # Returns (r, z, offsets, alphas, bbox) with r/z in the .ray file's units (meters).
+    def load_ray_cache(self, filepath=None, cache_path=None):
+        if self.traced:
+            return self.ray_cache
+        filepath = filepath or self.ray_file_path
+        cache_path = cache_path or self.ray_cache_path
+        stat = os.stat(filepath)
+
+        stale = True
+        if os.path.exists(cache_path) and os.path.getsize(cache_path) >= RAY_CACHE_HEADER.itemsize:
+            header = np.fromfile(cache_path, dtype=RAY_CACHE_HEADER, count=1)[0]
+            stale = (header['magic'] != RAY_CACHE_MAGIC or
+                     header['src_size'] != stat.st_size or
+                     header['src_mtime'] != stat.st_mtime_ns)
+        if stale:
+            self.write_ray_cache(filepath, cache_path)
+            header = np.fromfile(cache_path, dtype=RAY_CACHE_HEADER, count=1)[0]
+
+        nrays = int(header['nrays'])
+        npts = int(header['npts'])
+        buf = np.memmap(cache_path, dtype=np.uint8, mode='r')
+        pos = RAY_CACHE_HEADER.itemsize
+        sections = []
+        for dtype, count in [('<i8', nrays + 1), ('<f8', nrays), ('<f4', 4 * nrays), ('<f4', npts), ('<f4', npts)]:
+            nbytes = np.dtype(dtype).itemsize * count
+            sections.append(buf[pos:pos + nbytes].view(dtype))
+            pos += nbytes
+        offsets, alphas, bbox, r, z = sections
+
+        self.ray_cache = (r, z, offsets, alphas, bbox.reshape(nrays, 4))
+        return self.ray_cache
+
+
+    # Uses rays traced in-process (Trace_RAY) instead of a .ray file; later calls skip the file and its cache
+    def use_traced_rays(self, r, z, offsets, alphas):
+        r = np.asarray(r, dtype=np.float32)
+        z = np.asarray(z, dtype=np.float32)
+        self.ray_cache = (r, z, offsets, np.asarray(alphas, dtype=np.float64), ray_bboxes(r, z, offsets))
+        self.traced = True
+        return self.ray_cache
+
+
+    # Indices of rays whose launch angle lies in angle_range (degrees) and whose bounding box overlaps the
+    # range_window (km) and depth_window (m). Only the cached index is consulted, no coordinates are read.
+    def select_rays(self, angle_range=None, range_window=None, depth_window=None):
+        _, _, _, alphas, bbox = self.load_ray_cache()
+        keep = np.ones(len(alphas), dtype=bool)
+        if angle_range is not None:
+            keep &= (alphas >= angle_range[0]) & (alphas <= angle_range[1])
+        if range_window is not None:
+            keep &= (bbox[:, 1] >= range_window[0] * 1000) & (bbox[:, 0] <= range_window[1] * 1000)
+        if depth_window is not None:
+            keep &= (bbox[:, 3] >= depth_window[0]) & (bbox[:, 2] <= depth_window[1])
+        return np.nonzero(keep)[0]
+
+
+    # Matches every ray path against many receivers in one spatial query.
+    # Ray segments are indexed by their midpoints in a KD-tree (meters in range and depth), limited to the
+    # receivers' bounding box; candidates within tolerance + half the longest segment are then checked with the
+    # exact point-to-segment distance, so a ray counts wherever it passes, not only at its last point.
+    # receiver_ranges (km) / receiver_depths (m) default to r_range / r_depth and tolerance (m) to precision.
+    # Returns the closest pass of each (receiver, beam) pair sorted by receiver, with CSR offsets per receiver.
+    def match_receivers(self, receiver_ranges=None, receiver_depths=None, tolerance=None, beams=None):
+        ray_r, ray_z, offsets, alphas, _ = self.load_ray_cache()
+        if beams is None:
+            beams = np.arange(len(alphas))
+            r, z = ray_r, ray_z
+        else:
+            beams = np.asarray(beams, dtype=np.int64)
+            r, z, offsets = gather_rays(ray_r, ray_z, offsets, beams)
+        r = np.asarray(r, dtype=np.float64)
+        z = np.asarray(z, dtype=np.float64)
+
+        receiver_ranges = self.r_range if receiver_ranges is None else receiver_ranges
+        receiver_depths = self.r_depth if receiver_depths is None else receiver_depths
+        rec_r, rec_z = np.broadcast_arrays(1000 * np.atleast_1d(np.asarray(receiver_ranges, dtype=np.float64)),
+                                           np.atleast_1d(np.asarray(receiver_depths, dtype=np.float64)))
+        tolerance = self.precision if tolerance is None else tolerance
+        nrec = len(rec_r)
+
+        # Segments k -> k+1, never across the seam between two rays
+        dr = np.diff(r)
+        dz = np.diff(z)
+        valid = np.ones(len(dr), dtype=bool)
+        seams = offsets[1:-1] - 1
+        valid[seams[(seams >= 0) & (seams < len(dr))]] = False
+        mid_r = r[:-1] + dr / 2
+        mid_z = z[:-1] + dz / 2
+        half = np.hypot(dr, dz) / 2
+        radius = tolerance + (half[valid].max() if np.any(valid) else 0.0)
+        keep = (valid & (mid_r >= rec_r.min() - radius) & (mid_r <= rec_r.max() + radius)
+                & (mid_z >= rec_z.min() - radius) & (mid_z <= rec_z.max() + radius))
+        segments = np.nonzero(keep)[0]
+
+        if len(segments):
+            tree = cKDTree(np.column_stack((mid_r[segments], mid_z[segments])))
+            hits = tree.query_ball_point(np.column_stack((rec_r, rec_z)), radius)
+        else:
+            hits = [[] for _ in range(nrec)]
+        counts = np.array([len(h) for h in hits], dtype=np.int64)
+        receiver = np.repeat(np.arange(nrec), counts)
+        seg = segments[np.fromiter(itertools.chain.from_iterable(hits), dtype=np.int64, count=int(counts.sum()))]
+
+        # Closest point on each candidate segment
+        seg_dr, seg_dz = dr[seg], dz[seg]
+        length2 = seg_dr**2 + seg_dz**2
+        with np.errstate(invalid='ignore', divide='ignore'):
+            t = ((rec_r[receiver] - r[seg]) * seg_dr + (rec_z[receiver] - z[seg]) * seg_dz) / length2
+        t = np.clip(np.nan_to_num(t), 0.0, 1.0)
+        pass_r = r[seg] + t * seg_dr
+        pass_z = z[seg] + t * seg_dz
+        distance = np.hypot(pass_r - rec_r[receiver], pass_z - rec_z[receiver])
+
+        inside = distance <= tolerance
+        receiver, seg, pass_r, pass_z, distance = (receiver[inside], seg[inside], pass_r[inside],
+                                                   pass_z[inside], distance[inside])
+        ray = np.searchsorted(offsets, seg, side='right') - 1
+
+        # Keep the closest pass of each beam at each receiver
+        order = np.lexsort((distance, ray, receiver))
+        receiver, ray, seg, pass_r, pass_z, distance = (a[order] for a in (receiver, ray, seg, pass_r, pass_z, distance))
+        first = np.ones(len(ray), dtype=bool)
+        first[1:] = (receiver[1:] != receiver[:-1]) | (ray[1:] != ray[:-1])
+        receiver, ray, seg, pass_r, pass_z, distance = (a[first] for a in (receiver, ray, seg, pass_r, pass_z, distance))
+
+        receiver_offsets = np.zeros(nrec + 1, dtype=np.int64)
+        receiver_offsets[1:] = np.cumsum(np.bincount(receiver, minlength=nrec))
+        return {"receiver": receiver,
+                "ray": beams[ray],
+                "alpha": np.asarray(alphas)[beams[ray]],
+                "segment": seg - offsets[ray],
+                "range": pass_r / 1000,
+                "depth": pass_z,
+                "distance": distance,
+                "offsets": receiver_offsets}
+
+
+    # Surface/bottom bounces, reflection loss and path families for all rays (or just beams) at once.
+    # Turning points come from sign changes of dz within each ray; a shallow turning point within tolerance (m)
+    # of the .ati profile is a surface bounce ('S'), a deep one near the .bty profile a bottom bounce ('B').
+    # Grazing angles are taken against the local boundary slope. Each bounce gets the coefficient of its boundary
+    # type (surface_type/bottom_type): -1 for a vacuum ('V'), +1 for a rigid boundary ('R'), and for an acoustic
+    # half-space ('A') a fluid Rayleigh coefficient from surface_opt/bottom_opt (water density 1 g/cm^3, water
+    # speed from the SSP at the bounce). Without a type, a boundary with options is treated as 'A', else as the
+    # vacuum surface / rigid bottom. Reflection coefficient files ('F') are not supported.
+    # atten_units follows sspopt[2]: 'F' (dB/(m kHz)) or 'W' (dB/wavelength).
+    # Returns a dict of per-bounce, per-ray and per-family (unique "SB..." label) arrays.
+    def bounce_paths(self, beams=None, tolerance=1.0, atten_units="F"):
+        ray_r, ray_z, offsets, alphas, _ = self.load_ray_cache()
+        if beams is None:
+            beams = np.arange(len(alphas))
+            r, z = ray_r, ray_z
+        else:
+            beams = np.asarray(beams, dtype=np.int64)
+            r, z, offsets = gather_rays(ray_r, ray_z, offsets, beams)
+        nrays = len(beams)
+
+        # Turning points, never across the seam between two rays
+        dz = np.diff(z)
+        valid = np.ones(len(dz), dtype=bool)
+        seams = offsets[1:-1] - 1
+        valid[seams[(seams >= 0) & (seams < len(dz))]] = False
+        step = np.sign(dz)
+        turning = valid[:-1] & valid[1:] & (step[:-1] * step[1:] < 0)
+        idx = np.nonzero(turning)[0] + 1
+        is_top = step[idx - 1] < 0
+
+        bath_ranges = np.asarray(self.bath_ranges, dtype=np.float64)
+        bath_depths = np.asarray(self.bath_depths, dtype=np.float64)
+        ati_depths = np.zeros_like(bath_ranges) if self.ati_depths is None else np.asarray(self.ati_depths, dtype=np.float64)
+        rk = np.asarray(r[idx], dtype=np.float64) / 1000
+        zk = np.asarray(z[idx], dtype=np.float64)
+        surface_hit = is_top & (zk <= np.interp(rk, bath_ranges, ati_depths) + tolerance)
+        bottom_hit = ~is_top & (zk >= np.interp(rk, bath_ranges, bath_depths) - tolerance)
+        hit = surface_hit | bottom_hit
+        idx, rk, zk, is_surface = idx[hit], rk[hit], zk[hit], surface_hit[hit]
+        ray = np.searchsorted(offsets, idx, side='right') - 1
+
+        # Grazing angle between the incoming segment and the boundary
+        dr_in = (np.asarray(r[idx], dtype=np.float64) - r[idx - 1])
+        dz_in = (zk - z[idx - 1])
+        surface_slope = np.interp(rk, bath_ranges, np.gradient(ati_depths, bath_ranges * 1000))
+        bottom_slope = np.interp(rk, bath_ranges, np.gradient(bath_depths, bath_ranges * 1000))
+        slope = np.where(is_surface, surface_slope, bottom_slope)
+        grazing = np.abs(np.arctan2(dz_in, dr_in) - np.arctan(slope))
+        grazing = np.minimum(grazing, np.pi - grazing)
+
+        # Reflection coefficient per bounce
+        c_water = np.interp(zk, self.ssp_depths, self.ssp)
+        R = np.ones(len(idx), dtype=np.complex128)
+        for mask, kind, opt, default in ((is_surface, self.surface_type, self.surface_opt, "V"),
+                                         (~is_surface, self.bottom_type, self.bottom_opt, "R")):
+            kind = kind if kind is not None else ("A" if opt is not None else default)
+            if kind == "V":
+                R[mask] = -1.0
+            elif kind == "R":
+                R[mask] = 1.0
+            elif kind == "A":
+                if opt is None:
+                    raise ValueError("An acoustic half-space boundary needs its surface_opt/bottom_opt.")
+                atten = opt[4] * opt[1] / 1000 if atten_units == "F" else opt[4]
+                R[mask] = rayleigh_coefficient(grazing[mask], c_water[mask], 1.0, opt[1], opt[3], atten)
+            else:
+                raise ValueError(f"Boundary type '{kind}' is not supported in bounce_paths.")
+        loss_db = -20 * np.log10(np.maximum(np.abs(R), 1e-12))
+
+        # Per-ray totals
+        n_surface = np.bincount(ray[is_surface], minlength=nrays)
+        n_bottom = np.bincount(ray[~is_surface], minlength=nrays)
+        n_bounce = n_surface + n_bottom
+        ray_loss = np.bincount(ray, weights=loss_db, minlength=nrays)
+        ray_phase = np.bincount(ray, weights=np.angle(R), minlength=nrays)
+        ray_R = 10 ** (-ray_loss / 20) * np.exp(1j * ray_phase)
+
+        # "SB..." labels (same letters as R_type) as fixed-width byte strings, one row per ray
+        first_bounce = np.zeros(nrays + 1, dtype=np.int64)
+        first_bounce[1:] = np.cumsum(n_bounce)
+        position = np.arange(len(idx)) - first_bounce[ray]
+        width = max(int(n_bounce.max()) if nrays else 0, 1)
+        chars = np.zeros((nrays, width), dtype=np.uint8)
+        chars[ray, position] = np.where(is_surface, ord("S"), ord("B"))
+        labels = chars.view(f"S{width}").ravel()
+
+        families, first_ray, family, family_count = np.unique(labels, return_index=True,
+                                                              return_inverse=True, return_counts=True)
+        family = family.ravel()
+        family_min = np.full(len(families), np.inf)
+        np.minimum.at(family_min, family, ray_loss)
+        family_mean = np.bincount(family, weights=ray_loss, minlength=len(families)) / family_count
+
+        return {"bounces": {"ray": beams[ray],
+                            "index": idx,
+                            "surface": is_surface,
+                            "range": rk,
+                            "depth": zk,
+                            "grazing": np.degrees(grazing),
+                            "R": R,
+                            "loss_db": loss_db},
+                "rays": {"ray": beams,
+                         "alpha": np.asarray(alphas)[beams],
+                         "n_surface": n_surface,
+                         "n_bottom": n_bottom,
+                         "loss_db": ray_loss,
+                         "R": ray_R,
+                         "family": family},
+                "families": {"label": [label.decode() for label in families],
+                             "n_rays": family_count,
+                             "ray": beams[first_ray],
+                             "loss_db_min": family_min,
+                             "loss_db_mean": family_mean}}
+
+
+    # Draws into axs (ray axes, SSP axes) when given, e.g. an embedded GUI canvas; otherwise makes and saves a figure.
+    # mode="lines" draws every beam through one LineCollection; mode="density" rasterizes all ray segments into a
+    # (depth x range) hit-count image of density_shape pixels, whose drawing cost does not grow with the beam count.
+    # By default (mode=None) fans of more than RAY_LINES_MAX_POINTS points are drawn as density, since rendering
+    # millions of line vertices takes minutes.
+    def plot_ray_profile(self, beams=None, axs=None, mode=None, density_shape=(400, 800)):
+        ray_r, ray_z, offsets, alphas, _ = self.load_ray_cache()
+        if beams is not None:
+            ray_r, ray_z, offsets = gather_rays(ray_r, ray_z, offsets, beams)
+        if mode is None:
+            mode = "lines" if len(ray_r) <= RAY_LINES_MAX_POINTS else "density"
+            if mode == "density":
+                print(f"{len(ray_r)} ray points: drawing the ray density (mode=\"lines\" draws every ray)")
+        save = axs is None
+        if save:
+            fig, axs = plt.subplots(1, 2, figsize=(12, 6), sharey=True, gridspec_kw={'width_ratios': [3, 1]})
+
+        if mode == "density":
+            hits, r_edges, z_edges = ray_density(ray_r, ray_z, offsets, density_shape)
+            image = axs[0].imshow(np.ma.masked_equal(hits, 0), origin="lower", aspect="auto", cmap="viridis",
+                                  norm=LogNorm(vmin=1, vmax=max(hits.max(), 1)), interpolation="nearest",
+                                  extent=[r_edges[0] / 1000, r_edges[-1] / 1000, z_edges[0], z_edges[-1]])
+            axs[0].figure.colorbar(image, ax=axs[0], label="Ray hits")
+        else:
+            # One (npts x 2) view per ray, split straight out of the flat coordinate arrays
+            points = np.column_stack((np.asarray(ray_r, dtype=np.float32) / 1000, ray_z))
+            rays = np.split(points, offsets[1:-1])
+            colors = plt.rcParams['axes.prop_cycle'].by_key()['color']
+            lines = LineCollection(rays, colors=colors, linewidths=plt.rcParams['lines.linewidth'], rasterized=True)
+            axs[0].add_collection(lines)
+            axs[0].autoscale_view()
 
         # sea_surface = np.zeros((len(self.bath_ranges)))
         axs[0].invert_yaxis()
         # axs[0].plot(self.bath_ranges, sea_surface, "--", color="black", linewidth=3)
-        axs[0].plot(self.bath_ranges, self.ati_depths, "--", color="black", linewidth=3)
+        # The surface is dashed over a vacuum (or unknown type) and solid like the bottom over a rigid or acoustic half-space
+        surface_style = "--" if self.surface_type in (None, "V") else "-"
+        axs[0].plot(self.bath_ranges, self.ati_depths, surface_style, color="black", linewidth=3)
         axs[0].plot(0, self.s_depth, "bo", linewidth=3)
         axs[0].plot(self.r_range, self.r_depth, "ro", linewidth=3)
         axs[0].plot(self.bath_ranges, self.bath_depths, color="black", linewidth=3)
@@ -307,8 +704,9 @@ class Read_RAY:
         axs[1].plot(self.ssp, self.ssp_depths)
         axs[1].set_title("Sound Speed Profile")
         axs[1].set_xlabel("Sound Speed (m/s)")
-        plt.savefig(self.output_directory + self.ray_file + ".png", dpi=300, bbox_inches='tight')
-        plt.tight_layout()
+        if save:
+            plt.savefig(self.output_directory + self.ray_file + ".png", dpi=300, bbox_inches='tight')
+            plt.tight_layout()
                                 
             
     def R_type(self, R_string, up_down):
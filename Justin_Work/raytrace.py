@@ -0,0 +1,383 @@
+import numpy as np
+import os
+import sys
+import warnings
+from scipy.interpolate import CubicSpline
+
+# First bytes of macOS (Mach-O) executables, which cannot run on the Linux batch nodes
+MACH_O_MAGICS = (b'\xfe\xed\xfa\xce', b'\xfe\xed\xfa\xcf', b'\xce\xfa\xed\xfe', b'\xcf\xfa\xed\xfe', b'\xca\xfe\xba\xbe')
+
+
+# True when the BELLHOP executable exists, is executable and is built for this platform
+def bellhop_available(bellhop_executable):
+    if not bellhop_executable or not os.path.isfile(bellhop_executable) or not os.access(bellhop_executable, os.X_OK):
+        return False
+    with open(bellhop_executable, 'rb') as f:
+        magic = f.read(4)
+    return sys.platform == "darwin" or magic not in MACH_O_MAGICS
+
+
+# Fan intervals (between neighbouring launch angles) where the depth at each receiver range is not smooth:
+# the turn count changes, a neighbour misses the range, the depth step changes sign against an adjacent interval
+# (a fold) or is much larger than both adjacent steps (a jump). depths/turns are (nbeams x nranges); the result is
+# (nbeams - 1 x nranges).
+def irregular_intervals(depths, turns, jump_ratio=2.0):
+    step = np.diff(depths, axis=0)
+    irregular = (turns[:-1] != turns[1:]) | np.isnan(step)
+    before = np.vstack((step[:1], step[:-1]))
+    after = np.vstack((step[1:], step[-1:]))
+    with np.errstate(invalid='ignore'):
+        irregular |= (np.sign(step) != np.sign(before)) | (np.sign(step) != np.sign(after))
+        irregular |= np.abs(step) > jump_ratio * np.maximum(np.abs(before), np.abs(after))
+    irregular &= ~(np.isnan(depths[:-1]) & np.isnan(depths[1:]))
+    return irregular
+
+
+# Launches budgeted per eigenray bracket when find_eigenrays has to pick a subset of the brackets to refine
+BRACKET_LAUNCHES = 10
+# Launches find_eigenrays may spend per coarse beam by default
+EIGENRAY_LAUNCHES = 25
+
+
+# Intervals of the fan (nbeams - 1 x nranges x ndepths) whose depths, with those of the neighbouring beams, span
+# the receiver depth, so that a fold or jump inside them can hide eigenrays of that receiver
+def near_receivers(depths, receiver_depths):
+    padded = np.vstack((depths[:1], depths, depths[-1:]))
+    window = np.stack([padded[k:len(padded) - 3 + k] for k in range(4)])
+    with np.errstate(invalid='ignore'), warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        low, high = np.nanmin(window, axis=0), np.nanmax(window, axis=0)
+    return (low[:, :, None] <= receiver_depths) & (high[:, :, None] >= receiver_depths)
+
+
+# Sign changes of the depth miss along the fan, per receiver: depths is (nbeams x nranges), the result is
+# (nranges x ndepths)
+def bracket_counts(depths, receiver_depths):
+    miss = depths[:, :, None] - receiver_depths[None, None, :]
+    with np.errstate(invalid='ignore'):
+        return np.count_nonzero(np.sign(miss[:-1]) * np.sign(miss[1:]) <= 0, axis=0)
+
+
+# Sorted angles with those closer than tolerance (degrees) to the previous kept one dropped
+def unique_angles(alphas, tolerance=1e-3):
+    alphas = np.sort(np.asarray(alphas, dtype=np.float64))
+    keep = np.ones(len(alphas), dtype=bool)
+    last = -np.inf
+    for i, alpha in enumerate(alphas):
+        keep[i] = alpha - last > tolerance
+        if keep[i]:
+            last = alpha
+    return alphas[keep]
+
+
+# In-process 2D ray tracer for a Write_RAY configuration (same SSP, .bty/.ati and beam fan options).
+# All launch angles are stepped together as NumPy arrays with a midpoint (RK2) step of step_size along the ray,
+# using the ray equations dr/ds = c xi, dz/ds = c zeta, dzeta/ds = -c_z / c^2 for the range-independent SSP.
+# Rays that cross the surface or bottom are cut at the boundary and specularly reflected about its local slope,
+# so the boundary point is on the ray like in BELLHOP output. A step_size of 0 means automatic, as in BELLHOP:
+# a tenth of the depth span between the surface and the bottom. Rays stop past max_range, below max_depth,
+# behind the source or once their range has not increased for max_stall steps in a row (e.g. a vertical
+# launch, or a ray turned back by a steep slope). Results use the Read_RAY CSR layout: (r (m), z (m), offsets, alphas (degrees)).
+class Trace_RAY:
+    def __init__(self,
+                 config,                     # Write_RAY configuration
+                 isd=0,                      # Index of the source depth to trace
+                 max_steps=100000,
+                 max_stall=10):              # Steps without range progress after which a ray is stopped
+
+        self.config = config
+        self.isd = isd
+        self.max_steps = max_steps
+        self.max_stall = max_stall
+        self.rays_traced = 0
+
+        depths = np.asarray(config.ssp_depth, dtype=np.float64)
+        speeds = np.asarray(config.ssp, dtype=np.float64)
+        self.ssp_depths = depths
+        self.ssp_speeds = speeds
+        self.spline = CubicSpline(depths, speeds) if config.sspopt[0] == "S" and len(depths) >= 4 else None
+
+        bath_ranges = 1000 * np.asarray(config.bath_ranges, dtype=np.float64)
+        if config.bottom_type[1] == "*":
+            self.bottom = (bath_ranges, np.asarray(config.bath_depths, dtype=np.float64))
+        else:
+            self.bottom = (np.array([0.0, 1.0]), np.full(2, float(config.bottom_opt[0])))
+        if config.sspopt[4] == "*":
+            self.surface = (bath_ranges, np.asarray(config.ati_depths, dtype=np.float64))
+        else:
+            self.surface = (np.array([0.0, 1.0]), np.zeros(2))
+
+        self.step_size = float(config.step_size) if config.step_size else 0.0
+        if self.step_size <= 0:
+            self.step_size = (self.bottom[1].max() - self.surface[1].min()) / 10
+
+
+    # Sound speed and its depth derivative
+    def sound_speed(self, z):
+        z = np.clip(z, self.ssp_depths[0], self.ssp_depths[-1])
+        if self.spline is not None:
+            return self.spline(z), self.spline(z, 1)
+        i = np.clip(np.searchsorted(self.ssp_depths, z) - 1, 0, len(self.ssp_depths) - 2)
+        slope = (self.ssp_speeds[i+1] - self.ssp_speeds[i]) / (self.ssp_depths[i+1] - self.ssp_depths[i])
+        return self.ssp_speeds[i] + slope * (z - self.ssp_depths[i]), slope
+
+
+    # Depth and slope of a piecewise-linear boundary (ranges, depths), held constant beyond its ends
+    def boundary(self, profile, r):
+        ranges, depths = profile
+        i = np.clip(np.searchsorted(ranges, r) - 1, 0, len(ranges) - 2)
+        slope = (depths[i+1] - depths[i]) / (ranges[i+1] - ranges[i])
+        inside = (r >= ranges[0]) & (r <= ranges[-1])
+        depth = np.where(inside, depths[i] + slope * (r - ranges[i]), np.interp(r, ranges, depths))
+        return depth, np.where(inside, slope, 0.0)
+
+
+    # Steps the rays launched at alphas (degrees) until they leave the box (or pass max_range, in m, one value
+    # for all rays or one per ray).
+    # Yields (active, ra, za, rn, zn) per step: the beams still running and their positions before/after it.
+    # Boundary hits are added to n_top / n_bot when given.
+    def march(self, alphas, max_range=None, n_top=None, n_bot=None):
+        config = self.config
+        nbeams = len(alphas)
+        ds = self.step_size
+        max_range = np.broadcast_to(1000 * float(config.max_range) if max_range is None else max_range, (nbeams,))
+        max_depth = float(config.max_depth)
+
+        r = np.zeros(nbeams)
+        z = np.full(nbeams, float(config.sd[self.isd]))
+        c0, _ = self.sound_speed(z)
+        xi = np.cos(np.radians(alphas)) / c0
+        zeta = np.sin(np.radians(alphas)) / c0
+
+        stalled = np.zeros(nbeams, dtype=np.int64)
+        active = np.arange(nbeams)
+        for _ in range(self.max_steps):
+            if len(active) == 0:
+                break
+            ra, za, xa, ya = r[active], z[active], xi[active], zeta[active]
+
+            # Midpoint step
+            c, cz = self.sound_speed(za)
+            zm = za + 0.5 * ds * c * ya
+            ym = ya - 0.5 * ds * cz / c**2
+            cm, czm = self.sound_speed(zm)
+            rn = ra + ds * cm * xa
+            zn = za + ds * cm * ym
+            yn = ya - ds * czm / cm**2
+            xn = xa
+
+            # Cut the step at a boundary crossing and reflect about the boundary slope
+            for profile, is_bottom in ((self.bottom, True), (self.surface, False)):
+                depth0 = np.interp(ra, *profile)
+                depth1 = np.interp(rn, *profile)
+                g0 = za - depth0 if is_bottom else depth0 - za
+                g1 = zn - depth1 if is_bottom else depth1 - zn
+                hit = g1 > 0
+                if not np.any(hit):
+                    continue
+                f = np.clip(g0[hit] / np.where(g0[hit] - g1[hit] == 0, -1.0, g0[hit] - g1[hit]), 0.0, 1.0)
+                rn[hit] = ra[hit] + f * (rn[hit] - ra[hit])
+                zn[hit] = za[hit] + f * (zn[hit] - za[hit])
+                yn[hit] = ya[hit] + f * (yn[hit] - ya[hit])
+                depth_hit, slope = self.boundary(profile, rn[hit])
+                zn[hit] = depth_hit
+                tr = 1 / np.sqrt(1 + slope**2)
+                tz = slope * tr
+                dot = xn[hit] * tr + yn[hit] * tz
+                xn[hit] = 2 * dot * tr - xn[hit]
+                yn[hit] = 2 * dot * tz - yn[hit]
+                counter = n_bot if is_bottom else n_top
+                if counter is not None:
+                    counter[active[hit]] += 1
+
+            r[active], z[active], xi[active], zeta[active] = rn, zn, xn, yn
+            stalled[active] = np.where(rn - ra > 1e-6 * ds, 0, stalled[active] + 1)
+            yield active, ra, za, rn, zn
+            active = active[(rn <= max_range[active]) & (rn >= 0) & (zn <= max_depth) & (stalled[active] < self.max_stall)]
+
+
+    # Full ray paths for the configuration's fan (or the given launch angles)
+    def trace(self, alphas=None):
+        config = self.config
+        if alphas is None:
+            alphas = np.linspace(config.launch_angles[0], config.launch_angles[1], int(config.num_beams))
+        alphas = np.atleast_1d(np.asarray(alphas, dtype=np.float64))
+        nbeams = len(alphas)
+        self.n_top = np.zeros(nbeams, dtype=np.int64)
+        self.n_bot = np.zeros(nbeams, dtype=np.int64)
+
+        history_beam = [np.arange(nbeams)]
+        history_r = [np.zeros(nbeams)]
+        history_z = [np.full(nbeams, float(config.sd[self.isd]))]
+        for active, _, _, rn, zn in self.march(alphas, n_top=self.n_top, n_bot=self.n_bot):
+            history_beam.append(active)
+            history_r.append(rn)
+            history_z.append(zn)
+
+        # Beam-major CSR layout (each step lists its beams in ascending order, so a stable sort suffices)
+        beam = np.concatenate(history_beam)
+        order = np.argsort(beam, kind='stable')
+        counts = np.bincount(beam, minlength=nbeams)
+        offsets = np.zeros(nbeams + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(counts)
+        self.rays = (np.concatenate(history_r)[order], np.concatenate(history_z)[order], offsets, alphas)
+        return self.rays
+
+
+    # Depth (m) where each ray first reaches each range (m), NaN if it never does, and the number of vertical
+    # turning points (boundary bounces and refracted turns) before it got there. ranges is shared by all rays, or
+    # (nalphas x nranges) for ranges of their own. No paths are kept and each ray is only stepped out to its
+    # farthest range.
+    def depth_at_ranges(self, alphas, ranges):
+        alphas = np.atleast_1d(np.asarray(alphas, dtype=np.float64))
+        ranges = np.broadcast_to(np.asarray(ranges, dtype=np.float64), (len(alphas), np.shape(ranges)[-1]))
+        depths = np.full(ranges.shape, np.nan)
+        turns = np.full(ranges.shape, -1, dtype=np.int64)
+        n_turns = np.zeros(len(alphas), dtype=np.int64)
+        heading = np.sign(alphas)
+        for active, ra, za, rn, zn in self.march(alphas, max_range=ranges.max(axis=1)):
+            step = np.sign(zn - za)
+            turned = (step != 0) & (step != heading[active])
+            n_turns[active] += turned & (heading[active] != 0)
+            heading[active] = np.where(step != 0, step, heading[active])
+
+            crossed = (ra[:, None] <= ranges[active]) & (rn[:, None] > ranges[active])
+            crossed &= np.isnan(depths[active])
+            beam, irange = np.nonzero(crossed)
+            if len(beam):
+                w = (ranges[active[beam], irange] - ra[beam]) / (rn[beam] - ra[beam])
+                depths[active[beam], irange] = za[beam] + w * (zn[beam] - za[beam])
+                turns[active[beam], irange] = n_turns[active[beam]]
+        self.rays_traced += len(alphas)
+        return depths, turns
+
+
+    # Two-pass eigenray search over many receivers at once.
+    # A coarse fan of coarse_beams rays gives each ray's depth at every receiver range. Depth is only piecewise
+    # smooth in launch angle (it folds back at bounces and caustics and jumps where rays hit a bathymetry kink),
+    # so irregular intervals are first halved up to fold_levels times, which separates pairs of eigenrays that
+    # fall in one coarse interval. Only intervals whose depths come near a receiver are halved for it, and a
+    # receiver stops asking for halving once a level adds no brackets for it.
+    # Intervals where the depth miss then changes sign bracket an eigenray, and all brackets are refined together
+    # (Illinois false position, one batched re-launch per iteration, each ray stopped at its receiver's range)
+    # until the miss is within tolerance (m). At most max_launches rays are traced in all (default
+    # EIGENRAY_LAUNCHES per coarse beam): fold halving stops at a quarter of it, an evenly spread subset of the
+    # brackets is refined when there are more than the rest can pay for, and the refinement keeps its best angles
+    # so far once the budget is spent. Eigenrays of one receiver closer than the width of either converged
+    # bracket are the same ray reached from neighbouring brackets and are kept once.
+    # receiver_depths (m) x receiver_ranges (km) default to the configuration's rd x rr grid.
+    # Returns a dict of eigenray launch angles with their receiver indices and final depth miss.
+    def find_eigenrays(self, receiver_depths=None, receiver_ranges=None, coarse_beams=201, tolerance=0.1,
+                       fold_levels=6, angle_tolerance=1e-6, max_iterations=40, max_launches=None):
+        config = self.config
+        receiver_depths = np.atleast_1d(config.rd if receiver_depths is None else receiver_depths).astype(np.float64)
+        receiver_ranges = 1000 * np.atleast_1d(config.rr if receiver_ranges is None else receiver_ranges).astype(np.float64)
+        max_launches = EIGENRAY_LAUNCHES * coarse_beams if max_launches is None else max_launches
+        self.rays_traced = 0
+
+        alphas = np.linspace(config.launch_angles[0], config.launch_angles[1], coarse_beams)
+        depths, turns = self.depth_at_ranges(alphas, receiver_ranges)
+        n_brackets = bracket_counts(depths, receiver_depths)
+        halving = np.ones(n_brackets.shape, dtype=bool)
+        for _ in range(fold_levels):
+            fold = np.any(irregular_intervals(depths, turns)[:, :, None] & halving[None]
+                          & near_receivers(depths, receiver_depths), axis=(1, 2))
+            if not np.any(fold) or self.rays_traced + np.count_nonzero(fold) > max_launches // 4:
+                break
+            new_alphas = (alphas[:-1][fold] + alphas[1:][fold]) / 2
+            new_depths, new_turns = self.depth_at_ranges(new_alphas, receiver_ranges)
+            order = np.argsort(np.concatenate((alphas, new_alphas)), kind='stable')
+            alphas = np.concatenate((alphas, new_alphas))[order]
+            depths = np.concatenate((depths, new_depths))[order]
+            turns = np.concatenate((turns, new_turns))[order]
+            counts = bracket_counts(depths, receiver_depths)
+            halving &= counts != n_brackets
+            n_brackets = counts
+
+        miss = depths[:, :, None] - receiver_depths[None, None, :]
+        with np.errstate(invalid='ignore'):
+            bracket = np.sign(miss[:-1]) * np.sign(miss[1:]) <= 0
+        lower, irange, idepth = np.nonzero(bracket)
+        n_refined = max((max_launches - self.rays_traced) // BRACKET_LAUNCHES, 0)
+        if len(lower) > n_refined:
+            subset = np.unique(np.linspace(0, len(lower) - 1, n_refined).astype(np.int64)) if n_refined else []
+            lower, irange, idepth = lower[subset], irange[subset], idepth[subset]
+        lo, hi = alphas[lower], alphas[lower + 1]
+        miss_lo = miss[lower, irange, idepth]
+        miss_hi = miss[lower + 1, irange, idepth]
+        best = np.where(np.abs(miss_lo) <= np.abs(miss_hi), lo, hi)
+        best_miss = np.minimum(np.abs(miss_lo), np.abs(miss_hi))
+
+        # Illinois false-position refinement of every open bracket (bisection where the secant is undefined),
+        # batched into one launch per iteration
+        side = np.zeros(len(lo), dtype=np.int64)
+        open_ = best_miss > tolerance
+        for iteration in range(max_iterations):
+            k = np.nonzero(open_)[0][:max(max_launches - self.rays_traced, 0)]
+            if len(k) == 0:
+                break
+            with np.errstate(invalid='ignore', divide='ignore'):
+                mid = hi[k] - miss_hi[k] * (hi[k] - lo[k]) / (miss_hi[k] - miss_lo[k])
+            mid = np.where(np.isfinite(mid) & (mid > np.minimum(lo[k], hi[k])) & (mid < np.maximum(lo[k], hi[k])),
+                           mid, (lo[k] + hi[k]) / 2)
+            miss_mid = self.depth_at_ranges(mid, receiver_ranges[irange[k]][:, None])[0][:, 0] - receiver_depths[idepth[k]]
+
+            same = np.sign(miss_mid) == np.sign(miss_lo[k])
+            # Halve the miss kept at the end that did not move twice in a row
+            miss_hi[k] = np.where(same & (side[k] == -1), miss_hi[k] / 2, miss_hi[k])
+            miss_lo[k] = np.where(~same & (side[k] == 1), miss_lo[k] / 2, miss_lo[k])
+            lo[k] = np.where(same, mid, lo[k])
+            miss_lo[k] = np.where(same, miss_mid, miss_lo[k])
+            hi[k] = np.where(same, hi[k], mid)
+            miss_hi[k] = np.where(same, miss_hi[k], miss_mid)
+            side[k] = np.where(same, -1, 1)
+
+            better = np.abs(miss_mid) < best_miss[k]
+            best[k] = np.where(better, mid, best[k])
+            best_miss[k] = np.where(better, np.abs(miss_mid), best_miss[k])
+            # Brackets that shrink without converging straddle a discontinuity (shadow edge), not an eigenray
+            open_[k] = ~np.isnan(miss_mid) & (best_miss[k] > tolerance) & (np.abs(hi[k] - lo[k]) > angle_tolerance)
+
+        found = best_miss <= tolerance
+        order = np.lexsort((best[found], irange[found], idepth[found]))
+        alpha, depth_index, range_index, final_miss, width = (a[found][order] for a in
+                                                              (best, idepth, irange, best_miss, np.abs(hi - lo)))
+
+        # One angle per eigenray and receiver: neighbouring angles closer than either converged bracket is wide
+        # are the same ray
+        keep = np.ones(len(alpha), dtype=bool)
+        keep[1:] = ((depth_index[1:] != depth_index[:-1]) | (range_index[1:] != range_index[:-1])
+                    | (np.diff(alpha) > np.maximum(width[1:], width[:-1])))
+        return {"alpha": alpha[keep],
+                "receiver_depth": depth_index[keep],
+                "receiver_range": range_index[keep],
+                "miss": final_miss[keep],
+                "rays_traced": self.rays_traced}
+
+
+    # Traces the fan, or for run type 'E' only the eigenrays found by find_eigenrays (like BELLHOP's output)
+    def run(self):
+        if self.config.ray_compute[0] == "E":
+            self.eigen = self.find_eigenrays()
+            return self.trace(unique_angles(self.eigen["alpha"]))
+        return self.trace()
+
+
+    # Writes the traced rays as a BELLHOP .ray file (defaults to the configuration's dir/filename.ray)
+    def write_ray_file(self, path=None):
+        config = self.config
+        path = path or os.path.join(config.dir, config.filename + ".ray")
+        r, z, offsets, alphas = self.run()
+        with open(path, 'w') as f:
+            f.write(f"'{config.filename}'\n")
+            f.write(f"{float(config.freq)}\n")
+            f.write("1 1 1\n")
+            f.write(f"{len(alphas)} 1\n")
+            f.write(f"{float(self.surface[1].min())}\n")
+            f.write(f"{float(self.bottom[1].max())}\n")
+            f.write("'rz'\n")
+            for i in range(len(alphas)):
+                f.write(f"{alphas[i]}\n{offsets[i+1] - offsets[i]} {self.n_top[i]} {self.n_bot[i]}\n")
+                np.savetxt(f, np.column_stack((r[offsets[i]:offsets[i+1]], z[offsets[i]:offsets[i+1]])), fmt="%.4f")
+        print(f".ray file written: {path}")
+        return path
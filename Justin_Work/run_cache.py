@@ -0,0 +1,172 @@
+import os
+import math
+import shutil
+import hashlib
+
+# BELLHOP output files that are memoized
+OUTPUT_EXTENSIONS = (".shd", ".ray", ".arr")
+# Auxiliary inputs that BELLHOP picks up next to the .env file
+INPUT_EXTENSIONS = (".bty", ".ati", ".ssp", ".sbp", ".trc", ".brc")
+
+
+# Title of a .env file: its first line without the quotes and the trailing comment
+def env_title(env_path):
+    with open(env_path) as f:
+        line = f.readline()
+    return line.split("!")[0].strip().strip("'")
+
+
+# Replaces old_title with new_title in the 80-char title field of a .shd (record 0, after the int32 record
+# length), keeping whatever BELLHOP wrote around it. Leaves the file alone if old_title is not in the field.
+def retitle_shd(shd_path, old_title, new_title):
+    with open(shd_path, 'r+b') as f:
+        f.seek(4)
+        field = f.read(80).decode('ascii', errors='ignore')
+        if not old_title or old_title not in field:
+            return
+        f.seek(4)
+        f.write(field.replace(old_title, new_title, 1)[:80].ljust(80).encode('ascii', errors='replace'))
+
+
+# Content-hash memoization of BELLHOP runs.
+#
+# Each entry is a directory <cache_dir>/<key>/ holding the outputs of one run. The key hashes the generated
+# environment (without its title line, so identical runs saved under different filenames share an entry),
+# the auxiliary input files and the executable's identity. The entry also keeps the title of the run that
+# stored it, and fetch() swaps it for the current run's title in the .shd header. Entries are evicted least-recently-used once the
+# cache grows past max_bytes; a hit refreshes the entry's mtime, which is what the LRU order is based on.
+# Using one directory per entry (instead of a shared index file) keeps it safe for parallel sweep workers.
+# hits/misses count the lookups made in this process; pool workers work on copies of the cache, so their
+# lookups come back in the job statuses ("cache": "hit"/"miss") and are added with record().
+class Run_Cache:
+    def __init__(self, cache_dir, max_bytes=2 * 1024**3):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+
+    # Key for a configuration whose input files have already been written (config.write_files())
+    def key(self, config, bellhop_executable, dimension="-2D"):
+        base_path = os.path.join(config.dir, config.filename)
+        h = hashlib.sha256()
+
+        with open(base_path + ".env", 'rb') as f:
+            lines = f.read().splitlines()
+        for line in lines[1:]:
+            h.update(line.rstrip() + b"\n")
+
+        for ext in INPUT_EXTENSIONS:
+            if os.path.exists(base_path + ext):
+                h.update(ext.encode())
+                with open(base_path + ext, 'rb') as f:
+                    h.update(hashlib.sha256(f.read()).digest())
+
+        exe = os.path.realpath(bellhop_executable)
+        stat = os.stat(exe)
+        h.update(f"{exe}|{stat.st_size}|{stat.st_mtime_ns}|{dimension}".encode())
+        return h.hexdigest()
+
+
+    # On a hit, copies the stored outputs to base_path + ext and returns the main output path, else None
+    def fetch(self, key, base_path):
+        entry = os.path.join(self.cache_dir, key)
+        if not os.path.isdir(entry):
+            self.misses += 1
+            return None
+
+        output = None
+        try:
+            for ext in OUTPUT_EXTENSIONS:
+                cached = os.path.join(entry, "output" + ext)
+                if os.path.exists(cached):
+                    shutil.copyfile(cached, base_path + ext)
+                    output = output or base_path + ext
+            title_path = os.path.join(entry, "title")
+            if os.path.exists(base_path + ".shd") and os.path.exists(title_path):
+                with open(title_path) as f:
+                    retitle_shd(base_path + ".shd", f.read(), env_title(base_path + ".env"))
+            os.utime(entry)
+        except OSError:
+            # Entry was evicted by another process while being read
+            output = None
+        if output is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        print(f"Run cache hit: {key[:12]} -> {output}")
+        return output
+
+
+    # Adds the cache lookups of jobs run elsewhere (run_bellhop statuses from pool workers)
+    def record(self, statuses):
+        for status in statuses:
+            if status.get("cache") == "hit":
+                self.hits += 1
+            elif status.get("cache") == "miss":
+                self.misses += 1
+
+
+    # Stores the outputs found at base_path + ext under key, then evicts down to max_bytes.
+    # With since (time.time() taken before the run), outputs last modified before the run are left out, so a
+    # stale file from an earlier run at the same path is never cached. Whole seconds are compared, as some
+    # filesystems keep coarse timestamps.
+    def store(self, key, base_path, since=None):
+        entry = os.path.join(self.cache_dir, key)
+        if os.path.isdir(entry):
+            return
+        outputs = [ext for ext in OUTPUT_EXTENSIONS if os.path.exists(base_path + ext)]
+        if since is not None:
+            outputs = [ext for ext in outputs if os.path.getmtime(base_path + ext) >= math.floor(since)]
+        if not outputs:
+            return
+        tmp_entry = entry + f".tmp{os.getpid()}"
+        os.makedirs(tmp_entry, exist_ok=True)
+        for ext in outputs:
+            shutil.copyfile(base_path + ext, os.path.join(tmp_entry, "output" + ext))
+        with open(os.path.join(tmp_entry, "title"), 'w') as f:
+            f.write(env_title(base_path + ".env"))
+        try:
+            os.rename(tmp_entry, entry)
+        except OSError:
+            # Another worker stored the same run first
+            shutil.rmtree(tmp_entry, ignore_errors=True)
+        self.evict()
+
+
+    def entries(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if not os.path.isdir(path) or ".tmp" in name:
+                continue
+            size = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+            entries.append((os.path.getmtime(path), size, path))
+        return entries
+
+
+    # Least-recently-used eviction until the cache fits in max_bytes
+    def evict(self):
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            self.evictions += 1
+
+
+    def stats(self):
+        entries = self.entries()
+        lookups = self.hits + self.misses
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(entries),
+                "bytes": sum(size for _, size, _ in entries),
+                "max_bytes": self.max_bytes}
@@ -0,0 +1,257 @@
+import numpy as np
+import os
+import json
+
+# Native reader for BELLHOP shade (.shd) files.
+#
+# The header is parsed once and the pressure records are exposed through a numpy.memmap, so slicing a
+# single source depth, receiver row or range column only pages in the bytes that are actually used.
+#
+# File layout (direct-access records of `recl` 4-byte words):
+#   rec 0: recl (int32), title (80 chars)
+#   rec 1: PlotType (10 chars)
+#   rec 2: Nfreq, Ntheta, Nsx, Nsy, Nsz, Nrz, Nrr (int32), freq0, atten (float32)
+#   rec 3: freqVec (float64)
+#   rec 4: theta (float64)
+#   rec 5: Sx (float32),  rec 6: Sy (float32)
+#   rec 7: Sz (float32),  rec 8: Rz (float32)
+#   rec 9: Rr (float32, meters)
+#   rec 10+: one record per (freq, theta, source depth, receiver depth) holding Nrr complex64 samples
+HEADER_RECORDS = 10
+
+
+class Read_SHD:
+    def __init__(self, filename):
+        self.filename = filename
+        self.read_header()
+        self._pressure = None
+
+
+    def read_header(self):
+        with open(self.filename, 'rb') as f:
+            self.recl = int(np.fromfile(f, np.int32, 1)[0])
+            self.title = f.read(80).decode('ascii', errors='ignore').strip()
+            rec_bytes = 4 * self.recl
+
+            f.seek(rec_bytes)
+            self.plot_type = f.read(10).decode('ascii', errors='ignore')
+
+            f.seek(2 * rec_bytes)
+            nfreq, ntheta, nsx, nsy, nsz, nrz, nrr = np.fromfile(f, np.int32, 7)
+            self.freq0, self.atten = np.fromfile(f, np.float32, 2).astype(np.float64)
+            self.nfreq, self.ntheta = int(nfreq), int(ntheta)
+            self.nsx, self.nsy, self.nsz = int(nsx), int(nsy), int(nsz)
+            self.nrz, self.nrr = int(nrz), int(nrr)
+
+            f.seek(3 * rec_bytes)
+            self.freqs = np.fromfile(f, np.float64, self.nfreq)
+            f.seek(4 * rec_bytes)
+            self.theta = np.fromfile(f, np.float64, self.ntheta)
+            f.seek(5 * rec_bytes)
+            self.sx = np.fromfile(f, np.float32, self.nsx).astype(np.float64)
+            f.seek(6 * rec_bytes)
+            self.sy = np.fromfile(f, np.float32, self.nsy).astype(np.float64)
+            f.seek(7 * rec_bytes)
+            self.sz = np.fromfile(f, np.float32, self.nsz).astype(np.float64)
+            f.seek(8 * rec_bytes)
+            self.rz = np.fromfile(f, np.float32, self.nrz).astype(np.float64)
+            f.seek(9 * rec_bytes)
+            self.rr = np.fromfile(f, np.float32, self.nrr).astype(np.float64)
+
+        # Irregular grids store one receiver depth per range, i.e. a single record per source
+        if self.plot_type.startswith('irregular'):
+            self.nrz_records = 1
+        else:
+            self.nrz_records = self.nrz
+
+        n_records = self.nfreq * self.ntheta * self.nsz * self.nrz_records
+        expected = 4 * self.recl * (HEADER_RECORDS + n_records)
+        if os.path.getsize(self.filename) < expected:
+            raise ValueError(f"{self.filename} is truncated: expected {expected} bytes.")
+
+
+    # Lazily indexed pressure cube with shape (Nfreq, Ntheta, Nsz, Nrz, Nrr), complex64
+    @property
+    def pressure(self):
+        if self._pressure is None:
+            # Each record may be padded past Nrr samples, so map records as a structured dtype and take
+            # the pressure field as a (strided) view
+            fields = [('p', np.complex64, (self.nrr,))]
+            pad = 4 * self.recl - 8 * self.nrr
+            if pad > 0:
+                fields.append(('pad', np.void, pad))
+            record = np.dtype(fields)
+            records = np.memmap(self.filename, dtype=record, mode='r',
+                                offset=4 * self.recl * HEADER_RECORDS,
+                                shape=(self.nfreq, self.ntheta, self.nsz, self.nrz_records))
+            self._pressure = records['p']
+        return self._pressure
+
+
+    def freq_index(self, freq=None):
+        if freq is None:
+            return 0
+        return int(np.argmin(np.abs(self.freqs - float(freq))))
+
+
+    # Pressure field (source depth x receiver depth x range) for one frequency and bearing
+    def field(self, freq=None, itheta=0):
+        return self.pressure[self.freq_index(freq), itheta]
+
+
+    # Single receiver depth row across all ranges, read as an in-memory array
+    def depth_row(self, irz, isz=0, freq=None, itheta=0):
+        return np.array(self.pressure[self.freq_index(freq), itheta, isz, irz])
+
+
+    # Single range column across all receiver depths, read as an in-memory array
+    def range_column(self, irr, isz=0, freq=None, itheta=0):
+        return np.array(self.pressure[self.freq_index(freq), itheta, isz, :, irr])
+
+
+# Index of each of depths (m) on a depth axis of a BELLHOP output (sz/rz). Every depth must be on the axis to
+# within tolerance (m); a missing one raises instead of silently taking the nearest depth that was modelled.
+def depth_indices(axis, depths, tolerance=1e-3):
+    axis = np.asarray(axis, dtype=np.float64)
+    depths = np.atleast_1d(np.asarray(depths, dtype=np.float64))
+    distance = np.abs(axis[None, :] - depths[:, None])
+    index = distance.argmin(axis=1)
+    missing = distance[np.arange(len(depths)), index] > tolerance
+    if np.any(missing):
+        raise ValueError(f"Depths {depths[missing].tolist()} m are not in the run output "
+                         f"(nearest {axis[index[missing]].tolist()} m).")
+    return index
+
+
+# Single-file store for a whole frequency sweep (<name>.sweep).
+#
+#   bytes 0-15:             magic + JSON header length (uint64, little endian)
+#   header:                 JSON (title, freqs, grid shape, section offsets), space padded to a multiple of 4096
+#   freq-major section:     complex64 (Nfreq, Nsz, Nrz, Nrr)  -> one frequency's whole field is contiguous
+#   receiver-major section: complex64 (Nsz, Nrz, Nrr, Nfreq)  -> one receiver's full spectrum is contiguous
+#   axes section:           float64 sz, rz, rr
+#
+# No single ordering makes both access patterns contiguous, so the receiver-major copy is written alongside
+# (receiver_major=False skips it and halves the file size).
+SWEEP_MAGIC = b'ARMSSWP2'
+SWEEP_PREFIX_BYTES = 16
+SWEEP_ALIGNMENT = 4096
+# Size of the blocks of receiver rows transposed at a time into the receiver-major section
+SWEEP_BLOCK_BYTES = 64 * 2**20
+# Largest difference (Hz) between a requested frequency and a stored one that still counts as a match
+SWEEP_FREQ_TOLERANCE = 1e-3
+
+
+def write_sweep_store(path, shd_files, receiver_major=True):
+    # shd_files: {freq: .shd path}, e.g. the manifest returned by Sweep_TL.run()
+    shd_files = {float(f): p for f, p in shd_files.items()}
+    freqs = np.array(sorted(shd_files))
+    paths = [shd_files[f] for f in freqs]
+    first = Read_SHD(paths[0])
+    nsz, nrz, nrr = first.nsz, first.nrz_records, first.nrr
+    section_bytes = 8 * len(freqs) * nsz * nrz * nrr
+
+    header = {"title": first.title,
+              "freqs": freqs.tolist(),
+              "shape": [nsz, nrz, nrr],
+              "axis_lengths": [len(first.sz), len(first.rz), len(first.rr)]}
+    # The offsets are part of the header, so size it with room for them, then fill them in
+    offsets = {"freq_major_offset": 0, "receiver_major_offset": 0, "axes_offset": 0}
+    header_length = len(json.dumps({**header, **offsets}).encode()) + 64
+    data_offset = -(-(SWEEP_PREFIX_BYTES + header_length) // SWEEP_ALIGNMENT) * SWEEP_ALIGNMENT
+    header["freq_major_offset"] = data_offset
+    header["receiver_major_offset"] = data_offset + section_bytes if receiver_major else None
+    header["axes_offset"] = data_offset + section_bytes * (2 if receiver_major else 1)
+    header_json = json.dumps(header).encode().ljust(data_offset - SWEEP_PREFIX_BYTES, b' ')
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(SWEEP_MAGIC + np.uint64(len(header_json)).astype('<u8').tobytes())
+        f.write(header_json)
+        # Frequency-major: stream one field at a time
+        for shd_path in paths:
+            shd = Read_SHD(shd_path)
+            if (shd.nsz, shd.nrz_records, shd.nrr) != (nsz, nrz, nrr):
+                raise ValueError(f"{shd_path} does not match the sweep grid.")
+            f.write(np.ascontiguousarray(shd.pressure[0, 0]).tobytes())
+        f.seek(header["axes_offset"])
+        for axis in (first.sz, first.rz, first.rr):
+            f.write(axis.astype('<f8').tobytes())
+
+    if receiver_major:
+        # Transpose blocks of receiver-depth rows: each block is read as Nfreq contiguous runs and written back as
+        # one contiguous run of the receiver-major section
+        freq_major = np.memmap(tmp_path, dtype=np.complex64, mode='r', offset=data_offset,
+                               shape=(len(freqs), nsz, nrz, nrr))
+        rec_major = np.memmap(tmp_path, dtype=np.complex64, mode='r+', offset=header["receiver_major_offset"],
+                              shape=(nsz, nrz, nrr, len(freqs)))
+        rows = max(1, SWEEP_BLOCK_BYTES // (8 * len(freqs) * nrr))
+        for isz in range(nsz):
+            for irz in range(0, nrz, rows):
+                block = np.array(freq_major[:, isz, irz:irz + rows])
+                rec_major[isz, irz:irz + rows] = block.transpose(1, 2, 0)
+        rec_major.flush()
+        del freq_major, rec_major
+
+    os.replace(tmp_path, path)
+    print(f".sweep file written: {path}")
+
+
+def read_sweep_header(filename):
+    with open(filename, 'rb') as f:
+        prefix = f.read(SWEEP_PREFIX_BYTES)
+        if not prefix.startswith(SWEEP_MAGIC):
+            raise ValueError(f"{filename} is not a sweep store.")
+        length = int(np.frombuffer(prefix[len(SWEEP_MAGIC):], dtype='<u8')[0])
+        raw = f.read(length)
+    return json.loads(raw.decode().strip())
+
+
+class Read_SWEEP:
+    def __init__(self, filename):
+        self.filename = filename
+        header = read_sweep_header(filename)
+        self.title = header["title"]
+        self.freqs = np.array(header["freqs"], dtype=np.float64)
+        self.nfreq = len(self.freqs)
+        self.ntheta = 1
+        self.nsz, self.nrz, self.nrr = header["shape"]
+        lengths = header["axis_lengths"]
+        axes = np.fromfile(filename, dtype='<f8', count=sum(lengths), offset=header["axes_offset"])
+        self.sz, self.rz, self.rr = np.split(axes, np.cumsum(lengths)[:-1])
+
+        freq_major = np.memmap(filename, dtype=np.complex64, mode='r', offset=header["freq_major_offset"],
+                               shape=(self.nfreq, self.nsz, self.nrz, self.nrr))
+        # Same (Nfreq, Ntheta, Nsz, Nrz, Nrr) layout as Read_SHD.pressure
+        self.pressure = freq_major[:, np.newaxis]
+        self.receiver_major = None
+        if header["receiver_major_offset"] is not None:
+            self.receiver_major = np.memmap(filename, dtype=np.complex64, mode='r',
+                                            offset=header["receiver_major_offset"],
+                                            shape=(self.nsz, self.nrz, self.nrr, self.nfreq))
+
+
+    def has_freq(self, freq):
+        return bool(np.any(np.abs(self.freqs - float(freq)) <= SWEEP_FREQ_TOLERANCE))
+
+
+    # Index of a stored frequency; a frequency the store does not hold raises instead of returning a neighbour
+    def freq_index(self, freq=None):
+        if freq is None:
+            return 0
+        i = int(np.argmin(np.abs(self.freqs - float(freq))))
+        if abs(self.freqs[i] - float(freq)) > SWEEP_FREQ_TOLERANCE:
+            raise KeyError(f"{self.filename} has no {float(freq)} Hz field.")
+        return i
+
+
+    # Pressure field (source depth x receiver depth x range) for one frequency
+    def field(self, freq=None):
+        return self.pressure[self.freq_index(freq), 0]
+
+
+    # Complex pressure at one receiver for every frequency
+    def receiver(self, irz, irr, isz=0):
+        if self.receiver_major is not None:
+            return np.array(self.receiver_major[isz, irz, irr])
+        return np.array(self.pressure[:, 0, isz, irz, irr])
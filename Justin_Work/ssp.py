@@ -0,0 +1,221 @@
+import numpy as np
+import scipy
+import scipy.io as io
+from io import BytesIO
+
+# MATLAB datenum of 1970-01-01
+DATENUM_UNIX_EPOCH = 719529
+# Site latitude of the ARMS CTD casts (degrees), used for the depth to pressure conversion
+ARMS_LATITUDE = 47.77
+
+
+# Mackenzie (1981) nine-term equation: temperature (C), salinity (PSU), depth (m) -> sound speed (m/s)
+def mackenzie(temperature, salinity, depth):
+    T, S, D = temperature, salinity, depth
+    return (1448.96 + 4.591 * T - 5.304e-2 * T**2 + 2.374e-4 * T**3 + 1.340 * (S - 35)
+            + 1.630e-2 * D + 1.675e-7 * D**2 - 1.025e-2 * T * (S - 35) - 7.139e-13 * T * D**3)
+
+
+# UNESCO (Chen and Millero 1977, Wong and Zhu 1995 ITS-90 coefficients): temperature (C), salinity (PSU),
+# pressure (dbar) -> sound speed (m/s). Matches the Sound_velocity in ARMS_firstDay_CTD_info.mat to 1 mm/s.
+def unesco(temperature, salinity, pressure):
+    T, S, P = temperature, salinity, pressure / 10   # bar
+    Cw = (1402.388 + 5.03830 * T - 5.81090e-2 * T**2 + 3.3432e-4 * T**3 - 1.47797e-6 * T**4 + 3.1419e-9 * T**5
+          + (0.153563 + 6.8999e-4 * T - 8.1829e-6 * T**2 + 1.3632e-7 * T**3 - 6.1260e-10 * T**4) * P
+          + (3.1260e-5 - 1.7111e-6 * T + 2.5986e-8 * T**2 - 2.5353e-10 * T**3 + 1.0415e-12 * T**4) * P**2
+          + (-9.7729e-9 + 3.8513e-10 * T - 2.3654e-12 * T**2) * P**3)
+    A = (1.389 - 1.262e-2 * T + 7.166e-5 * T**2 + 2.008e-6 * T**3 - 3.21e-8 * T**4
+         + (9.4742e-5 - 1.2583e-5 * T - 6.4928e-8 * T**2 + 1.0515e-8 * T**3 - 2.0142e-10 * T**4) * P
+         + (-3.9064e-7 + 9.1061e-9 * T - 1.6009e-10 * T**2 + 7.994e-12 * T**3) * P**2
+         + (1.100e-10 + 6.651e-12 * T - 3.391e-13 * T**2) * P**3)
+    B = -1.922e-2 - 4.42e-5 * T + (7.3637e-5 + 1.7950e-7 * T) * P
+    D = 1.727e-3 - 7.9836e-6 * P
+    return Cw + A * S + B * S**1.5 + D * S**2
+
+
+# Saunders (1981) depth (m) -> pressure (dbar)
+def depth_to_pressure(depth, latitude=ARMS_LATITUDE):
+    c1 = (5.92 + 5.25 * np.sin(np.radians(latitude))**2) * 1e-3
+    return ((1 - c1) - np.sqrt((1 - c1)**2 - 8.84e-6 * depth)) / 4.42e-6
+
+
+def sound_speed(temperature, salinity, depth, latitude=ARMS_LATITUDE, equation="unesco"):
+    if equation == "mackenzie":
+        return mackenzie(temperature, salinity, depth)
+    if equation == "unesco":
+        return unesco(temperature, salinity, depth_to_pressure(depth, latitude))
+    raise ValueError(f"Unknown sound speed equation: {equation}")
+
+
+# scipy's MAT 5 reader class. It is private (scipy.io.matlab._mio5 since scipy 1.8, scipy.io.matlab.mio5 before),
+# so it is only imported when a T-chain file is read, and a scipy without it fails with a clear error there.
+def mat5_reader_class():
+    try:
+        from scipy.io.matlab._mio5 import MatFile5Reader
+    except ImportError:
+        try:
+            from scipy.io.matlab.mio5 import MatFile5Reader
+        except ImportError:
+            raise ImportError(f"Reading T-chain datetimes needs scipy's MAT 5 reader (MatFile5Reader), which scipy "
+                              f"{scipy.__version__} does not provide; re-save the times as datenums in MATLAB "
+                              f"or use a scipy version that has it.") from None
+    return MatFile5Reader
+
+
+# Sample times of a T-chain file. They are saved as a MATLAB datetime object, which loadmat cannot decode; its
+# data (milliseconds since 1970, UTC) lives in the file's __function_workspace__, itself a headerless MAT stream.
+def mcos_datetime(mat, nsamples):
+    workspace = mat['__function_workspace__'].tobytes()
+    header = b'MATLAB 5.0 MAT-file'.ljust(116, b' ') + b'\x00' * 8 + workspace[:2] + workspace[2:4]
+    reader = mat5_reader_class()(BytesIO(header + workspace[8:]))
+    reader.mat_stream.seek(128)
+    reader.initialize_read()
+    var_header, _ = reader.read_var_header()
+    wrapper = reader.read_var_array(var_header, process=False)
+    for cell in wrapper['MCOS'][0, 0][0]['arr'].ravel():
+        data = np.asarray(cell)
+        if data.dtype.kind == 'f' and data.size == nsamples:
+            return np.asarray(data.real.ravel(), dtype=np.int64).astype('datetime64[ms]')
+    raise ValueError("No datetime data with one entry per sample in the MAT workspace.")
+
+
+# ProcessedTChain_Deploy*.dat: returns (times (datetime64[ms], nt), depth (m, nt x nsensors), temperature (C, nt x nsensors))
+def load_tchain(path):
+    mat = io.loadmat(path)
+    depth = np.asarray(mat['Depth'], dtype=np.float64)
+    temperature = np.asarray(mat['Temperature'], dtype=np.float64)
+    return mcos_datetime(mat, depth.shape[0]), depth, temperature
+
+
+# CTD.mat / CTD.dat casts as a list of dicts (time, depth, salinity, temperature, ssp). The Temperature field of
+# these files repeats Salinity, so temperature is None when it matches salinity and the cast's own SSP is used.
+def load_ctd(path):
+    ctd = io.loadmat(path, squeeze_me=True)['CTD']
+    times = np.atleast_1d(ctd['TimeUTC'].item())
+    casts = []
+    for i in range(len(times)):
+        field = lambda name: np.atleast_1d(np.asarray(np.atleast_1d(ctd[name].item())[i], dtype=np.float64))
+        salinity = field('Salinity')
+        temperature = field('Temperature')
+        casts.append({"time": np.datetime64(int(round((times[i] - DATENUM_UNIX_EPOCH) * 86400e3)), 'ms'),
+                      "depth": field('Depth'),
+                      "salinity": salinity,
+                      "temperature": None if np.allclose(temperature, salinity) else temperature,
+                      "ssp": field('SSP')})
+    return casts
+
+
+# Bin-averages scattered (time, depth) samples onto depth_grid (bin centers, m) and optional time bins (s).
+# Depth gaps between occupied bins are filled by linear interpolation along depth; bins outside the sampled
+# depth span stay NaN. Returns (bin times, grid) with one row per time bin that holds data.
+def bin_average(times, depths, values, depth_grid, time_bin=None):
+    depth_grid = np.asarray(depth_grid, dtype=np.float64)
+    nz = len(depth_grid)
+    edges = np.concatenate(([depth_grid[0] - (depth_grid[1] - depth_grid[0]) / 2],
+                            (depth_grid[1:] + depth_grid[:-1]) / 2,
+                            [depth_grid[-1] + (depth_grid[-1] - depth_grid[-2]) / 2]))
+    times = np.broadcast_to(np.asarray(times)[:, None], depths.shape)
+
+    t = (times - times.min()).astype('timedelta64[ms]').astype(np.int64)
+    if time_bin is None:
+        bin_starts, tbin = np.unique(t, return_inverse=True)
+    else:
+        tbin = t // int(time_bin * 1000)
+        bin_starts, tbin = np.unique(tbin, return_inverse=True)
+    tbin = tbin.reshape(depths.shape)
+    zbin = np.searchsorted(edges, depths) - 1
+    keep = (zbin >= 0) & (zbin < nz) & ~np.isnan(values)
+
+    index = tbin[keep] * nz + zbin[keep]
+    size = len(bin_starts) * nz
+    total = np.bincount(index, weights=values[keep], minlength=size)
+    count = np.bincount(index, minlength=size)
+    with np.errstate(invalid='ignore'):
+        grid = (total / count).reshape(len(bin_starts), nz)
+    bin_time = (np.bincount(tbin[keep], weights=t[keep], minlength=len(bin_starts))
+                / np.maximum(np.bincount(tbin[keep], minlength=len(bin_starts)), 1))
+    bin_time = times.min() + bin_time.astype(np.int64).astype('timedelta64[ms]')
+
+    # Linear fill between the nearest occupied bins above and below
+    valid = ~np.isnan(grid)
+    col = np.arange(nz)
+    above = np.maximum.accumulate(np.where(valid, col, -1), axis=1)
+    below = np.minimum.accumulate(np.where(valid, col, nz)[:, ::-1], axis=1)[:, ::-1]
+    gap = ~valid & (above >= 0) & (below < nz)
+    rows, cols = np.nonzero(gap)
+    a, b = above[rows, cols], below[rows, cols]
+    w = (depth_grid[cols] - depth_grid[a]) / (depth_grid[b] - depth_grid[a])
+    grid[rows, cols] = grid[rows, a] + w * (grid[rows, b] - grid[rows, a])
+
+    has_data = valid.any(axis=1)
+    return bin_time[has_data], grid[has_data]
+
+
+# Time-indexed sound speed profiles from the T-chain deployments and CTD casts.
+# T-chain temperatures get salinity from the CTD cast nearest in time (interpolated to each sensor's depth),
+# sound speed is computed for every depth x time sample at once, then bin-averaged onto depth_grid (and time_bin
+# seconds, if given). Depths outside the T-chain span are filled from the same cast's sound speed profile.
+# After build(), times (datetime64[ms]), depths and ssp (ntimes x ndepths) hold the series; profile(i) gives
+# (ssp_depths, ssp) for Write_TL / Write_RAY.
+class Build_SSP:
+    def __init__(self,
+                 tchain_files,               # List of ProcessedTChain_Deploy*.dat paths
+                 ctd_file,                   # CTD.mat (or CTD.dat) path
+                 depth_grid=None,            # Numpy array of depths (m), defaults to 1 m bins over the CTD casts
+                 time_bin=None,              # Time bin (seconds), None keeps every T-chain sample time
+                 latitude=ARMS_LATITUDE,
+                 equation="unesco"):         # "unesco" or "mackenzie"
+
+        self.tchain_files = tchain_files
+        self.ctd_file = ctd_file
+        self.depth_grid = depth_grid
+        self.time_bin = time_bin
+        self.latitude = latitude
+        self.equation = equation
+
+
+    # Sound speed of each cast on the depth grid (ncasts x ndepths)
+    def cast_profiles(self, casts, depth_grid):
+        profiles = np.zeros((len(casts), len(depth_grid)))
+        for i, cast in enumerate(casts):
+            if cast["temperature"] is not None:
+                ssp = sound_speed(cast["temperature"], cast["salinity"], cast["depth"], self.latitude, self.equation)
+            else:
+                ssp = cast["ssp"]
+            profiles[i] = np.interp(depth_grid, cast["depth"], ssp)
+        return profiles
+
+
+    def build(self):
+        casts = load_ctd(self.ctd_file)
+        depth_grid = self.depth_grid
+        if depth_grid is None:
+            depth_grid = np.arange(0.0, np.ceil(max(cast["depth"].max() for cast in casts)) + 1.0)
+        self.depths = np.asarray(depth_grid, dtype=np.float64)
+
+        records = [load_tchain(path) for path in self.tchain_files]
+        times = np.concatenate([r[0] for r in records])
+        depth = np.concatenate([r[1] for r in records])
+        temperature = np.concatenate([r[2] for r in records])
+
+        # Nearest cast in time for every sample, and its salinity at every sensor depth
+        cast_times = np.array([cast["time"] for cast in casts])
+        nearest = np.abs(times[:, None] - cast_times[None, :]).argmin(axis=1)
+        salinity = np.zeros_like(depth)
+        for i, cast in enumerate(casts):
+            rows = nearest == i
+            salinity[rows] = np.interp(depth[rows], cast["depth"], cast["salinity"])
+
+        speed = sound_speed(temperature, salinity, depth, self.latitude, self.equation)
+        self.times, self.ssp = bin_average(times, depth, speed, self.depths, self.time_bin)
+
+        # Outside the T-chain span: the cast nearest to each profile
+        profiles = self.cast_profiles(casts, self.depths)
+        nearest = np.abs(self.times[:, None] - cast_times[None, :]).argmin(axis=1)
+        self.ssp = np.where(np.isnan(self.ssp), profiles[nearest], self.ssp)
+        self.casts = casts
+        return self.times, self.depths, self.ssp
+
+
+    def profile(self, i):
+        return self.depths, self.ssp[i]
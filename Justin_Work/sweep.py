@@ -0,0 +1,298 @@
+import os
+import sys
+import copy
+import time
+import subprocess
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+root_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(root_dir)
+from Justin_Work.shd import Read_SHD
+
+
+# Filename tag for a frequency, matching the sweep naming (e.g. arms_1_tl_2000)
+def freq_tag(freq):
+    freq = float(freq)
+    if freq.is_integer():
+        return str(int(freq))
+    return str(freq)
+
+
+# Writes one configuration's input files into its own directory and runs BELLHOP on it.
+# Runs inside a pool worker, so file generation for one job overlaps with BELLHOP runs of the others.
+# With a Run_Cache, identical environments are served from the cache instead of re-running BELLHOP; the
+# lookup result is returned in status["cache"] ("hit", "miss" or None) for the parent's Run_Cache.record().
+# Outputs left at the base path by an earlier run are removed first, so only this run's output is reported.
+def run_bellhop(config, bellhop_executable, dimension="-2D", timeout=None, cache=None):
+    start = time.time()
+    os.makedirs(config.dir, exist_ok=True)
+    base_path = os.path.join(config.dir, config.filename)
+    status = {"freq": config.freq,
+              "dir": config.dir,
+              "filename": config.filename,
+              "status": "failed",
+              "returncode": None,
+              "message": "",
+              "cache": None,
+              "wall_time": 0.0}
+    try:
+        for ext in (".shd", ".ray", ".arr"):
+            if os.path.exists(base_path + ext):
+                os.remove(base_path + ext)
+        config.write_files()
+        key = None
+        if cache is not None:
+            key = cache.key(config, bellhop_executable, dimension)
+            output = cache.fetch(key, base_path)
+            status["cache"] = "miss" if output is None else "hit"
+            if output is not None:
+                status["status"] = "cached"
+                status["returncode"] = 0
+                status["output"] = output
+                status["wall_time"] = time.time() - start
+                return status
+        run_start = time.time()
+        result = subprocess.run([bellhop_executable, dimension, base_path],
+                                cwd=config.dir,
+                                capture_output=True,
+                                text=True,
+                                timeout=timeout)
+        status["returncode"] = result.returncode
+        if result.returncode == 0:
+            status["status"] = "ok"
+            if cache is not None:
+                cache.store(key, base_path, since=run_start)
+        else:
+            status["message"] = (result.stderr or result.stdout)[-2000:]
+    except subprocess.TimeoutExpired:
+        status["status"] = "timeout"
+    except Exception as e:
+        status["message"] = str(e)
+
+    for ext in (".shd", ".ray", ".arr"):
+        if os.path.exists(base_path + ext):
+            status["output"] = base_path + ext
+            break
+    else:
+        status["output"] = None
+        if status["status"] == "ok":
+            status["status"] = "failed"
+            status["message"] = "BELLHOP finished without writing an output file"
+
+    status["wall_time"] = time.time() - start
+    return status
+
+
+# Runs BELLHOP on every configuration in a process pool, printing each job as it finishes (with notes[k] in
+# the progress line when given). Returns the status dicts in configuration order and records the cache lookups.
+def run_jobs(configs, bellhop_executable, processes=None, dimension="-2D", timeout=None, cache=None, notes=None):
+    statuses = [None] * len(configs)
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        futures = {pool.submit(run_bellhop, config, bellhop_executable, dimension, timeout, cache): k
+                   for k, config in enumerate(configs)}
+        for done, future in enumerate(as_completed(futures), start=1):
+            k = futures[future]
+            status = future.result()
+            statuses[k] = status
+            note = f"{notes[k]}, " if notes is not None else ""
+            print(f"[{done}/{len(futures)}] {status['filename']}: {status['status']} "
+                  f"({note}{status['wall_time']:.1f} s)")
+    if cache is not None:
+        cache.record(statuses)
+    return statuses
+
+
+class Sweep_TL:
+    def __init__(self,
+                 base,                       # Write_TL (or Write_RAY) configuration shared by every frequency
+                 freqs,                      # Numpy array of frequencies (Hz)
+                 bellhop_executable,         # Path to bellhopcxx
+                 work_dir=None,              # Root directory for the per-frequency job directories
+                 processes=None,             # Number of worker processes (defaults to all cores)
+                 dimension="-2D",
+                 timeout=None,               # Per-job timeout (seconds)
+                 cache=None):                # Optional Run_Cache shared by the workers
+
+        self.base = base
+        self.freqs = np.atleast_1d(freqs)
+        self.bellhop_executable = bellhop_executable
+        self.work_dir = work_dir if work_dir is not None else base.dir
+        self.processes = processes if processes is not None else os.cpu_count()
+        self.dimension = dimension
+        self.timeout = timeout
+        self.cache = cache
+        self.jobs = []
+        self.manifest = {}
+
+
+    # Configuration for one frequency, written to <work_dir>/<filename>_<freq>/<filename>_<freq>.*
+    def job_config(self, freq):
+        config = copy.copy(self.base)
+        config.freq = freq
+        config.filename = self.base.filename + "_" + freq_tag(freq)
+        config.dir = os.path.join(self.work_dir, config.filename)
+        return config
+
+
+    # Runs every frequency over the process pool and returns {freq: .shd path} for the successful jobs
+    def run(self):
+        configs = [self.job_config(freq) for freq in self.freqs]
+        sweep_start = time.time()
+        jobs = run_jobs(configs, self.bellhop_executable, self.processes, self.dimension, self.timeout, self.cache)
+        self.jobs = sorted(jobs, key=lambda job: float(job["freq"]))
+        self.manifest = {float(job["freq"]): job["output"] for job in self.jobs if job["status"] in ("ok", "cached")}
+        n_cached = sum(job["status"] == "cached" for job in self.jobs)
+        print(f"Sweep finished: {len(self.manifest)}/{len(configs)} jobs ok ({n_cached} from cache) in {time.time() - sweep_start:.1f} s")
+        return self.manifest
+
+
+# Band-smoothed TL (dB) of one frequency: |p|^2 averaged over block (depth, range) cells, so the comparison
+# between frequencies follows the band-level structure rather than the interference fine structure
+def block_tl(shd_path, freq, block=(32, 32), isz=0):
+    shd = Read_SHD(shd_path)
+    power = np.abs(shd.pressure[shd.freq_index(freq), 0, isz]).astype(np.float64)**2
+    nz, nr = (power.shape[0] // block[0]) * block[0], (power.shape[1] // block[1]) * block[1]
+    power = power[:nz, :nr].reshape(nz // block[0], block[0], nr // block[1], block[1]).mean(axis=(1, 3))
+    with np.errstate(divide='ignore'):
+        return (-10 * np.log10(power)).astype(np.float32)
+
+
+# RMS difference (dB) between two TL fields over the cells that are finite in both
+def field_difference(a, b):
+    with np.errstate(invalid='ignore'):
+        d = a - b
+    finite = np.isfinite(d)
+    if not finite.any():
+        return np.inf
+    return float(np.sqrt(np.mean(d[finite]**2)))
+
+
+# Adaptive frequency sampling between f_min and f_max.
+# Starts from n_initial frequencies and, round by round, runs BELLHOP at the midpoints of the neighbouring
+# pairs whose block-smoothed TL fields differ by more than tolerance (dB RMS), largest difference first, until
+# every interval agrees or the budget (total runs) is spent. New frequencies are snapped to the resolution
+# grid, so an interval one grid step wide is never split. A first round larger than the budget is thinned to
+# budget frequencies spread over the band. Frequencies whose run failed are listed in self.failed; intervals
+# next to them are neither compared nor interpolated across.
+class Adaptive_Sweep_TL(Sweep_TL):
+    def __init__(self,
+                 base,                       # Write_TL configuration shared by every frequency
+                 f_min,                      # Band edges (Hz)
+                 f_max,
+                 bellhop_executable,         # Path to bellhopcxx
+                 n_initial=9,                # Number of frequencies in the first round
+                 tolerance=1.0,              # Neighbouring field difference (dB RMS) above which to refine
+                 budget=None,                # Maximum number of BELLHOP runs (defaults to the full resolution grid)
+                 resolution=100.0,           # Frequency grid (Hz) that sampled frequencies are snapped to
+                 block=(32, 32),             # Cells averaged per (depth, range) block in the field comparison
+                 work_dir=None,
+                 processes=None,
+                 dimension="-2D",
+                 timeout=None,
+                 cache=None):
+
+        self.resolution = resolution
+        initial = np.unique(self.snap(np.linspace(f_min, f_max, n_initial)))
+        super().__init__(base, initial, bellhop_executable, work_dir, processes, dimension, timeout, cache)
+        self.f_min, self.f_max = initial[0], initial[-1]
+        self.tolerance = tolerance
+        self.budget = budget if budget is not None else int(round((self.f_max - self.f_min) / resolution)) + 1
+        if len(initial) > self.budget:
+            self.freqs = initial[np.unique(np.round(np.linspace(0, len(initial) - 1, self.budget)).astype(np.int64))]
+        self.block = block
+        self.fields = {}
+        self.failed = np.zeros(0)
+
+
+    def snap(self, freqs):
+        return np.round(np.asarray(freqs, dtype=np.float64) / self.resolution) * self.resolution
+
+
+    # Runs the refinement rounds and returns {freq: .shd path} for every sampled frequency
+    def run(self):
+        batch = self.freqs
+        attempted = set()
+        jobs, manifest = [], {}
+        differences = {}
+        sweep_start = time.time()
+
+        while len(batch) > 0:
+            self.freqs = np.asarray(batch)
+            attempted.update(float(f) for f in batch)
+            Sweep_TL.run(self)
+            jobs.extend(self.jobs)
+            manifest.update(self.manifest)
+            for freq, path in self.manifest.items():
+                self.fields[freq] = block_tl(path, freq, self.block)
+
+            # Midpoints of the disagreeing neighbours, largest difference first. Neighbours are taken over every
+            # attempted frequency, so the two sides of a failed run are never compared with each other.
+            sampled = sorted(attempted)
+            candidates = []
+            for a, b in zip(sampled[:-1], sampled[1:]):
+                if a not in self.fields or b not in self.fields:
+                    continue
+                if (a, b) not in differences:
+                    differences[(a, b)] = field_difference(self.fields[a], self.fields[b])
+                mid = float(self.snap((a + b) / 2))
+                if differences[(a, b)] > self.tolerance and a < mid < b and mid not in attempted:
+                    candidates.append((differences[(a, b)], mid))
+            candidates.sort(reverse=True)
+            batch = [mid for _, mid in candidates[:max(self.budget - len(attempted), 0)]]
+
+        self.jobs = sorted(jobs, key=lambda job: float(job["freq"]))
+        self.manifest = dict(sorted(manifest.items()))
+        self.freqs = np.array(list(self.manifest))
+        self.failed = np.array(sorted(f for f in attempted if f not in self.manifest))
+        print(f"Adaptive sweep finished: {len(self.manifest)} frequencies ({len(attempted)} runs of a "
+              f"{self.budget}-run budget) in {time.time() - sweep_start:.1f} s")
+        if len(self.failed):
+            print(f"{len(self.failed)} frequencies failed and are left out: {', '.join(f'{f:g}' for f in self.failed)} Hz")
+        return self.manifest
+
+
+    # True for each sampled interval (a, b) that has a failed frequency inside it
+    def spans_failure(self, freqs):
+        freqs = np.asarray(freqs, dtype=np.float64)
+        return np.array([np.any((self.failed > a) & (self.failed < b)) for a, b in zip(freqs[:-1], freqs[1:])],
+                        dtype=bool)
+
+
+    # Interpolation error estimate of the sampled sweep.
+    # Each interior frequency is predicted by linear interpolation (in dB) of its two neighbours, and the RMS
+    # error of that prediction is taken as the error of interpolating inside the intervals next to it (the larger
+    # of an interval's two ends). This is conservative for smooth fields, whose error shrinks with the interval
+    # width, and about right once the smoothed fields decorrelate between samples.
+    # Returns freqs, the neighbour differences and error estimate per interval (dB RMS), and the per-frequency
+    # leave-one-out error (NaN at the band edges). Intervals with a failed frequency inside are NaN throughout.
+    def interpolation_error(self):
+        freqs = np.array(sorted(self.fields))
+        fields = [self.fields[f] for f in freqs]
+        gap = self.spans_failure(freqs)
+        differences = np.array([np.nan if gap[i] else field_difference(a, b)
+                                for i, (a, b) in enumerate(zip(fields[:-1], fields[1:]))])
+
+        loo = np.full(len(freqs), np.nan)
+        for i in range(1, len(freqs) - 1):
+            if gap[i - 1] or gap[i]:
+                continue
+            w = (freqs[i] - freqs[i - 1]) / (freqs[i + 1] - freqs[i - 1])
+            loo[i] = field_difference(fields[i], (1 - w) * fields[i - 1] + w * fields[i + 1])
+
+        return {"freqs": freqs,
+                "difference": differences,
+                "error": np.where(gap, np.nan, np.fmax(loo[:-1], loo[1:])),
+                "leave_one_out": loo}
+
+
+    # Block-smoothed TL (dB) at any frequency in the band, linearly interpolated between the sampled fields.
+    # Raises ValueError inside an interval that has a failed frequency in it.
+    def interpolated_tl(self, freq):
+        freqs = np.array(sorted(self.fields))
+        i = int(np.clip(np.searchsorted(freqs, freq) - 1, 0, len(freqs) - 2))
+        if self.spans_failure(freqs[i:i + 2])[0]:
+            raise ValueError(f"No interpolated field at {freq} Hz: a run between {freqs[i]:g} and {freqs[i + 1]:g} Hz failed.")
+        w = (freq - freqs[i]) / (freqs[i + 1] - freqs[i])
+        return (1 - w) * self.fields[freqs[i]] + w * self.fields[freqs[i + 1]]
+
@@ -4,8 +4,12 @@ import os
 import sys
 root_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 sys.path.append(root_dir)
-from pyat.pyat.readwrite import *
-import matplotlib.animation as animation
+from Justin_Work.shd import Read_SHD, Read_SWEEP
+from Justin_Work.sweep import freq_tag
+import subprocess
+import multiprocessing
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 
 class Write_TL:
     def __init__(self, 
@@ -99,21 +103,21 @@ class Write_TL:
             f.write("\n")
             f.write(f"{self.nsd}\t\t\t! NSD: Number of source depths\n")
             for i in range(len(self.sd)):
-                if i is len(self.sd)-1:
+                if i == len(self.sd)-1:
                     f.write(f"{self.sd[i]:.1f} /\t\t\t! Source depth (m)\n")
                 else:
-                    f.write(f"{self.sd[i]:.1f} /")
+                    f.write(f"{self.sd[i]:.1f} ")
             f.write("\n")
             f.write(f"{self.nrd}\t\t\t! NRD: Number of receiver depths\n")
             for i in range(len(self.rd)):
-                if i is len(self.rd)-1:
+                if i == len(self.rd)-1:
                     f.write(f"{self.rd[i]:.1f} /\t\t\t! Receiver depths (m)\n")
                 else:
                     f.write(f"{self.rd[i]:.1f} ")
             f.write("\n")
             f.write(f"{self.nrr}\t\t\t! NR: Number of ranges\n")
             for i in range(len(self.rr)):
-                if i is len(self.rr)-1:
+                if i == len(self.rr)-1:
                     f.write(f"{self.rr[i]:.1f} /\t\t\t! Range values (km)\n")
                 else:
                     f.write(f"{self.rr[i]:.1f} ")
@@ -180,114 +184,287 @@ class Read_TL:
                  output_directory,
                  tl_file,
                  freqs,  # renamed to plural for clarity
-                 bath_ranges):
+                 bath_ranges,
+                 manifest=None):   # Optional {freq: .shd path} from Sweep_TL.run()
         
         self.dir = directory
         self.output_directory = output_directory
         self.tl_file = tl_file
         self.freqs = freqs
         self.bath_ranges = bath_ranges
+        self.manifest = manifest
+        self.shd_files = {}   # Opened .shd readers, keyed on path (header is parsed once per file)
     
 
+    # Opens a .shd file, or a consolidated .sweep store (same pressure layout)
+    def open_shd(self, filename):
+        if filename not in self.shd_files:
+            if filename.endswith(".sweep"):
+                self.shd_files[filename] = Read_SWEEP(filename)
+            else:
+                self.shd_files[filename] = Read_SHD(filename)
+        return self.shd_files[filename]
+
+
+    # Pressure file for one frequency: the sweep manifest if given, else a consolidated <tl_file>.sweep store
+    # that holds the frequency, else the per-frequency sweep file (e.g. arms_1_tl_2000.shd), else the single-run file
+    def shd_path(self, freq):
+        if self.manifest is not None and float(freq) in self.manifest:
+            return self.manifest[float(freq)]
+        store_file = f"{self.dir}{self.tl_file}.sweep"
+        if os.path.exists(store_file) and self.open_shd(store_file).has_freq(freq):
+            return store_file
+        sweep_file = f"{self.dir}{self.tl_file}_{freq_tag(freq)}.shd"
+        if os.path.exists(sweep_file):
+            return sweep_file
+        return f"{self.dir}{self.tl_file}.shd"
+
+
     def read_shd(self, freq):
-        # Assuming file naming changes with frequency, e.g., arms_1_tl_100.shd
-        filename = f"{self.dir}{self.tl_file}.shd"
-        _, _, _, _, _, pressure = read_shd(filename, freq)
-        return pressure
+        shd = self.open_shd(self.shd_path(freq))
+        # Memory-mapped view (Ntheta, Nsz, Nrz, Nrr); bytes are only read when sliced
+        return shd.pressure[shd.freq_index(freq)]
+
+
+    # Band-averaged TL over the sweep, streamed one frequency at a time.
+    # Incoherent TL is -10 log10 of the weighted mean |p|^2; coherent TL uses |weighted mean of p|^2. The per-cell
+    # min/max/variance are of the single-frequency TL (-20 log10 |p|). Everything is accumulated in place in
+    # float32/complex64 buffers (five float32 accumulators, one complex64 sum and two float32 scratch fields, about
+    # 37 bytes per cell on top of the complex64 field being read), however many frequencies there are: a 501 x 1001
+    # grid peaks at about 23 MB. Weights are power weights per frequency; alternatively
+    # source_spectrum=(freq_points, level_dB), e.g. the ARMS source level curve, is interpolated onto the sweep.
+    def broadband_tl(self, freqs=None, weights=None, source_spectrum=None, isz=0):
+        freqs = np.asarray(self.freqs if freqs is None else freqs, dtype=np.float64)
+        if source_spectrum is not None:
+            weights = 10 ** (np.interp(freqs, source_spectrum[0], source_spectrum[1]) / 10)
+        elif weights is None:
+            weights = np.ones(len(freqs))
+        weights = np.asarray(weights, dtype=np.float64)
+        if len(weights) != len(freqs):
+            raise ValueError("weights and freqs must have the same length.")
+
+        power_sum = None
+        for k, freq in enumerate(freqs):
+            p = self.read_shd(freq)[0, isz]
+            w = np.float32(weights[k])
+
+            if power_sum is None:
+                shape = p.shape
+                power_sum = np.zeros(shape, dtype=np.float32)
+                coherent_sum = np.zeros(shape, dtype=np.complex64)
+                tl_min = np.full(shape, np.inf, dtype=np.float32)
+                tl_max = np.full(shape, -np.inf, dtype=np.float32)
+                tl_mean = np.zeros(shape, dtype=np.float32)
+                tl_m2 = np.zeros(shape, dtype=np.float32)
+                tl_weight = np.zeros(shape, dtype=np.float32)
+                tl = np.empty(shape, dtype=np.float32)
+                delta = np.empty(shape, dtype=np.float32)
+                finite = np.empty(shape, dtype=bool)
+
+            # Coherent sum, one component at a time through the scratch buffer
+            np.multiply(p.real, np.sqrt(w), out=delta)
+            coherent_sum.real += delta
+            np.multiply(p.imag, np.sqrt(w), out=delta)
+            coherent_sum.imag += delta
+
+            np.abs(p, out=tl)
+            np.square(tl, out=tl)
+            np.multiply(tl, w, out=delta)
+            power_sum += delta
+            with np.errstate(divide='ignore'):
+                np.log10(tl, out=tl)
+            tl *= -10
+
+            # Cells with zero pressure have infinite TL; they are left out of the TL statistics, which are
+            # weighted by the frequencies each cell actually has a finite TL at (West's running variance, with
+            # tl - new mean written as delta * (1 - w / W))
+            np.isfinite(tl, out=finite)
+            np.minimum(tl_min, tl, out=tl_min, where=finite)
+            np.maximum(tl_max, tl, out=tl_max, where=finite)
+            np.add(tl_weight, w, out=tl_weight, where=finite)
+            np.subtract(tl, tl_mean, out=delta, where=finite)
+            np.divide(w, tl_weight, out=tl, where=finite)
+            np.multiply(delta, tl, out=tl, where=finite)
+            np.add(tl_mean, tl, out=tl_mean, where=finite)
+            np.subtract(delta, tl, out=tl, where=finite)
+            np.multiply(tl, delta, out=tl, where=finite)
+            np.multiply(tl, w, out=tl, where=finite)
+            np.add(tl_m2, tl, out=tl_m2, where=finite)
+
+        weight_sum = np.sum(weights)
+        with np.errstate(divide='ignore'):
+            power_sum /= weight_sum
+            incoherent = np.log10(power_sum, out=power_sum)
+            incoherent *= -10
+            np.abs(coherent_sum, out=tl)
+            tl /= np.sum(np.sqrt(weights))
+            coherent = np.log10(tl, out=tl)
+            coherent *= -20
+
+        # Cells that are silent at every frequency have no TL statistics
+        silent = tl_weight == 0
+        tl_min[silent] = np.inf
+        tl_max[silent] = np.inf
+        variance = np.divide(tl_m2, tl_weight, out=tl_m2, where=~silent)
+        variance[silent] = np.nan
+
+        return {"incoherent": incoherent,
+                "coherent": coherent,
+                "min": tl_min,
+                "max": tl_max,
+                "variance": variance}
+
+
+    # Relative TL (dB re. the field maximum) as a (receiver depth x range) float32 array
+    def relative_tl(self, pressure):
+        pressure = np.abs(np.squeeze(pressure)).astype(np.float32)
+        with np.errstate(divide='ignore'):
+            return 10 * np.log10(pressure / np.max(pressure))
+
+
+    # Decimated TL pyramid: level 0 is the full grid, each further level halves both axes keeping the
+    # (min, max) of every 2x2 block, down to a level that fits inside min_shape
+    def tl_pyramid(self, tl, min_shape=(64, 64)):
+        levels = [(tl, tl)]
+        lo, hi = tl, tl
+        while lo.shape[0] > min_shape[0] or lo.shape[1] > min_shape[1]:
+            # Pad odd axes by repeating the edge so every block is complete
+            pad = ((0, lo.shape[0] % 2), (0, lo.shape[1] % 2))
+            lo = np.pad(lo, pad, mode='edge')
+            hi = np.pad(hi, pad, mode='edge')
+            nz, nr = lo.shape[0] // 2, lo.shape[1] // 2
+            lo = lo.reshape(nz, 2, nr, 2).min(axis=(1, 3))
+            hi = hi.reshape(nz, 2, nr, 2).max(axis=(1, 3))
+            levels.append((lo, hi))
+        return levels
+
+
+    # Finest pyramid level that is no larger than the axes in screen pixels
+    def screen_level(self, levels, ax, mode='max'):
+        bbox = ax.get_window_extent()
+        width, height = max(int(bbox.width), 1), max(int(bbox.height), 1)
+        for lo, hi in levels:
+            if lo.shape[0] <= height and lo.shape[1] <= width:
+                break
+        return hi if mode == 'max' else lo
+
+
+    # Fast preview: imshow of the pyramid level matching the axes resolution
+    def draw_tl_preview(self, ax, tl, mode='max'):
+        image = self.screen_level(self.tl_pyramid(tl), ax, mode=mode)
+        n_depth_pts, n_range_pts = tl.shape
+        return ax.imshow(image, cmap='viridis', vmin=-30, vmax=0, aspect='auto', interpolation='nearest',
+                         extent=[0, n_range_pts - 1, n_depth_pts - 1, 0])
+
+
+    def set_range_ticks(self, ax, n_range_pts):
+        interpolated_ranges = np.linspace(self.bath_ranges[0], self.bath_ranges[-1], n_range_pts)
+        tick_locs = np.linspace(0, n_range_pts - 1, 6, dtype=int)
+        tick_labels = [f"{interpolated_ranges[i]:.1f}" for i in tick_locs]
+        ax.set_xticks(tick_locs)
+        ax.set_xticklabels(tick_labels)
 
 
-    def plot_frame(self, ax, pressure, freq):
+    # publication=True draws the full-resolution contourf; otherwise a screen-resolution preview
+    def plot_frame(self, ax, pressure, freq, publication=False):
         ax.clear()
-        pressure = abs(pressure)
-        pressure = 10 * np.log10(pressure / np.max(pressure))
-        levs = np.linspace(-30, 0, 31)
+        tl = self.relative_tl(pressure)
 
-        im = ax.contourf(np.squeeze(pressure), levels=levs, cmap='viridis')
-        ax.invert_yaxis()
+        if publication:
+            levs = np.linspace(-30, 0, 31)
+            im = ax.contourf(tl, levels=levs, cmap='viridis')
+            ax.invert_yaxis()
+        else:
+            im = self.draw_tl_preview(ax, tl)
 
         ax.set_title(f"{self.tl_file}, Frequency: {freq/1000:.1f} kHz")
         ax.set_xlabel("Range (km)")
         ax.set_ylabel("Depth (m)")
 
         # Tick labeling
-        n_range_pts = pressure.shape[-1]
-        interpolated_ranges = np.linspace(self.bath_ranges[0], self.bath_ranges[-1], n_range_pts)
-        tick_locs = np.linspace(0, n_range_pts - 1, 6, dtype=int)
-        tick_labels = [f"{interpolated_ranges[i]:.1f}" for i in tick_locs]
-        ax.set_xticks(tick_locs)
-        ax.set_xticklabels(tick_labels)
+        self.set_range_ticks(ax, tl.shape[-1])
 
         return im
 
 
-    def tl_animate(self):
-        fig, ax = plt.subplots(figsize=(12, 8))
-        cbar_ax = fig.add_axes([0.91, 0.15, 0.02, 0.7])  # position of colorbar
-        contour = [None]  # to store the contour handle for colorbar
-
-        def update(frame_idx):
-            ax.clear()
-            freq = self.freqs[frame_idx]
-            pressure = self.read_shd(freq)
-
-            pressure = abs(pressure)
-            pressure = 10 * np.log10(pressure / np.max(pressure))
-            levs = np.linspace(-30, 0, 31)
+    # Small preview image of one sweep frequency, e.g. for contact sheets
+    def plot_thumbnail(self, pressure, freq, path, width=4.0, height=2.5, dpi=100):
+        fig = Figure(figsize=(width, height), dpi=dpi)
+        FigureCanvasAgg(fig)
+        ax = fig.add_axes([0, 0, 1, 1])
+        ax.set_axis_off()
+        self.draw_tl_preview(ax, self.relative_tl(pressure))
+        ax.text(0.02, 0.95, f"{freq/1000:.1f} kHz", transform=ax.transAxes, va='top', color='white')
+        fig.savefig(path, dpi=dpi)
 
-            cs = ax.contourf(np.squeeze(pressure), levels=levs, cmap='viridis')
-            ax.invert_yaxis()
-            ax.set_title(f"{self.tl_file}, Frequency: {freq/1000:.1f} kHz")
-            ax.set_xlabel("Range (km)")
-            ax.set_ylabel("Depth (m)")
-
-            # Set x-ticks
-            n_range_pts = pressure.shape[-1]
-            interpolated_ranges = np.linspace(self.bath_ranges[0], self.bath_ranges[-1], n_range_pts)
-            tick_locs = np.linspace(0, n_range_pts - 1, 6, dtype=int)
-            tick_labels = [f"{interpolated_ranges[i]:.1f}" for i in tick_locs]
-            ax.set_xticks(tick_locs)
-            ax.set_xticklabels(tick_labels)
-
-            # Update colorbar
-            cbar_ax.clear()
-            fig.colorbar(cs, cax=cbar_ax, label="Relative TL (dB)")
-
-            return cs.collections
-
-        anim = animation.FuncAnimation(
-            fig, update,
-            frames=len(self.freqs),
-            blit=False,
-            repeat=False
-        )
 
+    # Renders the sweep frames in a process pool (headless Agg, each worker reads only its own frequency) and
+    # streams them in order into a single ffmpeg stdin pipe
+    def tl_animate(self, processes=None, fps=5, dpi=100, publication=False, ffmpeg="ffmpeg"):
         output_path = f"{self.output_directory}{self.tl_file}_sweep.mp4"
-        anim.save(output_path, writer='ffmpeg', fps=5)
+        jobs = [(self.dir, self.output_directory, self.tl_file, self.bath_ranges,
+                 self.shd_path(freq), freq, dpi, publication) for freq in self.freqs]
+
+        # First frame fixes the video size
+        first = render_tl_frame(jobs[0])
+        width, height = first[0], first[1]
+        command = [ffmpeg, "-y", "-loglevel", "error",
+                   "-f", "rawvideo", "-pix_fmt", "rgba", "-s", f"{width}x{height}", "-r", str(fps),
+                   "-i", "-",
+                   "-c:v", "libx264", "-pix_fmt", "yuv420p", output_path]
+        pipe = subprocess.Popen(command, stdin=subprocess.PIPE)
+        try:
+            pipe.stdin.write(first[2])
+            with multiprocessing.Pool(processes=processes) as pool:
+                for done, (_, _, frame) in enumerate(pool.imap(render_tl_frame, jobs[1:]), start=2):
+                    pipe.stdin.write(frame)
+                    print(f"Frame {done}/{len(jobs)}")
+        finally:
+            pipe.stdin.close()
+            pipe.wait()
+        if pipe.returncode != 0:
+            raise RuntimeError(f"ffmpeg exited with code {pipe.returncode}")
         print(f"Saved animation to {output_path}")
 
-    def plot_tl(self, pressure):
-        pressure = abs(pressure)
-        pressure = 10 * np.log10(pressure / np.max(pressure))
-        levs = np.linspace(-30, 0, 31)
+    # Interactive preview by default; publication=True renders the full-resolution contourf at 300 dpi
+    def plot_tl(self, pressure, publication=False):
+        tl = self.relative_tl(pressure)
 
         plt.figure(figsize=(12, 8))
-        plt.contourf(np.squeeze(pressure), levels=levs, cmap='viridis')
-        plt.colorbar(label="Relative TL (dB)")
-        plt.gca().set_aspect('auto')
+        ax = plt.gca()
+        if publication:
+            levs = np.linspace(-30, 0, 31)
+            im = plt.contourf(tl, levels=levs, cmap='viridis')
+        else:
+            im = self.draw_tl_preview(ax, tl)
+        plt.colorbar(im, label="Relative TL (dB)")
+        ax.set_aspect('auto')
         plt.tight_layout()
-        plt.gca().invert_yaxis()
+        if publication:
+            ax.invert_yaxis()
 
         plt.title(f"{self.tl_file}, Frequency: {self.freqs[0]/1000:.1f} kHz")
         plt.xlabel("Range (km)")
         plt.ylabel("Depth (m)")
 
         # Tick labeling
-        ax = plt.gca()
-        n_range_pts = pressure.shape[-1]
-        interpolated_ranges = np.linspace(self.bath_ranges[0], self.bath_ranges[-1], n_range_pts)
-        tick_locs = np.linspace(0, n_range_pts - 1, 6, dtype=int)
-        tick_labels = [f"{interpolated_ranges[i]:.1f}" for i in tick_locs]
-        ax.set_xticks(tick_locs)
-        ax.set_xticklabels(tick_labels)
-        plt.savefig(self.output_directory + self.tl_file + ".png", dpi=300)
-        
+        self.set_range_ticks(ax, tl.shape[-1])
+        plt.savefig(self.output_directory + self.tl_file + ".png", dpi=300 if publication else 100)
+
+
+# Renders one sweep frame off-screen and returns (width, height, RGBA bytes); runs in tl_animate's pool workers
+def render_tl_frame(job):
+    directory, output_directory, tl_file, bath_ranges, shd_path, freq, dpi, publication = job
+    reader = Read_TL(directory, output_directory, tl_file, [freq], bath_ranges)
+    shd = reader.open_shd(shd_path)
+    pressure = shd.pressure[shd.freq_index(freq)]
+
+    fig = Figure(figsize=(12, 8), dpi=dpi)
+    canvas = FigureCanvasAgg(fig)
+    ax = fig.add_axes([0.08, 0.1, 0.8, 0.8])
+    cbar_ax = fig.add_axes([0.91, 0.15, 0.02, 0.7])  # position of colorbar
+    im = reader.plot_frame(ax, pressure, freq, publication=publication)
+    fig.colorbar(im, cax=cbar_ax, label="Relative TL (dB)")
+    canvas.draw()
+    width, height = canvas.get_width_height()
+    return width, height, bytes(canvas.buffer_rgba())
@@ -0,0 +1,119 @@
+import os
+import stat
+import sys
+
+# The package modules import each other as Justin_Work.<module>
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+import pytest
+
+from Justin_Work.tl import Write_TL
+
+
+# Writes a BELLHOP shade file in the layout Read_SHD parses (see shd.py); pressure is (Nfreq, Ntheta, Nsz, Nrz, Nrr)
+def write_shd(path, pressure, freqs, sz, rz, rr, theta=(0.0,), title="test", plot_type="rectilin  "):
+    pressure = np.asarray(pressure, dtype=np.complex64)
+    nfreq, ntheta, nsz, nrz, nrr = pressure.shape
+    recl = max(2 * nrr, 2 * nfreq, 2 * ntheta, nsz, nrz, nrr, 32)
+    records = [np.array([recl], '<i4').tobytes() + title.ljust(80).encode(),
+               plot_type.ljust(10).encode(),
+               np.array([nfreq, ntheta, 1, 1, nsz, nrz, nrr], '<i4').tobytes() + np.array([freqs[0], 0.0], '<f4').tobytes(),
+               np.asarray(freqs, '<f8').tobytes(),
+               np.asarray(theta, '<f8').tobytes(),
+               np.zeros(1, '<f4').tobytes(),
+               np.zeros(1, '<f4').tobytes(),
+               np.asarray(sz, '<f4').tobytes(),
+               np.asarray(rz, '<f4').tobytes(),
+               np.asarray(rr, '<f4').tobytes()]
+    records += [row.tobytes() for row in pressure.reshape(-1, nrr)]
+    with open(path, 'wb') as f:
+        for record in records:
+            f.write(record.ljust(4 * recl, b'\0'))
+    return str(path)
+
+
+@pytest.fixture
+def make_shd():
+    return write_shd
+
+
+# Fortran list-directed read of n values starting at line i, the way BELLHOP reads the .env: the values may
+# span lines and a '/' ends the read. Returns (values, next line). Short lists are filled in evenly like BELLHOP.
+def read_list(lines, i, n):
+    values = []
+    while len(values) < n and i < len(lines):
+        text = lines[i].split("!")[0]
+        i += 1
+        slash = "/" in text
+        values += [float(v) for v in text.split("/")[0].replace(",", " ").split()]
+        if slash:
+            break
+    if 2 <= len(values) < n:
+        values = list(np.linspace(values[0], values[-1], n))
+    return values[:n], i
+
+
+# Source depths, receiver depths and ranges (km) as BELLHOP reads them from the .env
+def read_env_grid(path):
+    with open(path) as f:
+        lines = f.read().splitlines()
+    i = next(k for k, line in enumerate(lines) if "! NSD" in line)
+    grid = []
+    for _ in range(3):
+        (n,), i = read_list(lines, i, 1)
+        values, i = read_list(lines, i, int(n))
+        grid.append(values)
+    return grid
+
+
+@pytest.fixture
+def env_grid():
+    return read_env_grid
+
+
+FAKE_BELLHOP = """#!{python}
+import sys
+sys.path.insert(0, {tests!r})
+sys.path.insert(0, {root!r})
+import numpy as np
+from conftest import write_shd, read_env_grid
+with open(sys.argv[2] + ".env") as f:
+    title, freq = f.read().splitlines()[:2]
+freq = float(freq.split()[0])
+if freq == {fail}:
+    sys.exit(1)
+sd, rd, rr = read_env_grid(sys.argv[2] + ".env")
+r = 1000 * np.array(rr)
+# Pressure encodes the depths it was computed at (sz + 1j rz at r = 0); its level grows with frequency
+depths = np.array(sd)[:, None, None] + 1j * np.array(rd)[None, :, None]
+p = depths * np.exp(1j * freq * r / 1500) * (1 + freq / 1000) / np.maximum(r, 1.0)
+write_shd(sys.argv[2] + ".shd", p[None, None], [freq], sd, rd, r, title=title.split("!")[0].strip().strip("'"))
+"""
+
+
+# Stand-in BELLHOP writing a .shd on the .env grid (see FAKE_BELLHOP); the run at fail (Hz) exits with an error
+@pytest.fixture
+def make_bellhop(tmp_path):
+    def make(fail=-1.0):
+        tests = os.path.dirname(os.path.abspath(__file__))
+        exe = tmp_path / "bellhop"
+        exe.write_text(FAKE_BELLHOP.format(python=sys.executable, tests=tests, root=os.path.dirname(tests), fail=fail))
+        exe.chmod(exe.stat().st_mode | stat.S_IEXEC)
+        return str(exe)
+    return make
+
+
+# Small iso-depth Write_TL configuration with the given source/receiver grid
+def tl_config(directory, filename, nsd, sd, nrd, rd, freq=100.0):
+    return Write_TL(dir=directory, filename=filename, ssp_depths=np.array([0.0, 100.0]), ssp=np.array([1500.0, 1510.0]),
+                    bath_ranges=np.array([0.0, 5.0]), bath_depths=np.array([100.0, 100.0]), freq=freq, nmedia=1,
+                    sspopt=["C", "V", "F", " ", " "], bottom_type=["A", " "], roughness=0.0,
+                    bottom_opt=[100.0, 1600.0, 0.0, 1.8, 0.0], nsd=nsd, sd=sd, nrd=nrd, rd=rd, nrr=3, rr=[0.0, 5.0],
+                    ray_compute=["C", "G", " ", " ", " "], num_beams=101, launch_angles=[-20.0, 20.0],
+                    step_size=0.0, max_depth=101.0, max_range=5.1)
+
+
+@pytest.fixture
+def make_config():
+    return tl_config
@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+from Justin_Work.arrivals import Read_ARR
+
+# Two source depths, one receiver depth, two ranges; the rr axis wraps onto a second line
+ARR = """'2D'
+  3500.0
+ 2  20.0 40.0
+ 1  50.0
+ 2  1000.0
+ 2000.0
+  2
+  1
+  0.5  90.0  0.67  0  10.0  -10.0  0  1
+  0
+  2
+  2
+  0.25  180.0  1.34  0  -5.0  5.0  1  0
+  0.125  270.0  1.35  0  6.0  -6.0  1  1
+  0
+"""
+
+
+def test_read_arr_file(tmp_path):
+    (tmp_path / "test.arr").write_text(ARR)
+    reader = Read_ARR(str(tmp_path) + "/", "test")
+    arrivals, offsets = reader.read_arr_file()
+    assert reader.freq == 3500.0
+    assert np.allclose(reader.rr, [1000.0, 2000.0])
+    assert offsets[:, 0, :, 1].tolist() == [[1, 1], [3, 3]]
+    start, stop = offsets[1, 0, 0]
+    assert np.allclose(arrivals["amplitude"][start:stop], [0.25, 0.125])
+    assert arrivals["n_top"].tolist() == [0, 1, 1]
+    assert arrivals["isz"].tolist() == [0, 1, 1]
+
+    (tmp_path / "short.arr").write_text(ARR.replace("  0.125  270.0  1.35  0  6.0  -6.0  1  1\n", ""))
+    with pytest.raises(ValueError):
+        reader.read_arr_file(str(tmp_path / "short.arr"))
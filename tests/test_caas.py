@@ -0,0 +1,36 @@
+import os
+
+import numpy as np
+import pytest
+
+from Justin_Work.caas import FEET_TO_METERS, Array_RUN, read_caas_log
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "Justin_Work", "Data")
+
+
+def test_read_caas_log():
+    log = read_caas_log(os.path.join(DATA_DIR, "CAAS_log_file_01_24_2020.txt"))
+    assert log["start"] == "20200124, 05:39:57"
+    assert log["n_channels"] == 16
+    assert log["sample_rate"] == 651e3
+    assert log["prologue"]["Planned Latitude"] == "47.592143"
+    assert len(log["channels"]) == 8
+
+    first = log["channels"][0]
+    assert first["channel"] == "A:3"
+    assert first["sample_factor"] == "Full (651.0)"
+    assert first["gain"] == 12.0
+    assert first["depth"] == pytest.approx(257.88785 * FEET_TO_METERS)
+    assert len(log["log"]) == 1
+
+
+def test_split_refuses_missing_channel_depths(tmp_path, make_shd):
+    pressure = np.arange(2 * 3, dtype=np.complex64).reshape(1, 1, 1, 2, 3)
+    output = make_shd(tmp_path / "array.shd", pressure, [10500.0], [20.0], [49.6, 78.6], np.arange(3.0))
+
+    split = Array_RUN(None, {"A:11": 49.648, "A:3": 78.604}, None).split(output)
+    np.testing.assert_array_equal(split["A:3"], pressure[0, 0, 0, 1])
+    np.testing.assert_array_equal(split["A:11"], pressure[0, 0, 0, 0])
+
+    with pytest.raises(ValueError):
+        Array_RUN(None, {"A:7": 66.412}, None).split(output)
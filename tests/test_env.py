@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+
+from Justin_Work.packing import Run_Planner
+from Justin_Work.shd import depth_indices
+
+
+def test_env_round_trip(tmp_path, make_config, env_grid):
+    tl = make_config(str(tmp_path), "multi", 3, [10.0, 25.0, 40.0], 4, [5.0, 20.0, 55.5, 90.0])
+    tl.write_env()
+    sd, rd, rr = env_grid(str(tmp_path / "multi.env"))
+    assert sd == [10.0, 25.0, 40.0]
+    assert rd == [5.0, 20.0, 55.5, 90.0]
+    assert rr == [0.0, 2.5, 5.0]
+
+
+def test_packed_results(tmp_path, make_config, make_bellhop):
+    jobs = [make_config(str(tmp_path), "a", 1, [10.0], 3, [0.0, 100.0]),
+            make_config(str(tmp_path), "b", 2, [25.0, 40.0], 2, [50.0, 75.0]),
+            make_config(str(tmp_path), "c", 1, [10.0], 1, [30.0], freq=200.0)]
+    planner = Run_Planner(jobs, make_bellhop(), str(tmp_path / "work"), processes=1)
+    assert len(planner.groups) == 2
+    planner.run()
+    for job, result in zip(jobs, planner.results()):
+        assert result["pressure"].shape == (len(result["sz"]), len(result["rz"]), 3)
+        expected = (result["sz"][:, None] + 1j * result["rz"][None, :]) * (1 + job.freq / 1000)
+        np.testing.assert_allclose(result["pressure"][:, :, 0], expected)
+    np.testing.assert_allclose(planner.results()[0]["rz"], [0.0, 50.0, 100.0])
+
+
+def test_depth_indices_refuse_missing_depths():
+    np.testing.assert_array_equal(depth_indices(np.float32([0.0, 50.0, 100.0]), [100.0, 0.0]), [2, 0])
+    with pytest.raises(ValueError):
+        depth_indices([0.0, 50.0, 100.0], [25.0])
@@ -0,0 +1,49 @@
+import numpy as np
+from types import SimpleNamespace
+
+from Justin_Work.raytrace import EIGENRAY_LAUNCHES, Trace_RAY
+
+
+# Isovelocity water over a flat 100 m bottom; source at 20 m, receiver at 50 m depth and 1 km range
+def config(**kwargs):
+    options = dict(ssp_depth=[0.0, 100.0], ssp=[1500.0, 1500.0], sspopt=["C", "V", "F", " ", " "],
+                   bottom_type=["A", " "], bottom_opt=[100.0, 1600.0, 0.0, 1.8, 0.0], bath_ranges=[0.0, 2.0],
+                   bath_depths=[100.0, 100.0], ati_depths=[0.0, 0.0], sd=[20.0], rd=[50.0], rr=[1.0],
+                   launch_angles=[-20.0, 20.0], num_beams=101, step_size=0.0, max_depth=101.0, max_range=1.2,
+                   ray_compute="E", freq=100.0, filename="test", dir=".")
+    options.update(kwargs)
+    return SimpleNamespace(**options)
+
+
+def test_automatic_step_and_stalled_rays():
+    tracer = Trace_RAY(config(launch_angles=[90.0, 90.0], num_beams=1))
+    assert tracer.step_size == 10.0
+    r, z, offsets, alphas = tracer.trace()
+    assert np.all(np.diff(offsets) < 50)
+
+
+def test_find_eigenrays_image_paths():
+    tracer = Trace_RAY(config())
+    eigen = tracer.find_eigenrays()
+    # Direct, surface-reflected and bottom-reflected paths from the image sources
+    expected = np.degrees(np.arctan(np.array([30.0, -70.0, 130.0]) / 1000))
+    for alpha in expected:
+        assert np.min(np.abs(eigen["alpha"] - alpha)) < 0.01
+    assert np.all(np.diff(np.sort(eigen["alpha"])) > 1e-3)
+    assert eigen["rays_traced"] <= EIGENRAY_LAUNCHES * 201
+
+    capped = Trace_RAY(config()).find_eigenrays(max_launches=300)
+    assert capped["rays_traced"] <= 300
+
+
+def test_eigenrays_stop_at_their_receiver_range():
+    tracer = Trace_RAY(config())
+    alphas = np.array([-5.0, 0.0, 5.0])
+    shared, _ = tracer.depth_at_ranges(alphas, [500.0, 1000.0])
+    own, _ = tracer.depth_at_ranges(alphas, [[500.0], [1000.0], [500.0]])
+    assert np.allclose(own[:, 0], shared[[0, 1, 2], [0, 1, 0]])
+
+    eigen = tracer.find_eigenrays(receiver_ranges=[0.5, 1.0])
+    near = eigen["alpha"][eigen["receiver_range"] == 0]
+    for alpha in np.degrees(np.arctan(np.array([30.0, -70.0, 130.0]) / 500)):
+        assert np.min(np.abs(near - alpha)) < 0.01
@@ -0,0 +1,66 @@
+import os
+import time
+
+from Justin_Work.run_cache import Run_Cache
+from Justin_Work.shd import Read_SHD
+from Justin_Work.sweep import Sweep_TL, run_bellhop
+
+
+def config(make_config, directory, filename, freq):
+    return make_config(str(directory), filename, 1, [20.0], 2, [0.0, 90.0], freq=freq)
+
+
+def test_key_ignores_title(tmp_path, make_config, make_bellhop):
+    exe = make_bellhop()
+    cache = Run_Cache(str(tmp_path / "cache"))
+    a, b = config(make_config, tmp_path, "a", 100.0), config(make_config, tmp_path, "b", 100.0)
+    a.write_files()
+    b.write_files()
+    assert cache.key(a, exe) == cache.key(b, exe)
+    c = config(make_config, tmp_path, "c", 200.0)
+    c.write_files()
+    assert cache.key(a, exe) != cache.key(c, exe)
+
+
+def test_store_and_fetch(tmp_path, make_config, make_bellhop):
+    exe = make_bellhop()
+    cache = Run_Cache(str(tmp_path / "cache"))
+    status = run_bellhop(config(make_config, tmp_path / "a", "a", 100.0), exe, cache=cache)
+    assert status["status"] == "ok" and status["cache"] == "miss"
+
+    status = run_bellhop(config(make_config, tmp_path / "b", "b", 100.0), exe, cache=cache)
+    assert status["status"] == "cached" and status["cache"] == "hit"
+    shd = Read_SHD(status["output"])
+    assert shd.freqs.tolist() == [100.0]
+    assert shd.title == "b"
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_store_skips_stale_output(tmp_path, make_config, make_bellhop):
+    exe = make_bellhop()
+    cache = Run_Cache(str(tmp_path / "cache"))
+    stale = config(make_config, tmp_path, "a", 100.0)
+    stale.write_files()
+    base_path = os.path.join(stale.dir, stale.filename)
+    with open(base_path + ".shd", 'w') as f:
+        f.write("stale")
+    old = time.time() - 3600
+    os.utime(base_path + ".shd", (old, old))
+
+    key = cache.key(stale, exe)
+    cache.store(key, base_path, since=time.time())
+    assert cache.stats()["entries"] == 0
+    cache.store(key, base_path)
+    assert cache.stats()["entries"] == 1
+
+
+def test_sweep_counts_worker_lookups(tmp_path, make_config, make_bellhop):
+    exe = make_bellhop()
+    cache = Run_Cache(str(tmp_path / "cache"))
+    base = config(make_config, tmp_path, "sweep", 100.0)
+    Sweep_TL(base, [100.0, 200.0], exe, processes=2, cache=cache).run()
+    Sweep_TL(base, [100.0, 200.0, 300.0], exe, processes=2, cache=cache).run()
+    stats = cache.stats()
+    assert stats["hits"] == 2
+    assert stats["misses"] == 3
+    assert stats["entries"] == 3
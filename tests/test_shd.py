@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+from Justin_Work.shd import Read_SHD, Read_SWEEP, write_sweep_store
+from Justin_Work.tl import Read_TL
+
+
+def field(freq, nsz=2, nrz=3, nrr=5):
+    rng = np.random.default_rng(int(freq))
+    return (rng.standard_normal((1, 1, nsz, nrz, nrr))
+            + 1j * rng.standard_normal((1, 1, nsz, nrz, nrr))).astype(np.complex64)
+
+
+def test_shd_round_trip(tmp_path, make_shd):
+    pressure = field(3500.0)
+    path = make_shd(tmp_path / "run.shd", pressure, [3500.0], [10.0, 20.0], [0.0, 50.0, 100.0],
+                    np.linspace(0, 4000, 5))
+    shd = Read_SHD(path)
+    assert (shd.nfreq, shd.nsz, shd.nrz, shd.nrr) == (1, 2, 3, 5)
+    np.testing.assert_allclose(shd.rz, [0.0, 50.0, 100.0])
+    np.testing.assert_array_equal(shd.pressure, pressure)
+    np.testing.assert_array_equal(shd.depth_row(1, isz=1), pressure[0, 0, 1, 1])
+    np.testing.assert_array_equal(shd.range_column(4), pressure[0, 0, 0, :, 4])
+
+
+def test_truncated_shd_raises(tmp_path, make_shd):
+    path = make_shd(tmp_path / "run.shd", field(100.0), [100.0], [10.0, 20.0], [0.0, 50.0, 100.0], np.arange(5.0))
+    with open(path, 'r+b') as f:
+        f.truncate(f.seek(0, 2) - 8)
+    with pytest.raises(ValueError):
+        Read_SHD(path)
+
+
+# More frequencies than the old fixed 4096-byte header could describe
+def test_sweep_store_round_trip(tmp_path, make_shd):
+    freqs = 1000.0 + 10.0 * np.arange(600)
+    manifest = {f: make_shd(tmp_path / f"run_{int(f)}.shd", field(f), [f], [10.0, 20.0], [0.0, 50.0, 100.0],
+                            np.arange(5.0))
+                for f in freqs}
+    write_sweep_store(str(tmp_path / "run.sweep"), manifest)
+    store = Read_SWEEP(str(tmp_path / "run.sweep"))
+
+    np.testing.assert_array_equal(store.freqs, freqs)
+    np.testing.assert_allclose(store.rz, [0.0, 50.0, 100.0])
+    for k in (0, 299, 599):
+        np.testing.assert_array_equal(store.field(freqs[k]), field(freqs[k])[0, 0])
+    spectrum = np.array([field(f)[0, 0, 1, 2, 3] for f in freqs])
+    np.testing.assert_array_equal(store.receiver(2, 3, isz=1), spectrum)
+
+    with pytest.raises(KeyError):
+        store.freq_index(1005.0)
+
+
+def test_read_tl_falls_back_to_shd_for_missing_freqs(tmp_path, make_shd):
+    directory = str(tmp_path) + "/"
+    stored = {f: make_shd(tmp_path / f"part_{int(f)}.shd", field(f), [f], [10.0, 20.0], [0.0, 50.0, 100.0],
+                          np.arange(5.0))
+              for f in (2000.0, 2100.0)}
+    write_sweep_store(directory + "arms.sweep", stored)
+    make_shd(tmp_path / "arms_2200.shd", field(2200.0), [2200.0], [10.0, 20.0], [0.0, 50.0, 100.0], np.arange(5.0))
+
+    reader = Read_TL(directory, directory, "arms", [2000.0, 2100.0, 2200.0], None)
+    assert reader.shd_path(2100.0).endswith("arms.sweep")
+    assert reader.shd_path(2200.0).endswith("arms_2200.shd")
+    np.testing.assert_array_equal(reader.read_shd(2200.0)[0], field(2200.0)[0, 0])
+    np.testing.assert_array_equal(reader.read_shd(2100.0)[0], field(2100.0)[0, 0])
+
+
+# A cell that is silent at one frequency keeps the statistics of the frequencies it is heard at
+def test_broadband_tl_skips_silent_cells(tmp_path, make_shd):
+    directory = str(tmp_path) + "/"
+    levels = {1000.0: 0.1, 1100.0: 0.01, 1200.0: 0.001}
+    for freq, amplitude in levels.items():
+        pressure = np.full((1, 1, 1, 2, 3), amplitude, dtype=np.complex64)
+        if freq == 1100.0:
+            pressure[..., 0, 0] = 0
+        make_shd(tmp_path / f"arms_{int(freq)}.shd", pressure, [freq], [10.0], [0.0, 50.0], np.arange(3.0))
+
+    result = Read_TL(directory, directory, "arms", list(levels), None).broadband_tl()
+    np.testing.assert_allclose(result["variance"][0, 0], 400.0, rtol=1e-4)
+    np.testing.assert_allclose(result["max"][0, 0], 60.0, rtol=1e-5)
+    np.testing.assert_allclose(result["min"][0, 0], 20.0, rtol=1e-5)
+    np.testing.assert_allclose(result["variance"][1, 1], 800.0 / 3, rtol=1e-4)
+    # Incoherent: mean power (1e-2 + 1e-4 + 1e-6) / 3; coherent: mean amplitude (0.1 + 0.01 + 0.001) / 3
+    np.testing.assert_allclose(result["incoherent"][1, 1], -10 * np.log10(0.010101 / 3), rtol=1e-4)
+    np.testing.assert_allclose(result["coherent"][1, 1], -20 * np.log10(0.111 / 3), rtol=1e-4)
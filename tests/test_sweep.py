@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+
+from Justin_Work.sweep import Adaptive_Sweep_TL
+
+
+@pytest.fixture
+def base(tmp_path, make_config):
+    return make_config(str(tmp_path), "arms", 1, [20.0], 4, [0.0, 90.0])
+
+
+def test_first_round_is_capped_at_the_budget(tmp_path, base, make_bellhop):
+    sweep = Adaptive_Sweep_TL(base, 1000.0, 9000.0, make_bellhop(), n_initial=9, budget=4,
+                              block=(2, 1), work_dir=str(tmp_path / "work"), processes=1)
+    assert len(sweep.freqs) == 4
+    assert sweep.freqs[0] == 1000.0 and sweep.freqs[-1] == 9000.0
+    sweep.run()
+    assert len(sweep.jobs) == 4
+
+
+def test_failed_frequencies_are_reported_and_not_bridged(tmp_path, base, make_bellhop):
+    sweep = Adaptive_Sweep_TL(base, 1000.0, 9000.0, make_bellhop(fail=5000.0), n_initial=9,
+                              tolerance=1e6, block=(2, 1), work_dir=str(tmp_path / "work"), processes=1)
+    sweep.run()
+    np.testing.assert_array_equal(sweep.failed, [5000.0])
+    assert 5000.0 not in sweep.manifest
+
+    error = sweep.interpolation_error()
+    gap = (error["freqs"][:-1] == 4000.0)
+    assert np.isnan(error["difference"][gap]).all() and np.isnan(error["error"][gap]).all()
+    assert np.isfinite(error["difference"][~gap]).all()
+    with pytest.raises(ValueError):
+        sweep.interpolated_tl(5000.0)
+    sweep.interpolated_tl(2500.0)